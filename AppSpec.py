@@ -11,4 +11,4 @@ class AppSpec:
         self.returnVal = 0
 
     def doTest(self, gsp):
-        print("Testing definition - put whatever you want here")
\ No newline at end of file
+        gsp.emit("Testing definition - put whatever you want here")
\ No newline at end of file
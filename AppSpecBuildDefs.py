@@ -5,6 +5,10 @@
                   definitions defined in the APPSPEC vocabulary. 
 '''
 
-from CreoleForth import cfb1
+from CreoleForth import cfb1, gsp
 
-cfb1.buildPrimitive("TEST", cfb1.Modules.AppSpec.doTest, "AppSpec.doTest", "APPSPEC", "COMPINPF","( -- ) Testing definition - put whatever you want here")
+# Builds the APPSPEC definitions into an interpreter. Pass it to createInterpreter to get them in a new one.
+def buildAppSpecDefs(cfb, gsp):
+    cfb.buildPrimitive("TEST", cfb.Modules.AppSpec.doTest, "AppSpec.doTest", "APPSPEC", "COMPINPF","( -- ) Testing definition - put whatever you want here")
+
+buildAppSpecDefs(cfb1, gsp)
@@ -7,25 +7,200 @@
                   and Creole Forth for JavaScript
 '''
 
+import array
+import asyncio
 import datetime
+import hashlib
+import inspect
+import json
 import math
+import os
 import re
+import sys
+import time
+
+# numpy is optional - it's only needed for vectors
+try:
+    import numpy
+    VectorType = numpy.ndarray
+except ImportError:
+    numpy = None
+    VectorType = None
 # from pymsgbox import *
-import copy
 
 class Modules:
-    def __init__(self, coreprims, interpreter, compiler, logicops, appspec):
+    def __init__(self, coreprims, interpreter, compiler, logicops, optimizer, vectorops, numericops, appspec):
         self.CorePrims = coreprims
         self.Interpreter = interpreter
         self.Compiler = compiler
         self.LogicOps = logicops
+        self.Optimizer = optimizer
+        self.VectorOps = vectorops
+        self.NumericOps = numericops
         self.AppSpec = appspec
 
+# The vocabulary stack. It's a list whose Version goes up whenever it's changed, so findWord can tell the search order
+# has changed without comparing the vocabularies.
+class VocabStackList(list):
+    __slots__ = ("Version",)
+
+    def __init__(self, vocabs=()):
+        list.__init__(self, vocabs)
+        self.Version = 0
+
+    def append(self, vocab):
+        list.append(self, vocab)
+        self.Version += 1
+
+    def insert(self, index, vocab):
+        list.insert(self, index, vocab)
+        self.Version += 1
+
+    def extend(self, vocabs):
+        list.extend(self, vocabs)
+        self.Version += 1
+
+    def pop(self, index=-1):
+        self.Version += 1
+        return list.pop(self, index)
+
+    def remove(self, vocab):
+        list.remove(self, vocab)
+        self.Version += 1
+
+    def clear(self):
+        list.clear(self)
+        self.Version += 1
+
+    def __setitem__(self, index, vocab):
+        list.__setitem__(self, index, vocab)
+        self.Version += 1
+
+    def __delitem__(self, index):
+        list.__delitem__(self, index)
+        self.Version += 1
+
+    def __iadd__(self, vocabs):
+        self.extend(vocabs)
+        return self
+
+# The dictionary's name index: a table for each vocabulary mapping the names of its words to their entries, so finding
+# a word is one probe per vocabulary on the search order with no key to build. For compatibility it can still be used
+# like a dict keyed by fully qualified name ("DUP.FORTH"), which is split at its last dot - a smudged definition
+# ("NAME.FORTH.SMUDGED") is kept in the SMUDGED table under NAME.FORTH.
+class Dictionary:
+    def __init__(self):
+        self.Vocabs = {}
+        self.SearchTables = {}
+
+    # The table for a vocabulary, made if it isn't there yet. Tables are never replaced, so a search order can keep
+    # references to them.
+    def vocabTable(self, vocab):
+        table = self.Vocabs.get(vocab)
+        if (table == None):
+            table = {}
+            self.Vocabs[vocab] = table
+        return table
+
+    # The tables for a search order (a tuple of vocabularies, bottom first), top of the search order first
+    def searchTables(self, searchVocabs):
+        tables = self.SearchTables.get(searchVocabs)
+        if (tables == None):
+            tables = [self.vocabTable(vocab) for vocab in reversed(searchVocabs)]
+            self.SearchTables[searchVocabs] = tables
+        return tables
+
+    # Adds an entry to a vocabulary. A word that's redefined moves to the end, so the table stays oldest first.
+    def addWord(self, name, vocab, cw):
+        table = self.vocabTable(vocab)
+        table.pop(name, None)
+        table[name] = cw
+
+    # The entry for a word in a vocabulary, or None if it isn't there
+    def find(self, name, vocab):
+        try:
+            return self.Vocabs[vocab][name]
+        except KeyError:
+            return None
+
+    # The names of the words in a vocabulary, oldest first
+    def wordsIn(self, vocab):
+        return list(self.Vocabs.get(vocab, {}))
+
+    # A copy with copies of the tables, so entries can be added to it without changing this one
+    def copy(self):
+        newDictionary = Dictionary()
+        for vocab in self.Vocabs:
+            newDictionary.Vocabs[vocab] = dict(self.Vocabs[vocab])
+        return newDictionary
+
+    def splitName(self, fqName):
+        dotPos = fqName.rfind(".")
+        return fqName[:dotPos], fqName[dotPos + 1:]
+
+    def __getitem__(self, fqName):
+        name, vocab = self.splitName(fqName)
+        cw = self.find(name, vocab)
+        if (cw == None):
+            raise KeyError(fqName)
+        return cw
+
+    def __setitem__(self, fqName, cw):
+        name, vocab = self.splitName(fqName)
+        self.addWord(name, vocab, cw)
+
+    def __contains__(self, fqName):
+        name, vocab = self.splitName(fqName)
+        return self.find(name, vocab) != None
+
+    def get(self, fqName, default=None):
+        name, vocab = self.splitName(fqName)
+        cw = self.find(name, vocab)
+        if (cw == None):
+            return default
+        return cw
+
+    def pop(self, fqName):
+        name, vocab = self.splitName(fqName)
+        return self.Vocabs[vocab].pop(name)
+
+    def __len__(self):
+        return sum([len(table) for table in self.Vocabs.values()])
+
+    def __iter__(self):
+        for vocab in self.Vocabs:
+            for name in self.Vocabs[vocab]:
+                yield name + "." + vocab
+
 class CreoleForthBundle:
     def __init__(self):
         self.Modules = None
         self.Address = []
-        self.Dict = {}
+        self.Dict = Dictionary()
+        # Resolved words, one table per vocabulary stack state: (vocab, vocab, ...) -> { raw token -> CreoleWord or None }
+        self.LookupCache = {}
+        # The core entries this interpreter shares with the others (see createInterpreter). An entry still in it is
+        # copied by ownWord before it's changed.
+        self.SharedAddress = []
+
+    # The entry at address, ready to be changed. If it's still shared with other interpreters, it's replaced by a copy
+    # of its own first, in both Address and Dict, so they don't see the change.
+    def ownWord(self, address):
+        cw = self.Address[address]
+        if (address < len(self.SharedAddress) and cw is self.SharedAddress[address]):
+            sharedWord = cw
+            cw = sharedWord.copy()
+            self.Address[address] = cw
+            name, vocab = self.Dict.splitName(sharedWord.fqNameField)
+            if (self.Dict.find(name, vocab) is sharedWord):
+                self.Dict.vocabTable(vocab)[name] = cw
+            self.clearLookupCache()
+        return cw
+
+    # Empties the resolved-word tables. Needs to be called whenever an entry is added to or changed in Dict.
+    def clearLookupCache(self):
+        for searchCache in self.LookupCache.values():
+            searchCache.clear()
 
 class BasicForthConstants:
     def __init__(self):
@@ -35,59 +210,281 @@ class BasicForthConstants:
         self.PostfilterVocab = "POSTFILTER"
         self.ExecZeroAction = "EXEC0"
         self.CompLitAction = "COMPLIT"
+        self.NoCompAction = "NOP"
+        # Run-time words followed by an operand cell in a parameter field - a literal value or a branch target
+        self.LiteralWords = ("doLiteral.IMMEDIATE", "doLitPlus.IMMEDIATE")
+        self.BranchWords = ("0BRANCH.IMMEDIATE", "JUMP.IMMEDIATE", "doLoop.IMMEDIATE", "doPlusLoop.IMMEDIATE",
+                            "doEquals0Branch.IMMEDIATE", "doStartQDo.IMMEDIATE", "doLeave.IMMEDIATE")
+        # Side-effect-free words that constant folding can run at compile time, with how many stack arguments they take
+        self.FoldableWords = {"+.FORTH": 2, "-.FORTH": 2, "*.FORTH": 2, "/.FORTH": 2, "%.FORTH": 2,
+                              "MOD.FORTH": 2, "/MOD.FORTH": 2, "*/.FORTH": 3, "*/MOD.FORTH": 3,
+                              "=.FORTH": 2, "<>.FORTH": 2, "<.FORTH": 2, ">.FORTH": 2, "<=.FORTH": 2, ">=.FORTH": 2,
+                              "NOT.FORTH": 1, "AND.FORTH": 2, "OR.FORTH": 2, "XOR.FORTH": 2,
+                              "DUP.FORTH": 1, "SWAP.FORTH": 2, "ROT.FORTH": 3, "-ROT.FORTH": 3, "NIP.FORTH": 2,
+                              "TUCK.FORTH": 2, "OVER.FORTH": 2, "DROP.FORTH": 1}
+        self.LookupCacheSize = 4096
+        # Nested calls the frame arrays have room for to begin with, and the most they can grow to
+        self.FrameStackSize = 32
+        self.MaxFrameDepth = 1000000
+        # Words the async interpreter runs before letting other tasks have a turn
+        self.AsyncSliceWords = 1000
+        # Cells in a numeric data stack (see GlobalSimpleProps.useNumericStack)
+        self.NumericStackSize = 65536
 
 
 class GlobalSimpleProps:
     def __init__(self, cfb):
-        self.cfb = CreoleForthBundle() 
+        self.cfb = cfb
         self.CurrWord = None
         self.Scratch = None
         self.DataStack = []
         self.ReturnStack = []
-        self.VocabStack = []
+        self.VocabStack = VocabStackList()
         self.PrefilterStack = []
         self.PostfilterStack = []
         self.PADarea = []
         self.ParsedInput = []
-        self.loopLabels = ["I", "J", "K"]
-        self.LoopLabelPtr = 0
-        self.LoopCurrIndexes = [0, 0, 0]
+        # Loop frames for DO loops, innermost last: the current index and the limit of each loop that's running
+        self.LoopIndexes = []
+        self.LoopLimits = []
+        # While a colon definition is compiled, the cells LEAVE and ?DO need patched with the end of each DO loop
+        self.LeaveStack = []
         self.ParsedInputPtr = 0
+        # In streaming mode, tokens come from this generator (see Interpreter.doTokenize) instead of ParsedInput
+        self.TokenStream = None
         self.ExecPtr = 0
         self.ParamFieldPtr = 0
         self.InputArea = ""
-        self.OutputAra = ""
+        self.OutputArea = ""
+        # Where everything the interpreter prints goes - a StdoutSink, CaptureSink or CallbackSink
+        self.Output = StdoutSink()
         self.CurrentVocab = ""
         self.HelpCommentField = ""
         self.SoundField = ""
         self.CompiledList = ""
         self.BFC = BasicForthConstants()
         self.MinArgsSwitch = True  # Not sure this is needed
+        # Set by awaitLater under doOuterAsync: pause says the run is waiting, and onContinue holds the awaitables to
+        # await, oldest first, before it carries on
         self.pause= False
-        self.onContinue = None
+        self.onContinue = []
+        self.AsyncMode = False
+        # The RunLimits of a run started by Interpreter.doOuterLimited, None when nothing is limited
+        self.Limits = None
+        # Colon definitions are turned into direct-threaded closures when they're compiled. Switch off to
+        # fall back to doColon for every definition.
+        self.DirectThreading = True
+        # Colon definitions are run through the peephole optimizer when they're compiled
+        self.PeepholeOptimize = True
+        # Runs of literals and side-effect-free words are worked out when a colon definition is compiled
+        self.ConstantFold = True
+        # Calls to colon definitions of up to InlineThreshold cells (or ones flagged with INLINE) are replaced by a copy
+        # of their parameter field when the caller is compiled
+        self.Inlining = True
+        self.InlineThreshold = 8
+        # Frame arrays shared by the inner interpreters (doColon and runInner), which keep nested calls here instead
+        # of recursing in Python. FrameDepth is the next free slot. FramePtrs holds the caller's parameter field or
+        # instruction pointer and FrameLocs a ReturnLoc reused for every primitive the word in that slot calls.
+        self.FrameWords = [None] * self.BFC.FrameStackSize
+        self.FramePtrs = [0] * self.BFC.FrameStackSize
+        self.FrameLocs = [ReturnLoc(None, 0) for i in range(self.BFC.FrameStackSize)]
+        self.FrameDepth = 0
+        # Resolved-word table for the current vocabulary stack, and the vocabulary stack and its Version it was built for
+        self.SearchCache = {}
+        self.SearchStack = None
+        self.SearchVersion = -1
+        # The dictionary's vocabulary tables in search order (top of the vocabulary stack first)
+        self.SearchTables = []
+        # The Profiler recording word timings while profiling is on (None when it's off), and the last one used
+        self.Profiler = None
+        self.ProfileData = None
+        # Source strings run by evaluate and the words they were parsed into
+        self.ParseCache = {}
 	
     def push(self, Stack):	
         Stack.append(self.Scratch)
 	
     def pop(self, Stack):
         if len(Stack) == 0:
-            print("Error: Stack Underflow")
+            self.emit("Error: Stack Underflow")
             return -1
         else:
             self.Scratch = Stack.pop()
         return 0
 
+    # Doubles the room in the frame arrays, in place so the inner interpreters' references to them stay good. Raises
+    # OverflowError once the return stack would be deeper than BFC.MaxFrameDepth.
+    def growFrames(self):
+        size = len(self.FrameWords)
+        if (size >= self.BFC.MaxFrameDepth):
+            raise OverflowError("Error: Return stack overflow")
+        self.FrameWords.extend([None] * size)
+        self.FramePtrs.extend([0] * size)
+        self.FrameLocs.extend([ReturnLoc(None, 0) for i in range(size)])
+
+    # Puts the frame arrays back to BFC.FrameStackSize once growFrames has made them bigger, as after a runaway
+    # recursion, so they don't hold on to the memory. Left alone while anything is running, as the inner
+    # interpreters index into them.
+    def shrinkFrames(self):
+        size = self.BFC.FrameStackSize
+        if (self.FrameDepth == 0 and len(self.FrameWords) > size):
+            del self.FrameWords[size:]
+            del self.FramePtrs[size:]
+            del self.FrameLocs[size:]
+
+    # Embedding API: evaluate, call and callMany run code for a Python caller and return the data stack as a list.
+    # Only the stacks are reset between calls, so definitions, vocabularies and the resolved-word cache carry over
+    # from one call to the next.
+
+    # Empties the data, return and loop stacks, then puts vals on the data stack
+    def resetStacks(self, vals):
+        if (type(self.DataStack) == NumericStack):
+            self.DataStack.clear()
+            self.DataStack.extend(vals)
+        else:
+            self.DataStack = list(vals)
+        if (len(self.ReturnStack) > 0):
+            self.ReturnStack = []
+        self.LoopIndexes.clear()
+        self.LoopLimits.clear()
+
+    # The data stack as a list for the caller. The list stack is a new one for each call, so it's handed over as it is.
+    def stackList(self):
+        if (type(self.DataStack) == NumericStack):
+            return self.DataStack.tolist()
+        return self.DataStack
+
+    # Runs source through the outer interpreter with the values in stack on the data stack to begin with, and returns
+    # the data stack. Errors are printed as they are for a script. A source string that's been evaluated before
+    # isn't parsed again.
+    def evaluate(self, source, stack=()):
+        parsedInput = self.ParseCache.get(source)
+        if (parsedInput == None):
+            self.InputArea = source
+            self.cfb.Modules.Interpreter.doParseInput(self)
+            if (len(self.ParseCache) >= self.BFC.LookupCacheSize):
+                self.ParseCache.clear()
+            self.ParseCache[source] = self.ParsedInput
+        else:
+            self.ParsedInput = parsedInput
+        self.resetStacks(stack)
+        self.cfb.Modules.Interpreter.doOuter(self)
+        return self.stackList()
+
+    # Looks a word up for call and callMany. Raises ValueError if there's no such word.
+    def findCallWord(self, wordName):
+        cw = self.cfb.Modules.Interpreter.findWord(self, wordName)
+        if (cw == None):
+            raise ValueError("Error: " + wordName + " isn't in the dictionary")
+        return cw
+
+    # Runs a word with args on the data stack and returns the data stack. Nothing is parsed or looked up beyond the
+    # (cached) word itself, and errors are raised to the caller rather than printed.
+    def call(self, wordName, *args):
+        cw = self.findCallWord(wordName)
+        self.resetStacks(args)
+        self.CurrWord = cw
+        try:
+            if (self.Profiler == None):
+                cw.CodeField(self)
+            else:
+                self.Profiler.callWord(self, cw, cw.CodeField)
+        except BaseException:
+            self.shrinkFrames()
+            raise
+        finally:
+            self.Output.flush()
+        return self.stackList()
+
+    # Runs a word once for each row of args and returns a list of the data stacks it left. The word is looked up
+    # and the set-up done once for the whole batch.
+    def callMany(self, wordName, rows):
+        if (type(self.DataStack) == NumericStack or self.Profiler != None):
+            return [self.call(wordName, *row) for row in rows]
+        cw = self.findCallWord(wordName)
+        codeField = cw.CodeField
+        results = []
+        self.resetStacks(())
+        try:
+            for row in rows:
+                self.DataStack = list(row)
+                self.CurrWord = cw
+                codeField(self)
+                results.append(self.DataStack)
+        except BaseException:
+            self.shrinkFrames()
+            raise
+        finally:
+            self.Output.flush()
+        return results
+
+    # Prints a value (as print() would) through the output sink
+    def emit(self, val):
+        self.Output.write(str(val) + "\n")
+
+    # Called by a primitive that has to wait on something, once it has taken its arguments off the stacks and left its
+    # results. Under doOuterAsync the awaitable goes on the onContinue queue and the run awaits it at the end of the
+    # word, so a word run as a single step (through EXECUTE, DOES> or the profiler) can queue several. Otherwise it's
+    # run to completion there and then, which can't be done from inside a running event loop - that raises an
+    # AsyncWordError.
+    def awaitLater(self, awaitable):
+        if (self.AsyncMode):
+            self.onContinue.append(awaitable)
+            self.pause = True
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(awaitInOrder([awaitable]))
+            return
+        closeAwaitables([awaitable])
+        wordName = self.CurrWord.NameField if self.CurrWord != None else "An async word"
+        raise AsyncWordError("Error: " + wordName + " can't wait inside a running event loop - run it with doOuterAsync")
+
+    # Throws away anything still queued by awaitLater, as when a run stops with an error
+    def dropPending(self):
+        closeAwaitables(self.onContinue)
+        self.onContinue = []
+        self.pause = False
+
+    # Switches the data stack to a NumericStack ("q" for 64-bit integers, "d" for floats) holding what's on the stack
+    # now, and puts the NUMERIC vocabulary's primitives, which work on the stack's array directly, into the search
+    # order just above FORTH. Definitions compiled from then on use them, so they only run on a numeric stack.
+    def useNumericStack(self, typeCode="q", size=None):
+        if (size == None):
+            size = self.BFC.NumericStackSize
+        numericStack = NumericStack(typeCode, size)
+        numericStack.extend(self.DataStack)
+        self.DataStack = numericStack
+        if ("NUMERIC" not in self.VocabStack):
+            if ("FORTH" in self.VocabStack):
+                self.VocabStack.insert(self.VocabStack.index("FORTH") + 1, "NUMERIC")
+            else:
+                self.VocabStack.append("NUMERIC")
+
+    # Goes back to the usual list data stack
+    def useListStack(self):
+        self.DataStack = list(self.DataStack)
+        if ("NUMERIC" in self.VocabStack):
+            self.VocabStack.remove("NUMERIC")
+
     def cleanFields(self):
         self.Scratch = None
         self.CurrWord = None
         self.ParamField = []
-        self.DataStack = []
+        if (type(self.DataStack) == NumericStack):
+            self.DataStack.clear()
+        else:
+            self.DataStack = []
         self.ReturnStack = []
         self.PADarea = []
         self.ParsedInput = []
-        self.LoopLabelPtr = 0
-        self.LoopCurrIndexes = [0, 0, 0]
+        # Cleared in place, as the inner interpreters keep references to them
+        self.LoopIndexes.clear()
+        self.LoopLimits.clear()
+        self.LeaveStack = []
         self.ParsedInputPtr = 0
+        self.TokenStream = None
         self.ExecPtr = 0
         self.ParamFieldPtr = 0
         self.InputArea = ""
@@ -95,29 +492,339 @@ class GlobalSimpleProps:
         self.HelpCommentField = ""
         self.SoundField = ""
         self.CompiledList = []
-        self.pause = None
+        self.dropPending()
+        self.shrinkFrames()
 	
+# Output sinks. Printing words write to gsp.Output through GlobalSimpleProps.emit. StdoutSink and CallbackSink
+# collect what's written and pass it on in bulk when they're flushed, which happens at the end of every run of the
+# outer interpreter or once BufferSize characters have built up. CaptureSink keeps everything for the caller to
+# collect with getvalue or takeOutput.
+class StdoutSink:
+    def __init__(self, bufferSize=65536):
+        self.Buffer = []
+        self.Size = 0
+        self.BufferSize = bufferSize
+
+    def write(self, text):
+        self.Buffer.append(text)
+        self.Size += len(text)
+        if (self.Size >= self.BufferSize):
+            self.flush()
+
+    def flush(self):
+        if (self.Size > 0):
+            text = "".join(self.Buffer)
+            self.Buffer = []
+            self.Size = 0
+            self.send(text)
+
+    # sys.stdout is looked up each time, so redirecting it still works
+    def send(self, text):
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+# Passes the output to a callback (called with a string) in chunks, as StdoutSink does with stdout
+class CallbackSink(StdoutSink):
+    def __init__(self, callback, bufferSize=65536):
+        StdoutSink.__init__(self, bufferSize)
+        self.Callback = callback
+
+    def send(self, text):
+        self.Callback(text)
+
+class CaptureSink:
+    def __init__(self):
+        self.Buffer = []
+
+    def write(self, text):
+        self.Buffer.append(text)
+
+    def flush(self):
+        pass
+
+    # Everything written so far
+    def getvalue(self):
+        return "".join(self.Buffer)
+
+    # Everything written since the last call, which is then cleared - the output of one run
+    def takeOutput(self):
+        text = "".join(self.Buffer)
+        self.Buffer = []
+        return text
+
 # These objects are to be stored on the return stack
 class ReturnLoc:
+    __slots__ = ("CurrWord", "ParamFieldAddr")
+
     def __init__(self, currWord, pfAddr):	
         self.CurrWord = currWord
         self.ParamFieldAddr = pfAddr
 
-class LoopInfo:
-    def __init__(self, label, index, limit):
-        self.Label = label
-        self.Index = index
+# Raised by a NumericStack, with a message saying what went wrong
+class StackUnderflowError(IndexError):
+    pass
+
+class StackOverflowError(OverflowError):
+    pass
+
+class StackTypeError(TypeError):
+    pass
+
+# Raised by GlobalSimpleProps.awaitLater when a word has to wait but the run can't (it isn't under doOuterAsync and an
+# event loop is already running)
+class AsyncWordError(RuntimeError):
+    pass
+
+# Awaits each of a list of awaitables in turn
+async def awaitInOrder(awaitables):
+    for awaitable in awaitables:
+        await awaitable
+
+# Closes coroutines that are never going to be awaited, so they don't warn about it
+def closeAwaitables(awaitables):
+    for awaitable in awaitables:
+        if (inspect.iscoroutine(awaitable)):
+            awaitable.close()
+
+# Raised by RunLimits when a run goes over one of its limits. Limit is the name of the limit.
+class RunLimitExceeded(Exception):
+    def __init__(self, limit, message):
+        Exception.__init__(self, message)
         self.Limit = limit
 
+# Limits for one run of the outer interpreter (see Interpreter.doOuterLimited), for scripts that can't be trusted to
+# finish. Limits left at None aren't checked. Words executed are counted down from CheckInterval and the clock and
+# stack depths are only looked at when the count runs out, so checking costs little. The inner interpreters count
+# threaded code at backward branches and calls, charging a loop's body each time round, so the word count (and
+# how far past a limit a run gets) is to within CheckInterval words. Dictionary growth is counted in cells: one for
+# each CREATE, ! and , and one per cell of a colon definition.
+class RunLimits:
+    def __init__(self, maxWords=None, maxSeconds=None, maxDataDepth=None, maxReturnDepth=None, maxDictGrowth=None,
+                 checkInterval=1000):
+        self.MaxWords = maxWords
+        self.MaxSeconds = maxSeconds
+        self.MaxDataDepth = maxDataDepth
+        self.MaxReturnDepth = maxReturnDepth
+        self.MaxDictGrowth = maxDictGrowth
+        self.CheckInterval = checkInterval
+        self.start()
+
+    # Resets the counts for a new run
+    def start(self):
+        self.WordsRun = 0
+        self.DictGrowth = 0
+        self.StepsLeft = self.CheckInterval
+        self.StartTime = time.perf_counter()
+
+    # Words executed so far, including the ones since the last check
+    def wordsExecuted(self):
+        return self.WordsRun + self.CheckInterval - self.StepsLeft
+
+    # Counts words executed and checks the limits when the count runs out
+    def spend(self, gsp, words):
+        self.StepsLeft -= words
+        if (self.StepsLeft <= 0):
+            self.check(gsp)
+
+    def check(self, gsp):
+        self.WordsRun = self.wordsExecuted()
+        self.StepsLeft = self.CheckInterval
+        if (self.MaxWords != None and self.WordsRun > self.MaxWords):
+            raise RunLimitExceeded("words", "Error: Word limit of " + str(self.MaxWords) + " reached")
+        if (self.MaxSeconds != None and time.perf_counter() - self.StartTime > self.MaxSeconds):
+            raise RunLimitExceeded("seconds", "Error: Time limit of " + str(self.MaxSeconds) + "s reached")
+        if (self.MaxDataDepth != None and len(gsp.DataStack) > self.MaxDataDepth):
+            raise RunLimitExceeded("dataDepth", "Error: Data stack limit of " + str(self.MaxDataDepth) + " reached")
+        if (self.MaxReturnDepth != None and gsp.FrameDepth + len(gsp.ReturnStack) > self.MaxReturnDepth):
+            raise RunLimitExceeded("returnDepth", "Error: Return stack limit of " + str(self.MaxReturnDepth) + " reached")
+
+    # Counts cells added to the dictionary
+    def growDictionary(self, cells):
+        self.DictGrowth += cells
+        if (self.MaxDictGrowth != None and self.DictGrowth > self.MaxDictGrowth):
+            raise RunLimitExceeded("dictGrowth", "Error: Dictionary growth limit of " + str(self.MaxDictGrowth) + " cells reached")
+
+# What doOuterLimited returns. Status is "ok" if the run finished, or "limit" if it was stopped, in which case Limit
+# says which limit it went over ("words", "seconds", "dataDepth", "returnDepth" or "dictGrowth") and Message what
+# would have been printed. DataStack is a copy of the data stack as the run left it, and Output what the run printed
+# if the output sink is a CaptureSink (None otherwise).
+class RunResult:
+    def __init__(self, status, limit, message, wordsExecuted, seconds, dataStack, output):
+        self.Status = status
+        self.Limit = limit
+        self.Message = message
+        self.WordsExecuted = wordsExecuted
+        self.Seconds = seconds
+        self.DataStack = dataStack
+        self.Output = output
+
+# A data stack for numeric-only work: a preallocated array of machine integers ("q") or floats ("d") and a stack
+# pointer, so pushing and popping allocate nothing and a deep stack takes 8 bytes a cell. It has the list methods
+# the primitives use, and the NUMERIC vocabulary's primitives work on Cells and Ptr directly.
+class NumericStack:
+    def __init__(self, typeCode, size):
+        self.Cells = array.array(typeCode, bytes(size * array.array(typeCode).itemsize))
+        self.Ptr = 0
+        self.Size = size
+
+    def underflow(self):
+        raise StackUnderflowError("Error: Data stack underflow")
+
+    def overflow(self):
+        raise StackOverflowError("Error: Data stack overflow (" + str(self.Size) + " cells)")
+
+    # For a value (or a result worked out by a NUMERIC primitive) that won't fit in an integer cell
+    def tooBig(self, val):
+        raise StackOverflowError("Error: " + str(val) + " is too big for an integer data stack")
+
+    def append(self, val):
+        ptr = self.Ptr
+        if (ptr >= self.Size):
+            self.overflow()
+        try:
+            self.Cells[ptr] = val
+        except TypeError:
+            kind = "an integer" if self.Cells.typecode == "q" else "a float"
+            raise StackTypeError("Error: " + repr(val) + " can't go on " + kind + " data stack") from None
+        except OverflowError:
+            self.tooBig(val)
+        self.Ptr = ptr + 1
+
+    def pop(self):
+        if (self.Ptr == 0):
+            self.underflow()
+        self.Ptr -= 1
+        return self.Cells[self.Ptr]
+
+    def extend(self, vals):
+        for val in vals:
+            self.append(val)
+
+    def clear(self):
+        self.Ptr = 0
+
+    def tolist(self):
+        return self.Cells[:self.Ptr].tolist()
+
+    def __len__(self):
+        return self.Ptr
+
+    # Indexes count from the bottom of the stack, or from the top if they're negative, as with a list
+    def cellIndex(self, index):
+        if (index < 0):
+            index += self.Ptr
+        if (index < 0 or index >= self.Ptr):
+            raise IndexError("stack index out of range")
+        return index
+
+    def __getitem__(self, index):
+        if (type(index) == slice):
+            return self.tolist()[index]
+        return self.Cells[self.cellIndex(index)]
+
+    def __setitem__(self, index, val):
+        self.Cells[self.cellIndex(index)] = val
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __repr__(self):
+        return repr(self.tolist())
+
 # Colon definitions are built into the PAD area - each new entry
 # is a triplet consisting of the word's fully qualified name, its
 # dictionary address, and associated compilation action. 
 class CompileInfo:
+    __slots__ = ("FQName", "Address", "CompileAction")
+
     def __init__(self, fqName, address, compileAction):
         self.FQName = fqName
         self.Address = address
         self.CompileAction = compileAction
 
+# Records call counts, self time and inclusive time for each word, keyed by its fully qualified name. Self time
+# leaves out time spent in the words it called.
+class Profiler:
+    def __init__(self):
+        self.Stats = {}
+        self.ChildTimes = []
+
+    # Runs a word's code field and records how long it took
+    def callWord(self, gsp, cw, codeField):
+        self.ChildTimes.append(0.0)
+        startTime = time.perf_counter()
+        try:
+            codeField(gsp)
+        finally:
+            elapsed = time.perf_counter() - startTime
+            self.record(cw.fqNameField, elapsed, self.ChildTimes.pop())
+
+    # Carries out one of threaded code's built-in instructions and records it as a call to the word it was compiled
+    # from, so a definition gets the same counts whether it's threaded or run by doColon. Returns the index of the
+    # next instruction.
+    def callOp(self, gsp, op, arg, ip, numOps):
+        startTime = time.perf_counter()
+        try:
+            return gsp.cfb.Modules.Interpreter.doThreadedOp(gsp, op, arg, ip, numOps)
+        finally:
+            self.record(OP_WORD_NAMES[op], time.perf_counter() - startTime, 0.0)
+
+    # Adds a call of elapsed seconds, childTime of it spent in the words it called, to the stats for fqName
+    def record(self, fqName, elapsed, childTime):
+        if (fqName not in self.Stats):
+            self.Stats[fqName] = [0, 0.0, 0.0]
+        wordStats = self.Stats[fqName]
+        wordStats[0] += 1
+        wordStats[1] += elapsed - childTime
+        wordStats[2] += elapsed
+        if (len(self.ChildTimes) > 0):
+            self.ChildTimes[-1] += elapsed
+
+    # Stats as a JSON string: { fqName: {"calls": n, "self": seconds, "inclusive": seconds} }
+    def toJson(self):
+        statsDict = {}
+        for fqName in self.Stats:
+            wordStats = self.Stats[fqName]
+            statsDict[fqName] = {"calls": wordStats[0], "self": wordStats[1], "inclusive": wordStats[2]}
+        return json.dumps(statsDict, indent=1)
+
+    # Stats as a table sorted by self time, slowest first
+    def toTable(self):
+        profileTable = []
+        profileTable.append(str(len(self.Stats)) + " words profiled")
+        profileTable.append("Name    Calls    Self (s)    Inclusive (s)")
+        profileTable.append("----    -----    --------    -------------")
+        for fqName in sorted(self.Stats, key=lambda name: self.Stats[name][1], reverse=True):
+            wordStats = self.Stats[fqName]
+            profileTable.append(fqName + " " + str(wordStats[0]) + " " + str(round(wordStats[1], 6)) + " " +
+                                str(round(wordStats[2], 6)))
+        return "\n".join(profileTable)
+
+# Instruction kinds used by direct-threaded colon definitions. Each instruction is an (op, arg) pair.
+OP_CALL = 0         # arg is (word, code field)
+OP_LIT = 1          # arg is the literal value
+OP_BRANCH0 = 2      # arg is the instruction index to branch to
+OP_JUMP = 3         # arg is the instruction index to jump to
+OP_STARTDO = 4      # no arg
+OP_PLUSLOOP = 5     # arg is the instruction index to loop back to
+OP_LOOP = 6         # arg is the instruction index to loop back to
+OP_LITPLUS = 7      # arg is the literal value to add
+OP_EQBRANCH0 = 8    # arg is the instruction index to branch to if the top two values differ
+OP_STARTQDO = 9     # arg is the instruction index to skip to if the loop wouldn't run
+OP_LEAVE = 10       # arg is the instruction index after the loop
+OP_EXIT = 11        # no arg
+# The nesting ops have to stay last: runInner tests for them with op >= OP_NEST
+OP_NEST = 12        # arg is a threaded colon definition to call without recursing in Python
+OP_TAILNEST = 13    # as OP_NEST, but in tail position - the caller's frame is reused
+
+# The words compiled into threaded code as built-in instructions rather than calls, and the word each instruction
+# came from, which the profiler records it under
+THREADED_OPS = {"doLiteral.IMMEDIATE": OP_LIT, "0BRANCH.IMMEDIATE": OP_BRANCH0, "JUMP.IMMEDIATE": OP_JUMP,
+                "doStartDo.IMMEDIATE": OP_STARTDO, "doPlusLoop.IMMEDIATE": OP_PLUSLOOP, "doLoop.IMMEDIATE": OP_LOOP,
+                "doLitPlus.IMMEDIATE": OP_LITPLUS, "doEquals0Branch.IMMEDIATE": OP_EQBRANCH0,
+                "doStartQDo.IMMEDIATE": OP_STARTQDO, "doLeave.IMMEDIATE": OP_LEAVE, "EXIT.FORTH": OP_EXIT}
+OP_WORD_NAMES = {op: fqName for fqName, op in THREADED_OPS.items()}
+
 class CorePrims:
     def __init__(self):
         self.Title = "Core Primitives Grouping"
@@ -130,62 +837,92 @@ class CorePrims:
     
     # ( n1 n2 -- sum ) Adds two numbers on the stack"
     def doPlus(self, gsp):
-        self.returnVal = gsp.pop(gsp.DataStack)
-        val2 = gsp.Scratch
-        self.returnVal = gsp.pop(gsp.DataStack)
-        val1 = gsp.Scratch
-        sum = float(val1) + float(val2)
-        if sum == int(sum):
-            sum = int(sum)
-        gsp.Scratch = sum
-        gsp.push(gsp.DataStack)
-        return 0
+        val2 = gsp.DataStack.pop()
+        val1 = gsp.DataStack.pop()
+        gsp.DataStack.append(self.addValues(gsp, val1, val2))
+
+    # Addition as done by +, shared with the superinstructions that fuse it with other words
+    def addValues(self, gsp, val1, val2):
+        if ((type(val1) == int or type(val1) == float) and (type(val2) == int or type(val2) == float)):
+            return val1 + val2
+        return self.toNumber(gsp, val1) + self.toNumber(gsp, val2)
+
+    # The math primitives work on ints and floats as they are, so ints stay exact however big they get. Vectors are
+    # left alone too, so the arithmetic is done element by element by numpy. Anything else (a number left as a
+    # string, say) is converted first. Raises ValueError if it isn't a number.
+    def toNumber(self, gsp, val):
+        if (type(val) == int or type(val) == float or type(val) == VectorType):
+            return val
+        if (type(val) == str):
+            val = gsp.cfb.Modules.Interpreter.parseNumber(val)
+        if (type(val) == int or type(val) == float):
+            return val
+        return float(val)
+
+    # As toNumber, but for the integer division words: floats are truncated
+    def toInteger(self, gsp, val):
+        if (type(val) == int or type(val) == VectorType):
+            return val
+        return int(self.toNumber(gsp, val))
     
-    # ( n1 n2 -- difference ) Subtracts two numbers on the stack"
+    # ( n1 n2 -- difference ) Subtracts two numbers on the stack
     def doMinus(self, gsp):
-        self.returnVal = gsp.pop(gsp.DataStack)
-        val2 = gsp.Scratch
-        self.returnVal = gsp.pop(gsp.DataStack)
-        val1 = gsp.Scratch
-        difference = float(val1) - float(val2)
-        if difference == int(difference):
-            difference = int(difference)
-        gsp.Scratch = difference     
-        gsp.push(gsp.DataStack)  
+        val2 = gsp.DataStack.pop()
+        val1 = gsp.DataStack.pop()
+        if ((type(val1) == int or type(val1) == float) and (type(val2) == int or type(val2) == float)):
+            gsp.DataStack.append(val1 - val2)
+        else:
+            gsp.DataStack.append(self.toNumber(gsp, val1) - self.toNumber(gsp, val2))
 
     # ( n1 n2 -- product ) Multiplies two numbers on the stack
     def doMultiply(self, gsp):
-        self.returnVal = gsp.pop(gsp.DataStack)
-        val2 = gsp.Scratch
-        self.returnVal = gsp.pop(gsp.DataStack)
-        val1 = gsp.Scratch
-        product = float(val1) * float(val2)
-        if product == int(product):
-            product = int(product)
-        gsp.Scratch = product     
-        gsp.push(gsp.DataStack)  
+        val2 = gsp.DataStack.pop()
+        val1 = gsp.DataStack.pop()
+        if ((type(val1) == int or type(val1) == float) and (type(val2) == int or type(val2) == float)):
+            gsp.DataStack.append(val1 * val2)
+        else:
+            gsp.DataStack.append(self.toNumber(gsp, val1) * self.toNumber(gsp, val2))
     
-    # ( n1 n2 -- quotient ) Divides two numbers on the stack
+    # ( n1 n2 -- quotient ) Divides two numbers on the stack. Integers that divide exactly give an exact integer,
+    # anything else a float.
     def doDivide(self, gsp):
-        self.returnVal = gsp.pop(gsp.DataStack)
-        val2 = gsp.Scratch
-        self.returnVal = gsp.pop(gsp.DataStack)
-        val1 = gsp.Scratch
-        quotient = float(val1) / float(val2)
-        if quotient == int(quotient):
-            quotient = int(quotient)
-        gsp.Scratch = quotient    
-        gsp.push(gsp.DataStack)  
+        val2 = self.toNumber(gsp, gsp.DataStack.pop())
+        val1 = self.toNumber(gsp, gsp.DataStack.pop())
+        if (type(val1) == int and type(val2) == int and val2 != 0 and val1 % val2 == 0):
+            gsp.DataStack.append(val1 // val2)
+        else:
+            gsp.DataStack.append(val1 / val2)
     
     # ( n1 n2 -- remainder ) Returns remainder of division operation
     def doMod(self, gsp):
-        self.returnVal = gsp.pop(gsp.DataStack)
-        val2 = gsp.Scratch
-        self.returnVal = gsp.pop(gsp.DataStack)
-        val1 = gsp.Scratch
-        remainder = int(val1) % int(val2)    
-        gsp.Scratch = remainder   
-        gsp.push(gsp.DataStack)  
+        val2 = self.toInteger(gsp, gsp.DataStack.pop())
+        val1 = self.toInteger(gsp, gsp.DataStack.pop())
+        gsp.DataStack.append(val1 % val2)
+
+    # ( n1 n2 -- remainder quotient ) Integer division. Like MOD, the quotient is floored and the remainder takes
+    # the sign of the divisor.
+    def doSlashMod(self, gsp):
+        val2 = self.toInteger(gsp, gsp.DataStack.pop())
+        val1 = self.toInteger(gsp, gsp.DataStack.pop())
+        quotient, remainder = divmod(val1, val2)
+        gsp.DataStack.append(remainder)
+        gsp.DataStack.append(quotient)
+
+    # ( n1 n2 n3 -- quotient ) Multiplies n1 by n2, then divides by n3. The product is exact, however big.
+    def doStarSlash(self, gsp):
+        val3 = self.toInteger(gsp, gsp.DataStack.pop())
+        val2 = self.toInteger(gsp, gsp.DataStack.pop())
+        val1 = self.toInteger(gsp, gsp.DataStack.pop())
+        gsp.DataStack.append((val1 * val2) // val3)
+
+    # ( n1 n2 n3 -- remainder quotient ) As */, leaving the remainder as well
+    def doStarSlashMod(self, gsp):
+        val3 = self.toInteger(gsp, gsp.DataStack.pop())
+        val2 = self.toInteger(gsp, gsp.DataStack.pop())
+        val1 = self.toInteger(gsp, gsp.DataStack.pop())
+        quotient, remainder = divmod(val1 * val2, val3)
+        gsp.DataStack.append(remainder)
+        gsp.DataStack.append(quotient)
     
     # ( val --  val val ) Duplicates the argument on top of the stack
     def doDup(self, gsp):
@@ -250,22 +987,27 @@ class CorePrims:
     # ( val -- ) Prints the argument at the top of the stack
     def doDot(self,gsp):
         gsp.Scratch = gsp.DataStack.pop()
-        print(gsp.Scratch)
+        gsp.emit(gsp.Scratch)
     
+    # ( ms -- ) Waits for ms milliseconds. Under doOuterAsync other tasks carry on in the meantime.
+    def doSleep(self, gsp):
+        ms = gsp.DataStack.pop()
+        gsp.awaitLater(asyncio.sleep(ms / 1000))
+
     # ( -- n ) Returns the stack depth
     def doDepth(self, gsp):
         gsp.DataStack.append(len(gsp.DataStack))
 
     # ( -- ) prints out Hello World"
     def doHello(self, gsp):
-        print("Hello world")
+        gsp.emit("Hello world")
     
     # ( -- ) Either prints Tulip or pops up a message
     def doTulip(self, gsp):
         # uncomment the code to import pymsgbox to do the alert 
         # alert(text="Tulip", title='Creole Forth', 
         # button='OK')
-        print("Tulip")
+        gsp.emit("Tulip")
     
     # ( msg -- ) Pops up an alert saying the message
     def doMsgBox(self, gsp):
@@ -295,19 +1037,19 @@ class CorePrims:
                                        str(gsp.cfb.Address[i].NameField)  + " " +
                                        str(gsp.cfb.Address[i].Vocabulary) + " " +
                                        str(gsp.cfb.Address[i].CodeFieldStr) + " " + 
-                                       str(gsp.cfb.Address[i].ParamField) + " " + 
-                                       str(gsp.cfb.Address[i].DataField) + " " + 
+                                       str(list(gsp.cfb.Address[i].ParamField)) + " " + 
+                                       str(list(gsp.cfb.Address[i].DataField)) + " " + 
                                        str(gsp.cfb.Address[i].HelpField))
                 
             definitionTable.append("")
-            dtString = "\n".join(definitionTable)
+        dtString = "\n".join(definitionTable)
         gsp.HelpCommentField = dtString
-        print(dtString)
+        gsp.emit(dtString)
     
     # ( -- ) Prints today's date
     def doToday(self, gsp):
         today = datetime.datetime.now()
-        print(today.strftime("%m/%d/%Y"))
+        gsp.emit(today.strftime("%m/%d/%Y"))
     
     # ( --  time ) Puts the time on the stack
     def doNow(self, gsp):
@@ -316,100 +1058,687 @@ class CorePrims:
     # ( time -- ) Formats the time
     def doToHoursMinSecs(self, gsp):
         gsp.pop(gsp.DataStack)
-        print(gsp.Scratch.strftime("%H:%M:%S"))
+        gsp.emit(gsp.Scratch.strftime("%H:%M:%S"))
 
 class Interpreter:
     def __init(self, cfb):
         self.Title = "Interpreter grouping"
     
-    # splits the input into individual words
+    # splits the input into individual words. Numbers are converted as they're split off, so they go onto the stacks and
+    # into parameter fields as ints and floats rather than strings.
     def doParseInput(self, gsp):
         lines = gsp.InputArea.split("\n")
         for i in range(len(lines)):
             lines[i] += " __#EOL#__  "
         codeLine = " ".join(lines)
-        gsp.ParsedInput = re.split(r'\s+', codeLine.strip())
+        gsp.ParsedInput = [self.parseNumber(token) for token in re.split(r'\s+', codeLine.strip())]
+
+    # Splits a text stream (an open file, for instance) into individual words one line at a time, with the same
+    # end of line markers and number conversion as doParseInput. Only the current line is held in memory.
+    def doTokenize(self, textStream):
+        parseNumber = self.parseNumber
+        for line in textStream:
+            for token in line.split():
+                yield parseNumber(token)
+            yield "__#EOL#__"
+
+    # Converts a token to an int or float if it's a number and returns anything else unchanged. Handles integers,
+    # decimals, exponents, signs and hex written either as $FF or 0xFF. Words are turned away on their first
+    # character or two, so only tokens that really look like numbers are handed to int() and float().
+    def parseNumber(self, token):
+        body = token
+        isNegative = False
+        if (token[0] == "-" or token[0] == "+"):
+            body = token[1:]
+            isNegative = token[0] == "-"
+        if (body == "" or body[0] not in "0123456789.$"):
+            return token
+        if (body[0] == "." and (len(body) == 1 or not body[1].isdigit())):
+            return token
+        try:
+            return int(token)
+        except ValueError:
+            pass
+        try:
+            if (body[0] == "$"):
+                hexVal = int(body[1:], 16)
+            elif (body[0:2] == "0x" or body[0:2] == "0X"):
+                hexVal = int(body[2:], 16)
+            else:
+                return float(token)
+            if (isNegative):
+                return -hexVal
+            return hexVal
+        except ValueError:
+            return token
+
+    # Moves on to the next word of the input and returns it, or None at the end of the input. Words are pulled
+    # from gsp.TokenStream in streaming mode and from gsp.ParsedInput otherwise, so words that read ahead
+    # (comments, CREATE, colon definitions, lists) work the same way in both.
+    def nextToken(self, gsp):
+        gsp.ParsedInputPtr += 1
+        if (gsp.TokenStream != None):
+            return next(gsp.TokenStream, None)
+        if (gsp.ParsedInputPtr < len(gsp.ParsedInput)):
+            return gsp.ParsedInput[gsp.ParsedInputPtr]
+        return None
+
+    # Runs the outer interpreter over a text stream in streaming mode, so the input never has to fit in memory
+    def doOuterStream(self, gsp, textStream):
+        gsp.TokenStream = self.doTokenize(textStream)
+        self.doOuter(gsp)
+        gsp.TokenStream = None
     
     # Looks up the word based on its list index and executes whatever is in its code field
     def doRunWord(self, gsp):
         try:
             gsp.CurrWord = gsp.cfb.Address[gsp.ExecPtr]
-            gsp.CurrWord.CodeField(gsp)
-        except IndexError:
-            print("Error: Stack underflow")
-            gsp.cleanFields()
+            if (gsp.Profiler == None):
+                gsp.CurrWord.CodeField(gsp)
+            else:
+                gsp.Profiler.callWord(gsp, gsp.CurrWord, gsp.CurrWord.CodeField)
+        except RunLimitExceeded:
+            raise
+        except Exception as e:
+            self.reportError(gsp, e)
         except:
-            print("Unknown error")
+            gsp.emit("Unknown error")
+
+    # Prints the message for an error a word raised. The errors the interpreter knows about also clear the stacks
+    # and the rest of the input.
+    def reportError(self, gsp, e):
+        if (isinstance(e, (StackUnderflowError, StackTypeError, AsyncWordError))):
+            gsp.emit(e)
+        elif (isinstance(e, IndexError)):
+            gsp.emit("Error: Stack underflow")
+        elif (isinstance(e, OverflowError)):
+            gsp.emit(e)
+        elif (isinstance(e, ZeroDivisionError)):
+            gsp.emit("Error: Division by zero")
+        else:
+            gsp.emit("Unknown error")
+            return
+        gsp.cleanFields()
 
-    # Run-time code for colon definitions
+    # Run-time code for colon definitions. Calls to other doColon definitions don't recurse: the caller is saved in
+    # the gsp frame arrays and the loop carries on with the callee, or just replaces the caller if the call is the last
+    # thing in it. Primitives still see a ReturnLoc on the return stack, but it's the one kept for this frame slot
+    # rather than a new one each time.
     def doColon(self, gsp):
-        gsp.ParamFieldPtr = gsp.CurrWord.ParamFieldStart
-        paramField = gsp.CurrWord.ParamField
-        while (gsp.ParamFieldPtr < len(paramField)):
-            addrInPF = paramField[gsp.ParamFieldPtr]
-            currContextWord = gsp.CurrWord
-            gsp.CurrWord = gsp.cfb.Address[addrInPF]
-            codeField = gsp.cfb.Address[addrInPF].CodeField
-            gsp.ParamFieldPtr += 1
-            rLoc = ReturnLoc(currContextWord, gsp.ParamFieldPtr)
-            gsp.ReturnStack.append(rLoc)
-            codeField(gsp)
-            rLoc = gsp.ReturnStack.pop()
-            gsp.CurrWord = rLoc.CurrWord
-            gsp.ParamFieldPtr = rLoc.ParamFieldAddr
+        address = gsp.cfb.Address
+        frameWords = gsp.FrameWords
+        framePtrs = gsp.FramePtrs
+        frameLocs = gsp.FrameLocs
+        doColonField = self.doColon
+        limits = gsp.Limits
+        baseDepth = gsp.FrameDepth
+        depth = baseDepth
+        if (depth + 1 >= len(frameWords)):
+            gsp.growFrames()
+        gsp.FrameDepth = depth + 1
+        contextWord = gsp.CurrWord
+        paramField = contextWord.ParamField
+        gsp.ParamFieldPtr = contextWord.ParamFieldStart
+        try:
+            while (True):
+                if (gsp.ParamFieldPtr >= len(paramField)):
+                    if (depth == baseDepth):
+                        break
+                    depth -= 1
+                    gsp.FrameDepth = depth + 1
+                    contextWord = frameWords[depth]
+                    paramField = contextWord.ParamField
+                    gsp.ParamFieldPtr = framePtrs[depth]
+                    gsp.CurrWord = contextWord
+                    continue
+                if (limits != None):
+                    limits.spend(gsp, 1)
+                addrInPF = paramField[gsp.ParamFieldPtr]
+                gsp.CurrWord = address[addrInPF]
+                codeField = gsp.CurrWord.CodeField
+                gsp.ParamFieldPtr += 1
+                if (codeField == doColonField and gsp.Profiler == None):
+                    if (gsp.ParamFieldPtr < len(paramField)):
+                        frameWords[depth] = contextWord
+                        framePtrs[depth] = gsp.ParamFieldPtr
+                        depth += 1
+                        if (depth + 1 >= len(frameWords)):
+                            gsp.growFrames()
+                        gsp.FrameDepth = depth + 1
+                    contextWord = gsp.CurrWord
+                    paramField = contextWord.ParamField
+                    gsp.ParamFieldPtr = contextWord.ParamFieldStart
+                    continue
+                rLoc = frameLocs[depth]
+                rLoc.CurrWord = contextWord
+                rLoc.ParamFieldAddr = gsp.ParamFieldPtr
+                gsp.ReturnStack.append(rLoc)
+                if (gsp.Profiler == None):
+                    codeField(gsp)
+                else:
+                    gsp.Profiler.callWord(gsp, gsp.CurrWord, codeField)
+                rLoc = gsp.ReturnStack.pop()
+                gsp.CurrWord = rLoc.CurrWord
+                gsp.ParamFieldPtr = rLoc.ParamFieldAddr
+        finally:
+            gsp.FrameDepth = baseDepth
+
+    # Turns a finished colon definition into direct-threaded code. The parameter field is decoded once into
+    # (op, arg) instructions with the code fields prebound and the branch targets translated into instruction
+    # indexes, so nothing has to be looked up or put on the return stack at run time. The instructions are kept in
+    # the word's ThreadedField and the closure returned becomes its code field. Calls to other threaded definitions
+    # (and to the word itself, for RECURSE) are compiled as OP_NEST, which runInner handles without recursing.
+    # Returns None for definitions that have to stay on doColon because they manipulate the return stack
+    # themselves (DOES>).
+    def makeThreaded(self, gsp, cw):
+        address = gsp.cfb.Address
+        ops = []
+
+        if (cw.ParamFieldStart != 0):
+            return None
+        # Branch targets come back from the decoder as instruction indexes already
+        instrs = gsp.cfb.Modules.Optimizer.decodeParamField(gsp, cw.ParamField)
+        if (instrs == None):
+            return None
+        for instr in instrs:
+            word = address[instr[0]]
+            if (word.fqNameField in THREADED_OPS):
+                ops.append((THREADED_OPS[word.fqNameField], instr[1] if len(instr) > 1 else None))
+            elif (word == cw or word.ThreadedField != None):
+                ops.append((OP_TAILNEST if len(ops) == len(instrs) - 1 else OP_NEST, word))
+            else:
+                ops.append((OP_CALL, (word, word.CodeField)))
+        cw.ThreadedField = ops
+        interpreter = self
+
+        # Run-time code for a threaded colon definition
+        def runThreaded(gsp):
+            interpreter.runInner(gsp, cw)
+        return runThreaded
+
+    # Inner interpreter for threaded code. Nested threaded definitions are run by this same loop: the caller's
+    # word and instruction pointer go into the gsp frame arrays and come back out when the callee
+    # finishes, and a call in tail position just replaces the caller. So nothing is allocated per call and deep
+    # recursion only runs into BFC.MaxFrameDepth, not Python's recursion limit. Profiling gets its own loop so it
+    # costs nothing when it's off.
+    def runInner(self, gsp, cw):
+        if (gsp.Profiler != None):
+            self.runThreadedProfiled(gsp, cw, cw.ThreadedField)
+            return
+        compiler = gsp.cfb.Modules.Compiler
+        corePrims = gsp.cfb.Modules.CorePrims
+        frameWords = gsp.FrameWords
+        framePtrs = gsp.FramePtrs
+        loopIndexes = gsp.LoopIndexes
+        loopLimits = gsp.LoopLimits
+        # Every instruction counts towards the limits, but it's only charged at a change of ip other than going on to
+        # the next instruction: the straight run since runStart is charged in one go. It's tested with "is not None"
+        # as that's cheaper than != where it's hit on every time round a loop.
+        limits = gsp.Limits
+        runStart = 0
+        baseDepth = gsp.FrameDepth
+        depth = baseDepth
+        if (depth + 1 >= len(frameWords)):
+            gsp.growFrames()
+        frameLimit = len(frameWords) - 1
+        gsp.FrameDepth = depth + 1
+        word = cw
+        ops = cw.ThreadedField
+        numOps = len(ops)
+        ip = 0
+        try:
+            while (True):
+                if (ip >= numOps):
+                    if (limits is not None):
+                        limits.spend(gsp, ip - runStart)
+                    if (depth == baseDepth):
+                        break
+                    depth -= 1
+                    gsp.FrameDepth = depth + 1
+                    word = frameWords[depth]
+                    ops = word.ThreadedField
+                    numOps = len(ops)
+                    ip = framePtrs[depth]
+                    runStart = ip
+                    continue
+                op, arg = ops[ip]
+                ip += 1
+                if (op == OP_CALL):
+                    gsp.CurrWord = arg[0]
+                    arg[1](gsp)
+                elif (op >= OP_NEST):
+                    if (gsp.Profiler != None):
+                        gsp.CurrWord = arg
+                        gsp.Profiler.callWord(gsp, arg, arg.CodeField)
+                        continue
+                    if (limits is not None):
+                        limits.spend(gsp, ip - runStart)
+                        runStart = 0
+                    if (op == OP_NEST):
+                        frameWords[depth] = word
+                        framePtrs[depth] = ip
+                        depth += 1
+                        if (depth >= frameLimit):
+                            gsp.growFrames()
+                            frameLimit = len(frameWords) - 1
+                        gsp.FrameDepth = depth + 1
+                    word = arg
+                    ops = arg.ThreadedField
+                    numOps = len(ops)
+                    ip = 0
+                elif (op == OP_LIT):
+                    gsp.DataStack.append(arg)
+                elif (op == OP_BRANCH0):
+                    if (int(gsp.DataStack.pop()) == 0):
+                        if (limits is not None):
+                            limits.spend(gsp, ip - runStart)
+                            runStart = arg
+                        ip = arg
+                elif (op == OP_LOOP):
+                    index = loopIndexes[-1] + 1
+                    if (index < loopLimits[-1]):
+                        loopIndexes[-1] = index
+                        if (limits is not None):
+                            limits.spend(gsp, ip - runStart)
+                            runStart = arg
+                        ip = arg
+                    else:
+                        loopIndexes.pop()
+                        loopLimits.pop()
+                elif (op == OP_JUMP):
+                    if (limits is not None):
+                        limits.spend(gsp, ip - runStart)
+                        runStart = arg
+                    ip = arg
+                elif (op == OP_STARTDO):
+                    compiler.startLoop(gsp, False)
+                elif (op == OP_LITPLUS):
+                    gsp.DataStack.append(corePrims.addValues(gsp, gsp.DataStack.pop(), arg))
+                elif (op == OP_EQBRANCH0):
+                    if (not (gsp.DataStack.pop() == gsp.DataStack.pop())):
+                        if (limits is not None):
+                            limits.spend(gsp, ip - runStart)
+                            runStart = arg
+                        ip = arg
+                elif (op == OP_PLUSLOOP):
+                    if (compiler.stepLoop(gsp, int(gsp.DataStack.pop()))):
+                        if (limits is not None):
+                            limits.spend(gsp, ip - runStart)
+                            runStart = arg
+                        ip = arg
+                else:
+                    nextIp = self.doThreadedOp(gsp, op, arg, ip, numOps)
+                    if (limits is not None and nextIp != ip):
+                        limits.spend(gsp, ip - runStart)
+                        runStart = nextIp
+                    ip = nextIp
+        finally:
+            gsp.FrameDepth = baseDepth
+        gsp.CurrWord = cw
+
+    # Runs threaded code the same way runInner does, timing each word it calls and each built-in instruction as the
+    # word it was compiled from. Nested definitions are timed calls here, so this loop does recurse.
+    def runThreadedProfiled(self, gsp, cw, ops):
+        profiler = gsp.Profiler
+        ip = 0
+        while (ip < len(ops)):
+            op, arg = ops[ip]
+            ip += 1
+            if (gsp.Limits != None):
+                gsp.Limits.spend(gsp, 1)
+            if (op == OP_CALL):
+                gsp.CurrWord = arg[0]
+                profiler.callWord(gsp, arg[0], arg[1])
+            elif (op == OP_NEST or op == OP_TAILNEST):
+                gsp.CurrWord = arg
+                profiler.callWord(gsp, arg, arg.CodeField)
+            else:
+                ip = profiler.callOp(gsp, op, arg, ip, len(ops))
+        gsp.CurrWord = cw
+
+    # Carries out a threaded instruction other than a call and returns the index of the next instruction. runInner
+    # has the common ones inline; the rest are here, along with everything for the loops that don't need to be as
+    # quick. numOps is the number of instructions in the definition, which EXIT skips to.
+    def doThreadedOp(self, gsp, op, arg, ip, numOps):
+        compiler = gsp.cfb.Modules.Compiler
+        if (op == OP_LIT):
+            gsp.DataStack.append(arg)
+        elif (op == OP_BRANCH0):
+            if (int(gsp.DataStack.pop()) == 0):
+                ip = arg
+        elif (op == OP_JUMP):
+            ip = arg
+        elif (op == OP_STARTDO):
+            compiler.startLoop(gsp, False)
+        elif (op == OP_STARTQDO):
+            if (not compiler.startLoop(gsp, True)):
+                ip = arg
+        elif (op == OP_LEAVE):
+            compiler.doUnloop(gsp)
+            ip = arg
+        elif (op == OP_EXIT):
+            ip = numOps
+        elif (op == OP_LOOP):
+            if (compiler.stepLoop(gsp, 1)):
+                ip = arg
+        elif (op == OP_LITPLUS):
+            gsp.DataStack.append(gsp.cfb.Modules.CorePrims.addValues(gsp, gsp.DataStack.pop(), arg))
+        elif (op == OP_EQBRANCH0):
+            if (not (gsp.DataStack.pop() == gsp.DataStack.pop())):
+                ip = arg
+        elif (compiler.stepLoop(gsp, int(gsp.DataStack.pop()))):
+            ip = arg
+        return ip
+
+    # ( -- ) Starts (or resumes) recording call counts and times for every word executed
+    def doProfileOn(self, gsp):
+        if (gsp.ProfileData == None):
+            gsp.ProfileData = Profiler()
+        gsp.Profiler = gsp.ProfileData
+
+    # ( -- ) Stops recording word timings. What has been recorded so far is kept for .PROFILE
+    def doProfileOff(self, gsp):
+        gsp.Profiler = None
+
+    # ( -- ) Throws away the word timings recorded so far
+    def doProfileReset(self, gsp):
+        gsp.ProfileData = Profiler()
+        if (gsp.Profiler != None):
+            gsp.Profiler = gsp.ProfileData
+
+    # ( -- ) Prints the recorded word timings, slowest self time first
+    def doDotProfile(self, gsp):
+        if (gsp.ProfileData == None):
+            gsp.ProfileData = Profiler()
+        gsp.HelpCommentField = gsp.ProfileData.toTable()
+        gsp.emit(gsp.HelpCommentField)
     
+    # ( -- ) Lists the words in each vocabulary on the search order, newest first
+    def doWords(self, gsp):
+        vocabsListed = []
+        for vocab in reversed(gsp.VocabStack):
+            if (vocab not in vocabsListed):
+                vocabsListed.append(vocab)
+                gsp.emit(vocab + ": " + " ".join(reversed(gsp.cfb.Dict.wordsIn(vocab))))
+
     # ( -- ) Empties the vocabulary stack, then puts ONLY on it
     def doOnly(self, gsp):
-        gsp.VocabStack = []
+        gsp.VocabStack.clear()
         gsp.VocabStack.append("ONLY")
+        self.doSearchOrderChanged(gsp)
 
     # ( -- ) Puts FORTH on the vocabulary stack
     def doForth(self, gsp):
         gsp.VocabStack.append("FORTH")
+        self.doSearchOrderChanged(gsp)
 
     # ( -- ) Puts APPSPEC on the vocabulary stack
     def doAppSpec(self, gsp):
         gsp.VocabStack.append("APPSPEC")
+        self.doSearchOrderChanged(gsp)
+
+    # Switches to the resolved-word table for the current vocabulary stack
+    def doSearchOrderChanged(self, gsp):
+        if (type(gsp.VocabStack) != VocabStackList):
+            # Set to a plain list from outside
+            gsp.VocabStack = VocabStackList(gsp.VocabStack)
+        searchVocabs = tuple(gsp.VocabStack)
+        if (searchVocabs not in gsp.cfb.LookupCache):
+            gsp.cfb.LookupCache[searchVocabs] = {}
+        gsp.SearchCache = gsp.cfb.LookupCache[searchVocabs]
+        gsp.SearchStack = gsp.VocabStack
+        gsp.SearchVersion = gsp.VocabStack.Version
+        gsp.SearchTables = gsp.cfb.Dict.searchTables(searchVocabs)
+
+    # Searches the vocabularies from top to bottom for a word and returns its dictionary entry, or None if it
+    # isn't there. Results are cached for each vocabulary stack state, so a token that has been seen before
+    # costs one probe. Otherwise it's one probe of each vocabulary table on the search order.
+    def findWord(self, gsp, rawWord):
+        vocabStack = gsp.VocabStack
+        if (vocabStack is not gsp.SearchStack or vocabStack.Version != gsp.SearchVersion):
+            self.doSearchOrderChanged(gsp)
+        searchCache = gsp.SearchCache
+        if (rawWord in searchCache):
+            return searchCache[rawWord]
+
+        cw = None
+        upperWord = rawWord.upper()
+        for vocabTable in gsp.SearchTables:
+            cw = vocabTable.get(upperWord)
+            if (cw != None):
+                break
+        # Literals are cached as well, so the table is emptied when it fills up rather than growing with the input
+        if (len(searchCache) >= gsp.BFC.LookupCacheSize):
+            searchCache.clear()
+        searchCache[rawWord] = cw
+        return cw
 
     # Search vocabularies from top to bottom for word. If found, execute. If not, it gets pushed onto the stack
     def doOuter(self, gsp):
         rawWord = ""
-        fqWord = ""
         isFound = False
-        gsp.ParsedInputPtr = 0
+        gsp.ParsedInputPtr = -1
         gsp.ExecPtr = 0
         gsp.ParamFieldPtr = 0
 
-        while (gsp.ParsedInputPtr < len(gsp.ParsedInput)):
-            if (gsp.pause == False):
-                rawWord = gsp.ParsedInput[gsp.ParsedInputPtr]
-                searchVocabPtr = len(gsp.VocabStack) - 1
-                while (searchVocabPtr >= 0):
-                    fqWord = rawWord.upper() + "." + gsp.VocabStack[searchVocabPtr]
-                    if (fqWord in gsp.cfb.Dict):
-                        gsp.ExecPtr = gsp.cfb.Dict[fqWord].IndexField
+        # Whatever the run printed is flushed from the output sink at the end, however it ends
+        try:
+            rawWord = self.nextToken(gsp)
+            while (rawWord != None):
+                # Numbers were already converted by the tokenizer and go straight onto the stack
+                if (gsp.pause == False and type(rawWord) == str):
+                    cw = self.findWord(gsp, rawWord)
+                    if (cw != None):
+                        gsp.ExecPtr = cw.IndexField
                         self.doRunWord(gsp)
                         isFound = True
-                        break
-                    else:
-                        searchVocabPtr -= 1
-            if (isFound == False):
-                gsp.DataStack.append(rawWord)
-            gsp.ParsedInputPtr += 1
-            isFound = False
+                        if (gsp.Limits != None):
+                            gsp.Limits.spend(gsp, 1)
+                if (isFound == False):
+                    try:
+                        gsp.DataStack.append(rawWord)
+                    except (StackTypeError, StackOverflowError) as e:
+                        # Only a numeric data stack refuses a value
+                        gsp.emit(e)
+                        gsp.cleanFields()
+                rawWord = self.nextToken(gsp)
+                isFound = False
+        finally:
+            gsp.Output.flush()
+        gsp.PADarea = []
+
+    # Runs the outer interpreter under a set of RunLimits and returns a RunResult. A run that goes over a limit is
+    # stopped where it is and the rest of the input dropped, as with an error.
+    def doOuterLimited(self, gsp, limits):
+        self.startLimitedRun(gsp, limits)
+        try:
+            self.doOuter(gsp)
+        except RunLimitExceeded as e:
+            return self.finishLimitedRun(gsp, e)
+        return self.finishLimitedRun(gsp, None)
+
+    # doOuterLimited for doOuterAsync
+    async def doOuterLimitedAsync(self, gsp, limits):
+        self.startLimitedRun(gsp, limits)
+        try:
+            await self.doOuterAsync(gsp)
+        except RunLimitExceeded as e:
+            return self.finishLimitedRun(gsp, e)
+        return self.finishLimitedRun(gsp, None)
+
+    def startLimitedRun(self, gsp, limits):
+        limits.start()
+        gsp.Limits = limits
+
+    def finishLimitedRun(self, gsp, e):
+        limits = gsp.Limits
+        gsp.Limits = None
+        seconds = time.perf_counter() - limits.StartTime
+        dataStack = list(gsp.DataStack)
+        gsp.Output.flush()
+        output = None
+        if (type(gsp.Output) == CaptureSink):
+            output = gsp.Output.takeOutput()
+        if (e == None):
+            return RunResult("ok", None, "", limits.wordsExecuted(), seconds, dataStack, output)
+        gsp.cleanFields()
+        return RunResult("limit", e.Limit, str(e), limits.wordsExecuted(), seconds, dataStack, output)
+
+    # The outer interpreter as a coroutine, for running scripts under asyncio. It works like doOuter, but colon
+    # definitions are run by runColonAsync, async primitives are awaited where they're called, and every
+    # BFC.AsyncSliceWords words it gives other tasks a turn, so one event loop can interleave many scripts.
+    async def doOuterAsync(self, gsp):
+        rawWord = ""
+        isFound = False
+        gsp.ParsedInputPtr = -1
+        gsp.ExecPtr = 0
+        gsp.ParamFieldPtr = 0
+        gsp.AsyncMode = True
+        try:
+            wordCount = 0
+            rawWord = self.nextToken(gsp)
+            while (rawWord != None):
+                if (type(rawWord) == str):
+                    cw = self.findWord(gsp, rawWord)
+                    if (cw != None):
+                        gsp.ExecPtr = cw.IndexField
+                        await self.doRunWordAsync(gsp)
+                        isFound = True
+                        if (gsp.Limits != None):
+                            gsp.Limits.spend(gsp, 1)
+                if (isFound == False):
+                    try:
+                        gsp.DataStack.append(rawWord)
+                    except (StackTypeError, StackOverflowError) as e:
+                        gsp.emit(e)
+                        gsp.cleanFields()
+                rawWord = self.nextToken(gsp)
+                isFound = False
+                wordCount += 1
+                if (wordCount >= gsp.BFC.AsyncSliceWords):
+                    wordCount = 0
+                    await asyncio.sleep(0)
+        finally:
+            gsp.AsyncMode = False
+            gsp.dropPending()
+            gsp.Output.flush()
         gsp.PADarea = []
 
+    # As doRunWord, for doOuterAsync
+    async def doRunWordAsync(self, gsp):
+        try:
+            gsp.CurrWord = gsp.cfb.Address[gsp.ExecPtr]
+            if ((gsp.CurrWord.CodeField == self.doColon or gsp.CurrWord.ThreadedField != None) and gsp.Profiler == None):
+                await self.runColonAsync(gsp)
+            else:
+                if (gsp.Profiler == None):
+                    gsp.CurrWord.CodeField(gsp)
+                else:
+                    gsp.Profiler.callWord(gsp, gsp.CurrWord, gsp.CurrWord.CodeField)
+                if (gsp.pause):
+                    await self.doContinue(gsp)
+        except RunLimitExceeded:
+            gsp.dropPending()
+            raise
+        except Exception as e:
+            gsp.dropPending()
+            self.reportError(gsp, e)
+
+    # Awaits what the words just run left on gsp.onContinue, oldest first, then lets the run carry on
+    async def doContinue(self, gsp):
+        onContinue = gsp.onContinue
+        gsp.onContinue = []
+        gsp.pause = False
+        for i in range(len(onContinue)):
+            try:
+                await onContinue[i]
+            except BaseException:
+                closeAwaitables(onContinue[i + 1:])
+                raise
+
+    # Runs the colon definition in gsp.CurrWord (threaded or not) as doColon does, working through its parameter
+    # field with nested calls kept in the frame arrays, but stops to await async primitives at the word they're
+    # called from and to give other tasks a turn every BFC.AsyncSliceWords words
+    async def runColonAsync(self, gsp):
+        address = gsp.cfb.Address
+        frameWords = gsp.FrameWords
+        framePtrs = gsp.FramePtrs
+        frameLocs = gsp.FrameLocs
+        doColonField = self.doColon
+        limits = gsp.Limits
+        sliceWords = gsp.BFC.AsyncSliceWords
+        wordCount = 0
+        baseDepth = gsp.FrameDepth
+        depth = baseDepth
+        if (depth + 1 >= len(frameWords)):
+            gsp.growFrames()
+        gsp.FrameDepth = depth + 1
+        contextWord = gsp.CurrWord
+        paramField = contextWord.ParamField
+        gsp.ParamFieldPtr = contextWord.ParamFieldStart
+        try:
+            while (True):
+                if (gsp.ParamFieldPtr >= len(paramField)):
+                    if (depth == baseDepth):
+                        break
+                    depth -= 1
+                    gsp.FrameDepth = depth + 1
+                    contextWord = frameWords[depth]
+                    paramField = contextWord.ParamField
+                    gsp.ParamFieldPtr = framePtrs[depth]
+                    gsp.CurrWord = contextWord
+                    continue
+                wordCount += 1
+                if (wordCount >= sliceWords):
+                    wordCount = 0
+                    await asyncio.sleep(0)
+                if (limits != None):
+                    limits.spend(gsp, 1)
+                addrInPF = paramField[gsp.ParamFieldPtr]
+                gsp.CurrWord = address[addrInPF]
+                codeField = gsp.CurrWord.CodeField
+                gsp.ParamFieldPtr += 1
+                if ((codeField == doColonField or gsp.CurrWord.ThreadedField != None) and gsp.Profiler == None):
+                    if (gsp.ParamFieldPtr < len(paramField)):
+                        frameWords[depth] = contextWord
+                        framePtrs[depth] = gsp.ParamFieldPtr
+                        depth += 1
+                        if (depth + 1 >= len(frameWords)):
+                            gsp.growFrames()
+                        gsp.FrameDepth = depth + 1
+                    contextWord = gsp.CurrWord
+                    paramField = contextWord.ParamField
+                    gsp.ParamFieldPtr = contextWord.ParamFieldStart
+                    continue
+                rLoc = frameLocs[depth]
+                rLoc.CurrWord = contextWord
+                rLoc.ParamFieldAddr = gsp.ParamFieldPtr
+                gsp.ReturnStack.append(rLoc)
+                if (gsp.Profiler == None):
+                    codeField(gsp)
+                else:
+                    gsp.Profiler.callWord(gsp, gsp.CurrWord, codeField)
+                if (gsp.pause):
+                    await self.doContinue(gsp)
+                rLoc = gsp.ReturnStack.pop()
+                gsp.CurrWord = rLoc.CurrWord
+                gsp.ParamFieldPtr = rLoc.ParamFieldAddr
+        finally:
+            gsp.FrameDepth = baseDepth
+
 class Compiler:
     def __init__(self):
         self.Title = "Compiler grouping"
     
     # ( n --) Compiles value off the TOS into the next parameter field cell
     def doComma(self, gsp):
+        if (gsp.Limits != None):
+            gsp.Limits.growDictionary(1)
         newRow = len(gsp.cfb.Address) - 1
         gsp.Scratch = int(gsp.DataStack.pop())
         token = gsp.Scratch
-        newCreoleWord = gsp.cfb.Address[newRow]
-        newCreoleWord.ParamField.append(token)
+        newCreoleWord = gsp.cfb.ownWord(newRow)
+        newCreoleWord.ownParamField().append(token)
         newCreoleWord.ParamFieldStart += 1
         gsp.ParamFieldPtr = len(newCreoleWord.ParamField) - 1
     
@@ -417,24 +1746,24 @@ class Compiler:
     # Example : comment handling - the pointer is moved past the comments
     # ( -- ) Single-line comment handling
     def doSingleLineCmts(self, gsp):
-        while (gsp.ParsedInput[gsp.ParsedInputPtr].find("__#EOL#__") == -1):
-            gsp.ParsedInputPtr += 1
+        token = gsp.cfb.Modules.Interpreter.nextToken(gsp)
+        while (token != None and str(token).find("__#EOL#__") == -1):
+            token = gsp.cfb.Modules.Interpreter.nextToken(gsp)
     
     # ( -- ) Multiline comment handling
     def doParenCmts(self, gsp):
-        while (gsp.ParsedInput[gsp.ParsedInputPtr].find(")") == -1):
-            gsp.ParsedInputPtr += 1
+        token = gsp.cfb.Modules.Interpreter.nextToken(gsp)
+        while (token != None and str(token).find(")") == -1):
+            token = gsp.cfb.Modules.Interpreter.nextToken(gsp)
     
     # ( -- list ) List compiler
     def compileList(self, gsp):
         gsp.CompiledList = []
-        gsp.ParsedInputPtr += 1
         
-        isFound = re.search(gsp.ParsedInput[gsp.ParsedInputPtr],'\}')
-        while (isFound == None):
-            gsp.CompiledList.append(gsp.ParsedInput[gsp.ParsedInputPtr])
-            gsp.ParsedInputPtr += 1
-            isFound = re.search(gsp.ParsedInput[gsp.ParsedInputPtr],'\}')
+        token = gsp.cfb.Modules.Interpreter.nextToken(gsp)
+        while (token != None and str(token).find("}") == -1):
+            gsp.CompiledList.append(str(token))
+            token = gsp.cfb.Modules.Interpreter.nextToken(gsp)
 
         joinedList = " ".join(gsp.CompiledList)
         gsp.DataStack.append(joinedList)
@@ -457,85 +1786,91 @@ class Compiler:
     
     # CREATE <name>. Adds a named entry into the dictionary
     def doCreate(self, gsp):
+        if (gsp.Limits != None):
+            gsp.Limits.growDictionary(1)
         hereLoc = len(gsp.cfb.Address)
-        name = gsp.ParsedInput[gsp.ParsedInputPtr + 1]
-        params = []
-        data = []
+        name = str(gsp.cfb.Modules.Interpreter.nextToken(gsp))
+        params = EmptyField
+        data = EmptyField
         help = "TODO: "
         cw = CreoleWord(name, gsp.cfb.Modules.Compiler.doMyAddress, "Compiler.doMyAddress", gsp.CurrentVocab,
         "COMPINPF", help, hereLoc - 1, hereLoc, hereLoc - 1, hereLoc, params, data)
         fqName = name + "." + gsp.CurrentVocab
-        gsp.cfb.Dict[fqName] = cw
-        gsp.cfb.Address.append(gsp.cfb.Dict[fqName])
-        gsp.ParsedInputPtr += 2
+        gsp.cfb.Dict.addWord(name, gsp.CurrentVocab, cw)
+        gsp.cfb.Address.append(cw)
+        gsp.cfb.clearLookupCache()
         
     # ( -- ) Starts compilation of a colon definition
     def compileColon(self, gsp):
+        interpreter = gsp.cfb.Modules.Interpreter
         hereLoc = len(gsp.cfb.Address)
-        name = gsp.ParsedInput[gsp.ParsedInputPtr + 1]
+        name = interpreter.nextToken(gsp)
         params = []
         data = []
         help = "TODO: "
         rawWord = None
-        searchVocabPtr = None
         isFound = False
         compAction = None
         compInfo = None
-        isSemiPresent = False
-        colonIndex = -1
-        gspComp = copy.deepcopy(gsp)
+        compWord = None
+        outerDataStack = None
         i = 0
         codeField = None
-        isSemiPresent = False
-        fqName = name + "." + gsp.CurrentVocab
-        # Elementary syntax check - if a colon isn't followed by a matching semicolon, you get an error message and the stacks and input are cleared.
-        for i in range(0, len(gsp.ParsedInput)):
-            if (gsp.ParsedInput[i] == "i"):
-                colonIndex = i
-            if (gsp.ParsedInput[i] == ";" and i > colonIndex):
-                isSemiPresent = True
-        if (isSemiPresent == False):
-            print("Error: colon def must have matching semicolon")
+        if (name == None):
+            gsp.emit("Error: colon def must have matching semicolon")
             gsp.cleanFields()
             return
+        name = str(name)
+        fqName = name + "." + gsp.CurrentVocab
 
         # Compilation is started when the IMMEDIATE vocabulary is pushed onto the vocabulary stack. No need for the usual Forth STATE flag.
         gsp.VocabStack.append(gsp.BFC.ImmediateVocab)       
+        gsp.LeaveStack = []
         cw = CreoleWord(name, gsp.cfb.Modules.Interpreter.doColon, "Interpreter.doColon", gsp.CurrentVocab, "COMPINPF", help, 
         hereLoc - 1, hereLoc, hereLoc - 1, hereLoc, params, data)
-        # The smudge flag avoids accidental recursion. But it's easy enough to get around if you want to. 
-        fqNameSmudged = name + "." + gsp.CurrentVocab + "." + gsp.BFC.SmudgeFlag
-        gsp.cfb.Dict[fqNameSmudged] = cw
-        gsp.cfb.Address.append(gsp.cfb.Dict[fqNameSmudged]) 
+        # The smudge flag avoids accidental recursion: the half-built word is kept in a table of its own that isn't on
+        # the search order. But it's easy enough to get around if you want to.
+        smudgedTable = gsp.cfb.Dict.vocabTable(gsp.BFC.SmudgeFlag)
+        smudgedTable[fqName] = cw
+        gsp.cfb.Address.append(cw)
         
-        gsp.ParsedInputPtr += 2
         # Parameter field contents are set up in the PAD area. Each word is looked up one at a time in the dictionary, and its name, address, and
         # compilation action are placed in the CompileInfo triplet.
-        while (gsp.ParsedInputPtr < len(gsp.ParsedInput) and gsp.VocabStack[len(gsp.VocabStack) - 1] == gsp.BFC.ImmediateVocab and gsp.ParsedInput[gsp.ParsedInputPtr] != ";"):
-            rawWord = gsp.ParsedInput[gsp.ParsedInputPtr]
-            searchVocabPtr = len(gsp.VocabStack) - 1     
+        rawWord = interpreter.nextToken(gsp)
+        while (rawWord != None and gsp.VocabStack[len(gsp.VocabStack) - 1] == gsp.BFC.ImmediateVocab and rawWord != ";"):
             isFound = False
-            while (searchVocabPtr >= 0):
-                fqWord = rawWord.upper() + "." + gsp.VocabStack[searchVocabPtr]
-                if (fqWord in gsp.cfb.Dict):
-                    compAction = gsp.cfb.Dict[fqWord].CompileActionField
-                    if (compAction != gsp.BFC.ExecZeroAction):
-                        compInfo = CompileInfo(fqWord, gsp.cfb.Dict[fqWord].IndexField, compAction)
-                        gsp.PADarea.append(compInfo)
-                    else:
-                        # This is stuff where the outer ptr is manipulated such as comments
-                        codeField = gsp.cfb.Dict[fqWord].CodeField
-                        codeField(gsp)
-                    isFound = True
-                    break
+            foundWord = None
+            if (type(rawWord) == str):
+                foundWord = interpreter.findWord(gsp, rawWord)
+            if (foundWord != None):
+                compAction = foundWord.CompileActionField
+                if (compAction == gsp.BFC.NoCompAction):
+                    # Nothing to compile, e.g. the end of line marker
+                    pass
+                elif (compAction != gsp.BFC.ExecZeroAction):
+                    compInfo = CompileInfo(foundWord.fqNameField, foundWord.IndexField, compAction)
+                    gsp.PADarea.append(compInfo)
                 else:
-                    searchVocabPtr -= 1
+                    # This is stuff where the outer ptr is manipulated such as comments
+                    codeField = foundWord.CodeField
+                    codeField(gsp)
+                isFound = True
 
             # If no dictionary entry is found, it's tagged as a literal.
             if (isFound == False):
                 compInfo = CompileInfo(rawWord, rawWord, gsp.BFC.CompLitAction)
                 gsp.PADarea.append(compInfo)
-            gsp.ParsedInputPtr += 1
+            rawWord = interpreter.nextToken(gsp)
+
+        # Elementary syntax check - if a colon isn't followed by a matching semicolon, you get an error message, the half-built
+        # definition is thrown away and the stacks and input are cleared.
+        if (rawWord == None):
+            gsp.emit("Error: colon def must have matching semicolon")
+            gsp.VocabStack.pop()
+            smudgedTable.pop(fqName)
+            gsp.cfb.Address.pop()
+            gsp.cleanFields()
+            return
         
         # 1. Builds the definition in the parameter field from the PAD area. Very simple; the address of each word appears before its associated
         #    compilation action. Most of the time, it will be COMPINPF, which will simply compile the word into the parameter field (it's actually
@@ -546,30 +1881,48 @@ class Compiler:
         # 4. Deletes the smudged definition.
         # 5. Pops the IMMEDIATE vocabulary off the vocabulary stack and halts compilation. 
         
+        # The definition is built in place, straight into the smudged entry at the end of the Address array. The data stack is
+        # swapped for an empty one while the compilation actions run, so the locations IF, BEGIN, DO etc. leave for their
+        # matching words are kept apart from whatever the outer interpreter has on the stack. Each address is put on the
+        # stack and its compilation action is then executed directly, without going through the parser.
         i = 0
-        gspComp.VocabStack = gsp.VocabStack
-        gspComp.cfb.Address.append(gsp.cfb.Dict[fqNameSmudged]) 
-        
-        # Putting the args and compilation actions together then executing them seems to cause a problem with compiling words.
-        # Getting around this by putting one arg on the stack, one in the input area, then executing. 
+        outerDataStack = gsp.DataStack
+        gsp.DataStack = []
         while (i < len(gsp.PADarea)):
             compInfo = gsp.PADarea[i]
-            gspComp.DataStack.append(compInfo.Address)
-            gspComp.InputArea = compInfo.CompileAction
-            gspComp.cfb.Modules.Interpreter.doParseInput(gspComp)
-            gspComp.cfb.Modules.Interpreter.doOuter(gspComp)
+            gsp.DataStack.append(compInfo.Address)
+            compWord = interpreter.findWord(gsp, compInfo.CompileAction)
+            if (compWord != None):
+                gsp.ExecPtr = compWord.IndexField
+                interpreter.doRunWord(gsp)
+            else:
+                gsp.DataStack.append(compInfo.CompileAction)
             i += 1
         
-        gspComp.InputArea = ";"
-        gspComp.cfb.Modules.Interpreter.doParseInput(gspComp)
-        gspComp.cfb.Modules.Interpreter.doOuter(gspComp)
+        compWord = interpreter.findWord(gsp, ";")
+        gsp.ExecPtr = compWord.IndexField
+        interpreter.doRunWord(gsp)
+        gsp.DataStack = outerDataStack
         
-        cw = gspComp.cfb.Address[hereLoc]
+        cw = gsp.cfb.Address[hereLoc]
         cw.ParamFieldStart = 0
-        gsp.cfb.Dict[fqName] = cw
+        if (gsp.Inlining):
+            gsp.cfb.Modules.Optimizer.doInline(gsp, cw)
+        if (gsp.ConstantFold):
+            gsp.cfb.Modules.Optimizer.doConstantFold(gsp, cw)
+        if (gsp.PeepholeOptimize):
+            gsp.cfb.Modules.Optimizer.doPeephole(gsp, cw)
+        if (gsp.DirectThreading):
+            threadedCode = interpreter.makeThreaded(gsp, cw)
+            if (threadedCode != None):
+                cw.CodeField = threadedCode
+        gsp.cfb.Dict.addWord(name, gsp.CurrentVocab, cw)
+        gsp.cfb.clearLookupCache()
 
         # remove the smudged dictionary entry
-        gsp.cfb.Dict.pop(fqNameSmudged)
+        smudgedTable.pop(fqName)
+        if (gsp.Limits != None):
+            gsp.Limits.growDictionary(1 + len(cw.ParamField))
 
     # ( -- ) Terminates compilation of a colon definition
     def doSemi(self, gsp):
@@ -581,19 +1934,13 @@ class Compiler:
     def compileLiteral(self, gsp):
         newRow = len(gsp.cfb.Address) - 1
         newCreoleWord = gsp.cfb.Address[newRow]
-        doLitAddr = gsp.cfb.Dict["doLiteral.IMMEDIATE"].IndexField
+        doLitAddr = gsp.cfb.Dict.find("doLiteral", "IMMEDIATE").IndexField
         litVal = gsp.DataStack.pop()
         newCreoleWord.ParamField.append(doLitAddr)
-
-        numberSet = re.findall(r"[-+]?\d*\.\d+|\d+", litVal)
-        if (len(numberSet) > 0):
-            litValNum = float(litVal)
-            if (litValNum == int(litValNum)):
-                newCreoleWord.ParamField.append(int(litValNum))
-            else:
-                newCreoleWord.ParamField.append(litValNum)
-        else:
-            newCreoleWord.ParamField.append(litVal)
+        # Numbers normally arrive already converted by the tokenizer
+        if (type(litVal) == str):
+            litVal = gsp.cfb.Modules.Interpreter.parseNumber(litVal)
+        newCreoleWord.ParamField.append(litVal)
         gsp.ParamFieldPtr = len(newCreoleWord.ParamField) - 1
     
         # ( -- lit ) Run-time code that pushes a literal onto the stack
@@ -618,37 +1965,50 @@ class Compiler:
     def doStore(self, gsp):
         address = gsp.DataStack.pop()
         valToStore = gsp.DataStack.pop()
-        numberSet = re.findall(r"[-+]?\d*\.\d+|\d+",valToStore)
-        if (len(numberSet) > 0):
-            valRes1 = float(valToStore)
-            if (valRes1 == int(valRes1)):
-                gsp.cfb.Address[address].ParamField.append(int(valRes1))
-            else:
-                gsp.cfb.Address[address].ParamField.append(valRes1)
+        if (gsp.Limits != None):
+            gsp.Limits.growDictionary(1)
+        if (type(valToStore) == str):
+            valToStore = gsp.cfb.Modules.Interpreter.parseNumber(valToStore)
+        if (type(valToStore) == int or type(valToStore) == float):
+            gsp.cfb.ownWord(address).ownParamField().append(valToStore)
         else:
-            gsp.cfb.Address[address].DataField.append(valToStore)
+            gsp.cfb.ownWord(address).ownDataField().append(valToStore)
     
+    # SAVE-SYSTEM <file>. Saves the dictionary to an image file that loadInterpreter can start from
+    def doSaveSystem(self, gsp):
+        fileName = str(gsp.cfb.Modules.Interpreter.nextToken(gsp))
+        try:
+            gsp.cfb.saveImage(gsp, fileName)
+        except ValueError as e:
+            gsp.emit(e)
+
     # (  -- ) Sets the current (compilation) vocabulary to the context vocabulary (the one on top of the vocabulary stack)
     def doSetCurrentToContext(self, gsp):
         currentVocab = gsp.VocabStack[len(gsp.VocabStack) - 1]
         gsp.CurrentVocab = currentVocab
-        print("Current vocab is now " + gsp.CurrentVocab)
+        gsp.cfb.clearLookupCache()
+        gsp.emit("Current vocab is now " + gsp.CurrentVocab)
 
     # ( -- ) Flags a word as immediate (so it executes instead of compiling inside a colon definition)
     def doImmediate(self, gsp):
         newRow = len(gsp.cfb.Address) - 1
-        newCreoleWord = gsp.cfb.Address[newRow]
+        newCreoleWord = gsp.cfb.ownWord(newRow)
         fqName = newCreoleWord.fqNameField
-        newCreoleWord.CompileAction = "EXECUTE"
         newCreoleWord.Vocabulary = "IMMEDIATE"
         gsp.cfb.Address[newRow] = newCreoleWord
-        gsp.cfb[fqName] = newCreoleWord
+        gsp.cfb.Dict[fqName] = newCreoleWord
+        gsp.cfb.clearLookupCache()
+
+    # ( -- ) Compiles a call to the definition being compiled, which can't be found by name until it's finished
+    def compileRecurse(self, gsp):
+        newRow = len(gsp.cfb.Address) - 1
+        gsp.cfb.Address[newRow].ownParamField().append(newRow)
 
     # ( -- location ) Compile-time code for IF
     def compileIf(self, gsp):
         newRow = len(gsp.cfb.Address) - 1
         newCreoleWord = gsp.cfb.Address[newRow]
-        zeroBranchAddr = gsp.cfb.Dict["0BRANCH.IMMEDIATE"].IndexField
+        zeroBranchAddr = gsp.cfb.Dict.find("0BRANCH", "IMMEDIATE").IndexField
         newCreoleWord.ParamField.append(zeroBranchAddr)
         newCreoleWord.ParamField.append(-1)
         gsp.ParamFieldPtr = len(newCreoleWord.ParamField) - 1
@@ -658,8 +2018,8 @@ class Compiler:
     def compileElse(self, gsp):
         newRow = len(gsp.cfb.Address) - 1
         newCreoleWord = gsp.cfb.Address[newRow]
-        jumpAddr = gsp.cfb.Dict["JUMP.IMMEDIATE"].IndexField
-        elseAddr = gsp.cfb.Dict["doElse.IMMEDIATE"].IndexField
+        jumpAddr = gsp.cfb.Dict.find("JUMP", "IMMEDIATE").IndexField
+        elseAddr = gsp.cfb.Dict.find("doElse", "IMMEDIATE").IndexField
         newCreoleWord.ParamField.append(jumpAddr)
         newCreoleWord.ParamField.append(-1)
         jumpAddrPFLoc = len(newCreoleWord.ParamField) - 1
@@ -674,21 +2034,20 @@ class Compiler:
         newRow = len(gsp.cfb.Address) - 1
         newCreoleWord = gsp.cfb.Address[newRow]
         branchPFLoc = gsp.DataStack.pop()
-        thenAddr = gsp.cfb.Dict["doThen.IMMEDIATE"].IndexField
+        thenAddr = gsp.cfb.Dict.find("doThen", "IMMEDIATE").IndexField
         newCreoleWord.ParamField.append(thenAddr)
         newCreoleWord.ParamField[branchPFLoc] = len(newCreoleWord.ParamField) - 1
 
     # ( flag -- ) Run-time code for IF
     def do0Branch(self, gsp):
-        currWord = gsp.cfb.Address[gsp.ExecPtr]
-        paramField = currWord.ParamField
         rLoc = gsp.ReturnStack.pop()
+        paramField = rLoc.CurrWord.ParamField
         jumpAddr = paramField[rLoc.ParamFieldAddr]
         branchFlag = int(gsp.DataStack.pop())
         if (branchFlag == 0):
             gsp.ParamFieldPtr = jumpAddr
         else:
-            gsp.ParamFieldPtr += 1
+            gsp.ParamFieldPtr = rLoc.ParamFieldAddr + 1
         rLoc.ParamFieldAddr = gsp.ParamFieldPtr
         gsp.ReturnStack.append(rLoc)
     
@@ -696,7 +2055,7 @@ class Compiler:
     def compileBegin(self, gsp):
         newRow = len(gsp.cfb.Address) - 1
         newCreoleWord = gsp.cfb.Address[newRow]
-        beginAddr = gsp.cfb.Dict["doBegin.IMMEDIATE"].IndexField
+        beginAddr = gsp.cfb.Dict.find("doBegin", "IMMEDIATE").IndexField
         newCreoleWord.ParamField.append(beginAddr)
         beginLoc = len(newCreoleWord.ParamField) - 1
         gsp.DataStack.append(beginLoc)
@@ -706,7 +2065,7 @@ class Compiler:
         newRow = len(gsp.cfb.Address) - 1
         newCreoleWord = gsp.cfb.Address[newRow]
         beginLoc = gsp.DataStack.pop()
-        zeroBranchAddr = gsp.cfb.Dict["0BRANCH.IMMEDIATE"].IndexField
+        zeroBranchAddr = gsp.cfb.Dict.find("0BRANCH", "IMMEDIATE").IndexField
         newCreoleWord.ParamField.append(zeroBranchAddr)
         newCreoleWord.ParamField.append(beginLoc)
     
@@ -714,95 +2073,149 @@ class Compiler:
     def compileDo(self, gsp):
         newRow = len(gsp.cfb.Address) - 1
         newCreoleWord = gsp.cfb.Address[newRow]
-        doStartDoAddr = gsp.cfb.Dict["doStartDo.IMMEDIATE"].IndexField
-        doAddr = gsp.cfb.Dict["doDo.IMMEDIATE"].IndexField
+        doStartDoAddr = gsp.cfb.Dict.find("doStartDo", "IMMEDIATE").IndexField
+        doAddr = gsp.cfb.Dict.find("doDo", "IMMEDIATE").IndexField
         newCreoleWord.ParamField.append(doStartDoAddr)
         newCreoleWord.ParamField.append(doAddr)
         doLoc = len(newCreoleWord.ParamField) - 1
         gsp.DataStack.append(doLoc)
+        gsp.LeaveStack.append([])
+
+    # ( -- beginLoc ) Compile-time code for ?DO. Like DO, but skips the loop if the start and limit are the same.
+    def compileQDo(self, gsp):
+        newRow = len(gsp.cfb.Address) - 1
+        newCreoleWord = gsp.cfb.Address[newRow]
+        doStartQDoAddr = gsp.cfb.Dict.find("doStartQDo", "IMMEDIATE").IndexField
+        doAddr = gsp.cfb.Dict.find("doDo", "IMMEDIATE").IndexField
+        newCreoleWord.ParamField.append(doStartQDoAddr)
+        newCreoleWord.ParamField.append(-1)
+        # Patched with the end of the loop, the same as a LEAVE
+        gsp.LeaveStack.append([len(newCreoleWord.ParamField) - 1])
+        newCreoleWord.ParamField.append(doAddr)
+        doLoc = len(newCreoleWord.ParamField) - 1
+        gsp.DataStack.append(doLoc)
+
+    # ( -- ) Compile-time code for LEAVE
+    def compileLeave(self, gsp):
+        newRow = len(gsp.cfb.Address) - 1
+        newCreoleWord = gsp.cfb.Address[newRow]
+        leaveAddr = gsp.cfb.Dict.find("doLeave", "IMMEDIATE").IndexField
+        newCreoleWord.ParamField.append(leaveAddr)
+        newCreoleWord.ParamField.append(-1)
+        gsp.LeaveStack[len(gsp.LeaveStack) - 1].append(len(newCreoleWord.ParamField) - 1)
 
     # ( -- beginLoc ) Compile-time code for LOOP
     def compileLoop(self, gsp):
         newRow = len(gsp.cfb.Address) - 1
         newCreoleWord = gsp.cfb.Address[newRow]
-        loopAddr = gsp.cfb.Dict["doLoop.IMMEDIATE"].IndexField
+        loopAddr = gsp.cfb.Dict.find("doLoop", "IMMEDIATE").IndexField
         doLoc = gsp.DataStack.pop()
         newCreoleWord.ParamField.append(loopAddr)
         newCreoleWord.ParamField.append(doLoc)
+        self.resolveLeaves(gsp, newCreoleWord)
 
     # ( -- beginLoc ) Compile-time code for +LOOP
     def compilePlusLoop(self, gsp):
         newRow = len(gsp.cfb.Address) - 1
         newCreoleWord = gsp.cfb.Address[newRow]
-        loopAddr = gsp.cfb.Dict["doPlusLoop.IMMEDIATE"].IndexField
+        loopAddr = gsp.cfb.Dict.find("doPlusLoop", "IMMEDIATE").IndexField
         doLoc = gsp.DataStack.pop()
         newCreoleWord.ParamField.append(loopAddr)
         newCreoleWord.ParamField.append(doLoc)
+        self.resolveLeaves(gsp, newCreoleWord)
+
+    # Points the LEAVEs (and ?DO) of the loop just finished at the cell after its LOOP or +LOOP
+    def resolveLeaves(self, gsp, newCreoleWord):
+        for leaveLoc in gsp.LeaveStack.pop():
+            newCreoleWord.ParamField[leaveLoc] = len(newCreoleWord.ParamField)
 
-    # ( start end -- ) Starts off the Do by getting the start and end
+    # ( limit start -- ) Starts off the Do by getting the start and end
     def doStartDo(self, gsp):
+        self.startLoop(gsp, False)
+
+    # ( limit start -- ) Run-time code for ?DO: starts the loop, or jumps past it if the start and limit are the same
+    def doStartQDo(self, gsp):
         rLoc = gsp.ReturnStack.pop()
-        startIndex = gsp.DataStack.pop()
-        loopEnd = gsp.DataStack.pop()
-        li = LoopInfo(gsp.loopLabels[gsp.LoopLabelPtr], startIndex, loopEnd)
-        gsp.LoopCurrIndexes = [0, 0, 0]
-        gsp.LoopLabelPtr += 1
-        gsp.ReturnStack.append(li)
+        if (self.startLoop(gsp, True)):
+            gsp.ParamFieldPtr = rLoc.ParamFieldAddr + 1
+        else:
+            gsp.ParamFieldPtr = rLoc.CurrWord.ParamField[rLoc.ParamFieldAddr]
+        rLoc.ParamFieldAddr = gsp.ParamFieldPtr
         gsp.ReturnStack.append(rLoc)
 
-    #  ( inc -- ) Loops back to doDo until the start >= the end and increments with inc
+    #  ( inc -- ) Loops back to doDo until the index crosses the limit and increments with inc
     def doPlusLoop(self, gsp):
         incVal = int(gsp.DataStack.pop())
-        currWord = gsp.cfb.Address[gsp.ExecPtr]
-        paramField = currWord.ParamField
         rLoc = gsp.ReturnStack.pop()
-        li = gsp.ReturnStack.pop()
-        jumpAddr = paramField[rLoc.ParamFieldAddr]
-        loopLimit = int(li.Limit)
-        loopLabel = li.Label
-        currIndex = int(li.Index)
-        if (incVal < 0):
-            loopLimit += incVal
-        else:
-            loopLimit -= incVal
-        if ( ( (incVal > 0) and currIndex >= loopLimit) or ( (incVal < 0) and currIndex <= loopLimit)):
-            gsp.ParamFieldPtr += 1
-            rLoc.ParamFieldAddr = gsp.ParamFieldPtr
-            gsp.LoopLabelPtr -= 1
-        else:
-            gsp.ParamFieldPtr = jumpAddr
-            currIndex = currIndex + incVal
-            li.Index = currIndex
-            rLoc.ParamFieldAddr = gsp.ParamFieldPtr
-            gsp.ReturnStack.append(li)
-        if   (loopLabel == "I"):
-            gsp.LoopCurrIndexes[0] = currIndex
-        elif (loopLabel == "J"):
-            gsp.LoopCurrIndexes[1] = currIndex
-        elif (loopLabel == "K"):
-            gsp.LoopCurrIndexes[2] = currIndex
+        paramField = rLoc.CurrWord.ParamField
+        if (self.stepLoop(gsp, incVal)):
+            gsp.ParamFieldPtr = paramField[rLoc.ParamFieldAddr]
         else:
-            print("Error: invalid loop label")
+            gsp.ParamFieldPtr = rLoc.ParamFieldAddr + 1
+        rLoc.ParamFieldAddr = gsp.ParamFieldPtr
         gsp.ReturnStack.append(rLoc)
+
+    # Pushes a loop frame for a DO from the limit and start on the stack. For ?DO (isQDo), returns False without
+    # pushing anything if the start and limit are the same. Shared by the run-time words and threaded code.
+    def startLoop(self, gsp, isQDo):
+        startIndex = int(gsp.DataStack.pop())
+        loopLimit = int(gsp.DataStack.pop())
+        if (isQDo and startIndex == loopLimit):
+            return False
+        gsp.LoopIndexes.append(startIndex)
+        gsp.LoopLimits.append(loopLimit)
+        return True
+
+    # Adds incVal to the index of the innermost loop. Returns True if the loop goes round again and False, after
+    # dropping its frame, once the index reaches the limit (or goes below it when counting down). Shared by the
+    # run-time words and threaded code.
+    def stepLoop(self, gsp, incVal):
+        currIndex = gsp.LoopIndexes[-1] + incVal
+        if ((incVal >= 0 and currIndex < gsp.LoopLimits[-1]) or (incVal < 0 and currIndex >= gsp.LoopLimits[-1])):
+            gsp.LoopIndexes[-1] = currIndex
+            return True
+        gsp.LoopIndexes.pop()
+        gsp.LoopLimits.pop()
+        return False
     
     # doLoop is treated as a special case of doPlusLoop
     # ( -- ) Loops back to doDo until the start equals the end
     def doLoop(self, gsp):
         gsp.DataStack.append(1)
-        codeField = gsp.cfb.Dict["doPlusLoop.IMMEDIATE"].CodeField
+        codeField = gsp.cfb.Dict.find("doPlusLoop", "IMMEDIATE").CodeField
         codeField(gsp)
 
-    # ( -- index ) Returns the index of I
+    # ( -- ) Run-time code for LEAVE: drops the innermost loop and jumps past its LOOP
+    def doLeave(self, gsp):
+        rLoc = gsp.ReturnStack.pop()
+        self.doUnloop(gsp)
+        gsp.ParamFieldPtr = rLoc.CurrWord.ParamField[rLoc.ParamFieldAddr]
+        rLoc.ParamFieldAddr = gsp.ParamFieldPtr
+        gsp.ReturnStack.append(rLoc)
+
+    # ( -- ) Drops the innermost loop frame, so a definition can EXIT from inside a loop
+    def doUnloop(self, gsp):
+        gsp.LoopIndexes.pop()
+        gsp.LoopLimits.pop()
+
+    # ( -- ) Returns from the colon definition it's in
+    def doExit(self, gsp):
+        rLoc = gsp.ReturnStack.pop()
+        gsp.ParamFieldPtr = len(rLoc.CurrWord.ParamField)
+        rLoc.ParamFieldAddr = gsp.ParamFieldPtr
+        gsp.ReturnStack.append(rLoc)
+
+    # ( -- index ) Returns the index of the innermost loop
     def doIndexI(self, gsp):
-        gsp.DataStack.append(gsp.LoopCurrIndexes[0])
+        gsp.DataStack.append(gsp.LoopIndexes[-1])
 
-    # ( -- index ) Returns the index of J
+    # ( -- index ) Returns the index of the next loop out
     def doIndexJ(self, gsp):
-        gsp.DataStack.append(gsp.LoopCurrIndexes[1])
+        gsp.DataStack.append(gsp.LoopIndexes[-2])
     
-    # ( -- index ) Returns the index of K
+    # ( -- index ) Returns the index of the loop out from that
     def doIndexK(self, gsp):
-        gsp.DataStack.append(gsp.LoopCurrIndexes[2])
+        gsp.DataStack.append(gsp.LoopIndexes[-3])
     
     # ( address -- ) Run-time code for DOES>
     def doDoes(self, gsp):
@@ -815,9 +2228,9 @@ class Compiler:
         parentRow = rLoc.CurrWord.IndexField
         newRow = len(gsp.cfb.Address) - 1
         parentCreoleWord = gsp.cfb.Address[parentRow]
-        childCreoleWord = gsp.cfb.Address[newRow]
+        childCreoleWord = gsp.cfb.ownWord(newRow)
         fqNameField = childCreoleWord.fqNameField
-        doesAddr = gsp.cfb.Dict["DOES>.FORTH"].IndexField
+        doesAddr = gsp.cfb.Dict.find("DOES>", "FORTH").IndexField
         i = 0
         childCreoleWord.CodeField = gsp.cfb.Modules.Compiler.doDoes
         childCreoleWord.CodeFieldStr = "Compiler.doDoes"
@@ -831,7 +2244,7 @@ class Compiler:
         
         # Need the definition's address do doDoes can get it easily either when it's being
         # called from the interpreter from from within a compiled definition
-        childCreoleWord.ParamField.append(newRow)
+        childCreoleWord.ownParamField().append(newRow)
         childCreoleWord.ParamFieldStart = len(childCreoleWord.ParamField)
         i = 0
         while (startCopyPoint < len(parentCreoleWord.ParamField)):
@@ -846,10 +2259,9 @@ class Compiler:
 
      # ( -- ) Jumps unconditionally to the parameter field location next to it and is compiled by ELSE   
     def doJump(self, gsp):
-        currWord = gsp.cfb.Address[gsp.ExecPtr]
-        paramField = currWord.ParamField
-        jumpAddr = paramField[gsp.ParamFieldPtr + 1]
         rLoc = gsp.ReturnStack.pop()
+        paramField = rLoc.CurrWord.ParamField
+        jumpAddr = paramField[rLoc.ParamFieldAddr]
         gsp.ParamFieldPtr = jumpAddr
         rLoc.ParamFieldAddr = gsp.ParamFieldPtr
         gsp.ReturnStack.append(rLoc)
@@ -857,12 +2269,18 @@ class Compiler:
 class LogicOps:
     def __init__(self):
         self.Title = "Logical operatives grouping"
+
+    # Comparisons and logic on vectors give a vector of flags, -1 where cond holds and 0 elsewhere
+    def toFlags(self, cond):
+        return numpy.where(cond, -1, 0)
     
     # ( val1 val2 -- flag ) -1 if equal, 0 otherwise
     def doEquals(self, gsp):
         val1 = gsp.DataStack.pop()
         val2 = gsp.DataStack.pop()
-        if (val1 == val2):
+        if (type(val1) == VectorType or type(val2) == VectorType):
+            gsp.DataStack.append(self.toFlags(val2 == val1))
+        elif (val1 == val2):
             gsp.DataStack.append(-1)
         else:
              gsp.DataStack.append(0)
@@ -871,7 +2289,9 @@ class LogicOps:
     def doNotEquals(self, gsp):
         val1 = gsp.DataStack.pop()
         val2 = gsp.DataStack.pop()
-        if (val1 == val2):
+        if (type(val1) == VectorType or type(val2) == VectorType):
+            gsp.DataStack.append(self.toFlags(val2 != val1))
+        elif (val1 == val2):
             gsp.DataStack.append(0)
         else:
              gsp.DataStack.append(-1)
@@ -880,7 +2300,9 @@ class LogicOps:
     def doLessThan(self, gsp):
         val1 = gsp.DataStack.pop()
         val2 = gsp.DataStack.pop()
-        if (val2 < val1):
+        if (type(val1) == VectorType or type(val2) == VectorType):
+            gsp.DataStack.append(self.toFlags(val2 < val1))
+        elif (val2 < val1):
             gsp.DataStack.append(-1)
         else:
              gsp.DataStack.append(0)
@@ -889,7 +2311,9 @@ class LogicOps:
     def doGreaterThan(self, gsp):
         val1 = gsp.DataStack.pop()
         val2 = gsp.DataStack.pop()
-        if (val2 > val1):
+        if (type(val1) == VectorType or type(val2) == VectorType):
+            gsp.DataStack.append(self.toFlags(val2 > val1))
+        elif (val2 > val1):
             gsp.DataStack.append(-1)
         else:
              gsp.DataStack.append(0)
@@ -898,7 +2322,9 @@ class LogicOps:
     def doLessThanOrEquals(self, gsp):
         val1 = gsp.DataStack.pop()
         val2 = gsp.DataStack.pop()
-        if (val2 <= val1):
+        if (type(val1) == VectorType or type(val2) == VectorType):
+            gsp.DataStack.append(self.toFlags(val2 <= val1))
+        elif (val2 <= val1):
             gsp.DataStack.append(-1)
         else:
              gsp.DataStack.append(0)
@@ -907,7 +2333,9 @@ class LogicOps:
     def doGreaterThanOrEquals(self, gsp):
         val1 = gsp.DataStack.pop()
         val2 = gsp.DataStack.pop()
-        if (val2 >= val1):
+        if (type(val1) == VectorType or type(val2) == VectorType):
+            gsp.DataStack.append(self.toFlags(val2 >= val1))
+        elif (val2 >= val1):
             gsp.DataStack.append(-1)
         else:
              gsp.DataStack.append(0)
@@ -915,7 +2343,9 @@ class LogicOps:
     # ( val -- opval ) -1 if 0, 0 otherwise
     def doNot(self, gsp):
         val = gsp.DataStack.pop()
-        if int(val) == 0:
+        if (type(val) == VectorType):
+            gsp.DataStack.append(self.toFlags(val == 0))
+        elif int(val) == 0:
             gsp.DataStack.append(-1)
         else:
             gsp.DataStack.append(0)
@@ -924,7 +2354,9 @@ class LogicOps:
     def doAnd(self, gsp):
         val1 = gsp.DataStack.pop()
         val2 = gsp.DataStack.pop()
-        if int(val1) != 0 and int(val2) != 0:
+        if (type(val1) == VectorType or type(val2) == VectorType):
+            gsp.DataStack.append(self.toFlags(numpy.logical_and(val1 != 0, val2 != 0)))
+        elif int(val1) != 0 and int(val2) != 0:
             gsp.DataStack.append(-1)
         else:
             gsp.DataStack.append(0)
@@ -933,7 +2365,9 @@ class LogicOps:
     def doOr(self, gsp):
         val1 = gsp.DataStack.pop()
         val2 = gsp.DataStack.pop()
-        if int(val1) != 0 or int(val2) != 0:
+        if (type(val1) == VectorType or type(val2) == VectorType):
+            gsp.DataStack.append(self.toFlags(numpy.logical_or(val1 != 0, val2 != 0)))
+        elif int(val1) != 0 or int(val2) != 0:
             gsp.DataStack.append(-1)
         else:
             gsp.DataStack.append(0)
@@ -947,34 +2381,670 @@ class LogicOps:
         #else:
         #    gsp.DataStack.append(0)
 
+class Optimizer:
+    def __init__(self):
+        self.Title = "Optimizer grouping"
+
+    # Decodes a colon definition's parameter field into a list of instructions, one per word: [address] or
+    # [address, operand] for words followed by a literal or a branch target. Branch targets are turned into instruction
+    # indexes so the list can be rearranged and then put back together with encodeInstructions. Returns None if the
+    # parameter field can't be taken apart safely - DOES> copies cells out of it, for instance.
+    def decodeParamField(self, gsp, paramField):
+        address = gsp.cfb.Address
+        instrs = []
+        cellToInstr = {}
+        i = 0
+        while (i < len(paramField)):
+            addrInPF = paramField[i]
+            if (type(addrInPF) != int or addrInPF < 0 or addrInPF >= len(address) or address[addrInPF] == None):
+                return None
+            word = address[addrInPF]
+            cellToInstr[i] = len(instrs)
+            if (word.CodeFieldStr == "Compiler.compileDoes"):
+                return None
+            elif (word.fqNameField in gsp.BFC.LiteralWords or word.fqNameField in gsp.BFC.BranchWords):
+                if (i + 1 >= len(paramField)):
+                    return None
+                instrs.append([addrInPF, paramField[i + 1]])
+                i += 2
+            else:
+                instrs.append([addrInPF])
+                i += 1
+        cellToInstr[len(paramField)] = len(instrs)
+
+        for instr in instrs:
+            if (self.isBranch(gsp, instr)):
+                if (instr[1] not in cellToInstr):
+                    return None
+                instr[1] = cellToInstr[instr[1]]
+        return instrs
+
+    # Puts a list of instructions from decodeParamField back together into a parameter field
+    def encodeInstructions(self, gsp, instrs):
+        instrToCell = []
+        paramField = []
+        cell = 0
+        for instr in instrs:
+            instrToCell.append(cell)
+            cell += len(instr)
+        instrToCell.append(cell)
+        for instr in instrs:
+            paramField.append(instr[0])
+            if (self.isBranch(gsp, instr)):
+                paramField.append(instrToCell[instr[1]])
+            elif (len(instr) > 1):
+                paramField.append(instr[1])
+        return paramField
+
+    # True if the instruction's operand is a branch target
+    def isBranch(self, gsp, instr):
+        return len(instr) > 1 and gsp.cfb.Address[instr[0]].fqNameField in gsp.BFC.BranchWords
+
+    # Instruction indexes that something branches to
+    def branchTargets(self, gsp, instrs):
+        targets = set()
+        for instr in instrs:
+            if (self.isBranch(gsp, instr)):
+                targets.add(instr[1])
+        return targets
+
+    # Drops the instructions whose isKept flag is False. Branches to a dropped instruction go to the next one kept.
+    def removeInstructions(self, gsp, instrs, isKept):
+        newIndexes = []
+        keptCount = 0
+        keptInstrs = []
+        for i in range(len(instrs)):
+            newIndexes.append(keptCount)
+            if (isKept[i]):
+                keptCount += 1
+        newIndexes.append(keptCount)
+        for i in range(len(instrs)):
+            if (isKept[i]):
+                instr = instrs[i]
+                if (self.isBranch(gsp, instr)):
+                    instr = [instr[0], newIndexes[instr[1]]]
+                keptInstrs.append(instr)
+        return keptInstrs
+
+    # Peephole pass run at the end of compileColon. Drops the do-nothing markers compiled by ELSE, THEN, BEGIN and DO,
+    # then fuses common pairs of words into single superinstructions. A pair isn't fused if something branches to its
+    # second word.
+    def doPeephole(self, gsp, cw):
+        dictionary = gsp.cfb.Dict
+        markerAddrs = []
+        fusions = {}
+        if (cw.ParamFieldStart != 0):
+            return
+        instrs = self.decodeParamField(gsp, cw.ParamField)
+        if (instrs == None):
+            return
+
+        for markerName in ("doElse", "doThen", "doBegin", "doDo"):
+            markerAddrs.append(dictionary.find(markerName, "IMMEDIATE").IndexField)
+        instrs = self.removeInstructions(gsp, instrs, [instr[0] not in markerAddrs for instr in instrs])
+
+        for first, second, fusedName in ((("doLiteral", "IMMEDIATE"), ("+", "FORTH"), "doLitPlus"),
+                                         (("DUP", "FORTH"), ("+", "FORTH"), "doDupPlus"),
+                                         (("OVER", "FORTH"), ("OVER", "FORTH"), "doOverOver"),
+                                         (("=", "FORTH"), ("0BRANCH", "IMMEDIATE"), "doEquals0Branch")):
+            fusedAddr = dictionary.find(fusedName, "IMMEDIATE").IndexField
+            fusions[(dictionary.find(*first).IndexField, dictionary.find(*second).IndexField)] = fusedAddr
+        targets = self.branchTargets(gsp, instrs)
+        isKept = [True] * len(instrs)
+        i = 0
+        while (i < len(instrs) - 1):
+            pair = (instrs[i][0], instrs[i + 1][0])
+            if (pair in fusions and i + 1 not in targets):
+                # At most one of the pair has an operand, and it goes with the superinstruction
+                instrs[i] = [fusions[pair]] + instrs[i][1:] + instrs[i + 1][1:]
+                isKept[i + 1] = False
+                i += 2
+            else:
+                i += 1
+        instrs = self.removeInstructions(gsp, instrs, isKept)
+        cw.ParamField = self.encodeInstructions(gsp, instrs)
+
+    # Inlining pass run at the end of compileColon, before constant folding. Calls to short colon definitions (up to
+    # gsp.InlineThreshold cells, or any size if flagged with INLINE) are replaced by a copy of the callee's
+    # instructions, with the callee's branch targets moved to where its code now sits.
+    def doInline(self, gsp, cw):
+        address = gsp.cfb.Address
+        inlined = []
+        newIndexes = []
+        # The caller's own branches, whose targets still have to be moved once everything's in place
+        callerBranches = []
+        if (cw.ParamFieldStart != 0):
+            return
+        instrs = self.decodeParamField(gsp, cw.ParamField)
+        if (instrs == None):
+            return
+
+        for instr in instrs:
+            newIndexes.append(len(inlined))
+            calleeInstrs = self.getInlineBody(gsp, cw, address[instr[0]])
+            if (calleeInstrs == None):
+                if (self.isBranch(gsp, instr)):
+                    callerBranches.append(instr)
+                inlined.append(instr)
+                continue
+            bodyStart = len(inlined)
+            for calleeInstr in calleeInstrs:
+                if (self.isBranch(gsp, calleeInstr)):
+                    calleeInstr = [calleeInstr[0], calleeInstr[1] + bodyStart]
+                inlined.append(calleeInstr)
+        newIndexes.append(len(inlined))
+
+        if (len(inlined) == len(instrs)):
+            return
+        for instr in callerBranches:
+            instr[1] = newIndexes[instr[1]]
+        cw.ParamField = self.encodeInstructions(gsp, inlined)
+
+    # The decoded instructions of a word that can be inlined into cw, or None if it can't. Only plain colon definitions
+    # qualify - not ones that use DOES> or EXIT or refer to themselves.
+    def getInlineBody(self, gsp, cw, callee):
+        if (callee == cw or callee.CodeFieldStr != "Interpreter.doColon" or callee.ParamFieldStart != 0):
+            return None
+        if (not callee.InlineField and len(callee.ParamField) > gsp.InlineThreshold):
+            return None
+        calleeInstrs = self.decodeParamField(gsp, callee.ParamField)
+        if (calleeInstrs == None):
+            return None
+        # EXIT would leave the caller instead once it's inlined
+        exitAddr = gsp.cfb.Dict.find("EXIT", "FORTH").IndexField
+        for calleeInstr in calleeInstrs:
+            if (calleeInstr[0] == callee.IndexField or calleeInstr[0] == exitAddr):
+                return None
+        return calleeInstrs
+
+    # ( -- ) Flags the most recent definition to be inlined wherever it's called, whatever its size
+    def doMarkInline(self, gsp):
+        gsp.cfb.ownWord(len(gsp.cfb.Address) - 1).InlineField = True
+
+    # Constant folding pass run at the end of compileColon, before the peephole pass. Literals followed by words from
+    # gsp.BFC.FoldableWords are run at compile time and replaced by literals of the values they leave, so
+    # : SECSPERDAY 60 60 * 24 * ; compiles to a single literal. Folding stops at branch targets and at anything else,
+    # and a word that fails (dividing by zero, say) is left to fail at run time.
+    def doConstantFold(self, gsp, cw):
+        dictionary = gsp.cfb.Dict
+        address = gsp.cfb.Address
+        doLitAddr = dictionary.find("doLiteral", "IMMEDIATE").IndexField
+        folded = []
+        newIndexes = []
+        # Literals at the end of folded that the next foldable word can use
+        numPending = 0
+        if (cw.ParamFieldStart != 0):
+            return
+        instrs = self.decodeParamField(gsp, cw.ParamField)
+        if (instrs == None):
+            return
+
+        targets = self.branchTargets(gsp, instrs)
+        for i in range(len(instrs)):
+            instr = instrs[i]
+            newIndexes.append(len(folded))
+            if (i in targets):
+                numPending = 0
+            fqName = address[instr[0]].fqNameField
+            if (instr[0] == doLitAddr and type(instr[1]) in (int, float)):
+                folded.append(instr)
+                numPending += 1
+                continue
+            if (fqName in gsp.BFC.FoldableWords and gsp.BFC.FoldableWords[fqName] <= numPending):
+                numArgs = gsp.BFC.FoldableWords[fqName]
+                results = self.runAtCompileTime(gsp, address[instr[0]], [lit[1] for lit in folded[len(folded) - numArgs:]])
+                if (results != None):
+                    del folded[len(folded) - numArgs:]
+                    numPending -= numArgs
+                    for result in results:
+                        folded.append([doLitAddr, result])
+                        numPending += 1
+                    continue
+            folded.append(instr)
+            numPending = 0
+        newIndexes.append(len(folded))
+
+        for instr in folded:
+            if (self.isBranch(gsp, instr)):
+                instr[1] = newIndexes[instr[1]]
+        cw.ParamField = self.encodeInstructions(gsp, folded)
+
+    # Runs a foldable word on a stack of its own and returns what it leaves there, or None if it fails or leaves
+    # anything other than numbers
+    def runAtCompileTime(self, gsp, word, args):
+        savedStack = gsp.DataStack
+        savedScratch = gsp.Scratch
+        gsp.DataStack = list(args)
+        try:
+            word.CodeField(gsp)
+            results = gsp.DataStack
+        except Exception:
+            results = None
+        gsp.DataStack = savedStack
+        gsp.Scratch = savedScratch
+        if (results != None):
+            for result in results:
+                if (type(result) not in (int, float)):
+                    return None
+        return results
+
+    # ( n -- sum ) Superinstruction for a literal followed by +
+    def doLitPlus(self, gsp):
+        rLoc = gsp.ReturnStack.pop()
+        litVal = rLoc.CurrWord.ParamField[rLoc.ParamFieldAddr]
+        rLoc.ParamFieldAddr += 1
+        gsp.ReturnStack.append(rLoc)
+        gsp.DataStack.append(gsp.cfb.Modules.CorePrims.addValues(gsp, gsp.DataStack.pop(), litVal))
+
+    # ( n -- sum ) Superinstruction for DUP +
+    def doDupPlus(self, gsp):
+        val = gsp.DataStack.pop()
+        gsp.DataStack.append(gsp.cfb.Modules.CorePrims.addValues(gsp, val, val))
+
+    # ( val1 val2 -- val1 val2 val1 val2 ) Superinstruction for OVER OVER
+    def doOverOver(self, gsp):
+        val2 = gsp.DataStack[-1]
+        val1 = gsp.DataStack[-2]
+        gsp.DataStack.append(val1)
+        gsp.DataStack.append(val2)
+
+    # ( val1 val2 -- ) Superinstruction for = 0BRANCH: branches unless the top two values are equal
+    def doEquals0Branch(self, gsp):
+        rLoc = gsp.ReturnStack.pop()
+        jumpAddr = rLoc.CurrWord.ParamField[rLoc.ParamFieldAddr]
+        val1 = gsp.DataStack.pop()
+        val2 = gsp.DataStack.pop()
+        if (val1 == val2):
+            gsp.ParamFieldPtr = rLoc.ParamFieldAddr + 1
+        else:
+            gsp.ParamFieldPtr = jumpAddr
+        rLoc.ParamFieldAddr = gsp.ParamFieldPtr
+        gsp.ReturnStack.append(rLoc)
+
+# Vectors are numpy arrays that sit on the data stack like any other value. The arithmetic and logic primitives work
+# on them element by element (broadcasting a scalar across a vector), so a whole vector is handled in one call
+# instead of a DO LOOP over its elements.
+class VectorOps:
+    def __init__(self):
+        self.Title = "Vector operations grouping"
+
+    # Vector words check this first, so they fail with a clear message when numpy isn't installed
+    def hasNumpy(self, gsp):
+        if (numpy == None):
+            gsp.emit("Error: vectors need numpy, which isn't installed")
+            return False
+        return True
+
+    # Reductions hand back plain Python numbers, which the scalar primitives deal with fastest
+    def toScalar(self, val):
+        if (isinstance(val, numpy.generic)):
+            return val.item()
+        return val
+
+    # ( list -- vec ) Makes a vector from a list compiled by { } (or a Python list or tuple)
+    def doToVector(self, gsp):
+        if (not self.hasNumpy(gsp)):
+            return
+        listVal = gsp.DataStack.pop()
+        interpreter = gsp.cfb.Modules.Interpreter
+        if (type(listVal) == str):
+            listVal = [interpreter.parseNumber(token) for token in listVal.split()]
+        gsp.DataStack.append(numpy.array(listVal))
+
+    # ( start end -- vec ) Makes a vector of the integers from start up to (but not including) end
+    def doRange(self, gsp):
+        if (not self.hasNumpy(gsp)):
+            return
+        endVal = gsp.DataStack.pop()
+        startVal = gsp.DataStack.pop()
+        gsp.DataStack.append(numpy.arange(startVal, endVal))
+
+    # LOAD-VECTOR <file>. Reads a vector from a text file of numbers separated by whitespace or commas
+    def doLoadVector(self, gsp):
+        fileName = gsp.cfb.Modules.Interpreter.nextToken(gsp)
+        if (not self.hasNumpy(gsp)):
+            return
+        if (fileName == None):
+            gsp.emit("Error: LOAD-VECTOR needs a file name")
+            return
+        with open(str(fileName), "r") as f:
+            text = f.read().replace(",", " ")
+        gsp.DataStack.append(numpy.array([gsp.cfb.Modules.Interpreter.parseNumber(token) for token in text.split()]))
+
+    # ( vec -- n ) Number of elements in a vector
+    def doLength(self, gsp):
+        gsp.DataStack.append(len(gsp.DataStack.pop()))
+
+    # ( vec -- sum ) Adds up the elements of a vector
+    def doSum(self, gsp):
+        gsp.DataStack.append(self.toScalar(gsp.DataStack.pop().sum()))
+
+    # ( vec -- mean ) Average of the elements of a vector
+    def doMean(self, gsp):
+        gsp.DataStack.append(self.toScalar(gsp.DataStack.pop().mean()))
+
+    # ( vec -- min ) or ( n1 n2 -- min ) Smallest element of a vector, or the smaller of two numbers
+    def doMin(self, gsp):
+        val2 = gsp.DataStack.pop()
+        if (type(val2) == VectorType):
+            gsp.DataStack.append(self.toScalar(val2.min()))
+        else:
+            val1 = gsp.DataStack.pop()
+            gsp.DataStack.append(min(val1, val2))
+
+    # ( vec -- max ) or ( n1 n2 -- max ) Largest element of a vector, or the larger of two numbers
+    def doMax(self, gsp):
+        val2 = gsp.DataStack.pop()
+        if (type(val2) == VectorType):
+            gsp.DataStack.append(self.toScalar(val2.max()))
+        else:
+            val1 = gsp.DataStack.pop()
+            gsp.DataStack.append(max(val1, val2))
+
+    # ( vec1 vec2 -- n ) Dot product of two vectors
+    def doDot(self, gsp):
+        vec2 = gsp.DataStack.pop()
+        vec1 = gsp.DataStack.pop()
+        gsp.DataStack.append(self.toScalar(numpy.dot(vec1, vec2)))
+
+    # ( vec i -- val ) Element i of a vector. Negative indexes count from the end.
+    def doNth(self, gsp):
+        index = int(gsp.DataStack.pop())
+        vec = gsp.DataStack.pop()
+        gsp.DataStack.append(self.toScalar(vec[index]))
+
+    # ( vec start end -- vec ) Elements start up to (but not including) end of a vector, as a new vector
+    def doSlice(self, gsp):
+        endIndex = int(gsp.DataStack.pop())
+        startIndex = int(gsp.DataStack.pop())
+        vec = gsp.DataStack.pop()
+        gsp.DataStack.append(vec[startIndex:endIndex])
+
+    # ( vec flags -- vec ) Elements of a vector where flags, a vector of flags from a comparison, are non-zero
+    def doSelect(self, gsp):
+        flags = gsp.DataStack.pop()
+        vec = gsp.DataStack.pop()
+        gsp.DataStack.append(vec[flags != 0])
+
+# Primitives for a numeric data stack (see NumericStack), found in the NUMERIC vocabulary. They read and write the
+# stack's array in place instead of popping and pushing, and check the depth up front so underflow and overflow give
+# a clear error, as does an integer result too big for a cell. They only work on a NumericStack.
+class NumericOps:
+    def __init__(self):
+        self.Title = "Numeric stack operations grouping"
+
+    # ( -- ) Switches to an integer data stack of BFC.NumericStackSize cells
+    def doIntStack(self, gsp):
+        gsp.useNumericStack("q")
+
+    # ( -- ) Switches to a float data stack of BFC.NumericStackSize cells
+    def doFloatStack(self, gsp):
+        gsp.useNumericStack("d")
+
+    # ( -- ) Switches back to the usual data stack
+    def doListStack(self, gsp):
+        gsp.useListStack()
+
+    # ( n1 n2 -- sum ) Adds two numbers on the stack
+    def doPlus(self, gsp):
+        stack = gsp.DataStack
+        top = stack.Ptr - 1
+        if (top < 1):
+            stack.underflow()
+        cells = stack.Cells
+        try:
+            cells[top - 1] += cells[top]
+        except OverflowError:
+            stack.tooBig(cells[top - 1] + cells[top])
+        stack.Ptr = top
+
+    # ( n1 n2 -- difference ) Subtracts two numbers on the stack
+    def doMinus(self, gsp):
+        stack = gsp.DataStack
+        top = stack.Ptr - 1
+        if (top < 1):
+            stack.underflow()
+        cells = stack.Cells
+        try:
+            cells[top - 1] -= cells[top]
+        except OverflowError:
+            stack.tooBig(cells[top - 1] - cells[top])
+        stack.Ptr = top
+
+    # ( n1 n2 -- product ) Multiplies two numbers on the stack
+    def doMultiply(self, gsp):
+        stack = gsp.DataStack
+        top = stack.Ptr - 1
+        if (top < 1):
+            stack.underflow()
+        cells = stack.Cells
+        try:
+            cells[top - 1] *= cells[top]
+        except OverflowError:
+            stack.tooBig(cells[top - 1] * cells[top])
+        stack.Ptr = top
+
+    # ( n1 n2 -- quotient ) Divides two numbers on the stack: floored on an integer stack, exact on a float one
+    def doDivide(self, gsp):
+        stack = gsp.DataStack
+        top = stack.Ptr - 1
+        if (top < 1):
+            stack.underflow()
+        cells = stack.Cells
+        if (cells.typecode == "q"):
+            try:
+                cells[top - 1] //= cells[top]
+            except OverflowError:
+                stack.tooBig(cells[top - 1] // cells[top])
+        else:
+            cells[top - 1] /= cells[top]
+        stack.Ptr = top
+
+    # ( n1 n2 -- remainder ) Returns remainder of floored division
+    def doMod(self, gsp):
+        stack = gsp.DataStack
+        top = stack.Ptr - 1
+        if (top < 1):
+            stack.underflow()
+        cells = stack.Cells
+        cells[top - 1] %= cells[top]
+        stack.Ptr = top
+
+    # ( val1 val2 -- flag ) -1 if equal, 0 otherwise
+    def doEquals(self, gsp):
+        stack = gsp.DataStack
+        top = stack.Ptr - 1
+        if (top < 1):
+            stack.underflow()
+        cells = stack.Cells
+        cells[top - 1] = -1 if cells[top - 1] == cells[top] else 0
+        stack.Ptr = top
+
+    # ( val1 val2 -- flag ) 0 if equal, -1 otherwise
+    def doNotEquals(self, gsp):
+        stack = gsp.DataStack
+        top = stack.Ptr - 1
+        if (top < 1):
+            stack.underflow()
+        cells = stack.Cells
+        cells[top - 1] = -1 if cells[top - 1] != cells[top] else 0
+        stack.Ptr = top
+
+    # ( val1 val2 -- flag ) -1 if less than, 0 otherwise
+    def doLessThan(self, gsp):
+        stack = gsp.DataStack
+        top = stack.Ptr - 1
+        if (top < 1):
+            stack.underflow()
+        cells = stack.Cells
+        cells[top - 1] = -1 if cells[top - 1] < cells[top] else 0
+        stack.Ptr = top
+
+    # ( val1 val2 -- flag ) -1 if greater than, 0 otherwise
+    def doGreaterThan(self, gsp):
+        stack = gsp.DataStack
+        top = stack.Ptr - 1
+        if (top < 1):
+            stack.underflow()
+        cells = stack.Cells
+        cells[top - 1] = -1 if cells[top - 1] > cells[top] else 0
+        stack.Ptr = top
+
+    # ( val1 val2 -- flag ) -1 if less than or equal to, 0 otherwise
+    def doLessThanOrEquals(self, gsp):
+        stack = gsp.DataStack
+        top = stack.Ptr - 1
+        if (top < 1):
+            stack.underflow()
+        cells = stack.Cells
+        cells[top - 1] = -1 if cells[top - 1] <= cells[top] else 0
+        stack.Ptr = top
+
+    # ( val1 val2 -- flag ) -1 if greater than or equal to, 0 otherwise
+    def doGreaterThanOrEquals(self, gsp):
+        stack = gsp.DataStack
+        top = stack.Ptr - 1
+        if (top < 1):
+            stack.underflow()
+        cells = stack.Cells
+        cells[top - 1] = -1 if cells[top - 1] >= cells[top] else 0
+        stack.Ptr = top
+
+    # ( val --  val val ) Duplicates the argument on top of the stack
+    def doDup(self, gsp):
+        stack = gsp.DataStack
+        ptr = stack.Ptr
+        if (ptr < 1):
+            stack.underflow()
+        if (ptr >= stack.Size):
+            stack.overflow()
+        stack.Cells[ptr] = stack.Cells[ptr - 1]
+        stack.Ptr = ptr + 1
+
+    # ( val1 val2 -- val1 val2 val1 ) Copies second stack argument to the top of the stack
+    def doOver(self, gsp):
+        stack = gsp.DataStack
+        ptr = stack.Ptr
+        if (ptr < 2):
+            stack.underflow()
+        if (ptr >= stack.Size):
+            stack.overflow()
+        stack.Cells[ptr] = stack.Cells[ptr - 2]
+        stack.Ptr = ptr + 1
+
+    # ( val -- ) Drops the argument at the top of the stack
+    def doDrop(self, gsp):
+        stack = gsp.DataStack
+        if (stack.Ptr < 1):
+            stack.underflow()
+        stack.Ptr -= 1
+
+    # ( val1 val2 -- val2 val1 ) Swaps the positions of the top two stack arguments
+    def doSwap(self, gsp):
+        stack = gsp.DataStack
+        top = stack.Ptr - 1
+        if (top < 1):
+            stack.underflow()
+        cells = stack.Cells
+        cells[top - 1], cells[top] = cells[top], cells[top - 1]
+
+    # ( val1 val2 -- val2 ) Removes second stack argument
+    def doNip(self, gsp):
+        stack = gsp.DataStack
+        top = stack.Ptr - 1
+        if (top < 1):
+            stack.underflow()
+        stack.Cells[top - 1] = stack.Cells[top]
+        stack.Ptr = top
+
+    # ( val1 val2 val3 -- val2 val3 val1 ) Moves the third stack argument to the top
+    def doRot(self, gsp):
+        stack = gsp.DataStack
+        top = stack.Ptr - 1
+        if (top < 2):
+            stack.underflow()
+        cells = stack.Cells
+        cells[top - 2], cells[top - 1], cells[top] = cells[top - 1], cells[top], cells[top - 2]
+
 from AppSpec import *
    
+# A parameter or data field that nothing has been stored in yet. Primitives and CREATEd words share it rather than
+# each having two empty lists of their own, and anything that adds to a field calls ownParamField or ownDataField to
+# swap it for a list first.
+EmptyField = ()
+
+# Dictionary entries use slots and interned strings, as a dictionary can hold hundreds of thousands of them. The
+# previous row, row and link fields are always worked out from IndexField (they're still taken by the constructor
+# and saved in images for compatibility), and ParamFieldStartFrom is always 0.
 class CreoleWord:
+    __slots__ = ("NameField", "CodeField", "CodeFieldStr", "Vocabulary", "fqNameField", "CompileActionField",
+                 "HelpField", "IndexField", "ParamField", "DataField", "ParamFieldStart", "InlineField", "ThreadedField")
+    ParamFieldStartFrom = 0
+
     def __init__(self, NameField, CodeField, CodeFieldStr, Vocabulary, CompileActionField, HelpField,PrevRowLocField, RowLocField, LinkField, IndexField, ParamField, DataField):
-        self.NameField = NameField
+        self.NameField = sys.intern(NameField)
         self.CodeField = CodeField
-        self.CodeFieldStr = CodeFieldStr
-        self.Vocabulary = Vocabulary
-        self.fqNameField = NameField + "." + Vocabulary
-        self.CompileActionField = CompileActionField
+        self.CodeFieldStr = sys.intern(CodeFieldStr)
+        self.Vocabulary = sys.intern(Vocabulary)
+        self.fqNameField = sys.intern(NameField + "." + Vocabulary)
+        self.CompileActionField = sys.intern(CompileActionField)
         self.HelpField = HelpField
-        self.PrevRowLocField = PrevRowLocField
-        self.RowLocField = RowLocField
-        self.LinkField = LinkField
         self.IndexField = IndexField
         self.ParamField = ParamField
         self.DataField = DataField
         self.ParamFieldStart = 0
-        self.ParamFieldStartFrom = 0
-
+        self.InlineField = False
+        # The decoded instructions of a direct-threaded colon definition (see Interpreter.makeThreaded)
+        self.ThreadedField = None
+
+    @property
+    def PrevRowLocField(self):
+        return self.IndexField - 1
+
+    @property
+    def RowLocField(self):
+        return self.IndexField
+
+    @property
+    def LinkField(self):
+        return self.IndexField - 1
+
+    # A copy with its own parameter and data fields
+    def copy(self):
+        cw = CreoleWord.__new__(CreoleWord)
+        for slot in CreoleWord.__slots__:
+            setattr(cw, slot, getattr(self, slot))
+        if (type(cw.ParamField) == list):
+            cw.ParamField = list(cw.ParamField)
+        if (type(cw.DataField) == list):
+            cw.DataField = list(cw.DataField)
+        return cw
+
+    # The parameter field as a list that can be added to
+    def ownParamField(self):
+        if (type(self.ParamField) == tuple):
+            self.ParamField = list(self.ParamField)
+        return self.ParamField
+
+    # The data field as a list that can be added to
+    def ownDataField(self):
+        if (type(self.DataField) == tuple):
+            self.DataField = list(self.DataField)
+        return self.DataField
+
+# Raises ValueError for a coroutine function. A primitive that waits does its stack effects straight away and passes
+# just the waiting to gsp.awaitLater - a coroutine run later would take its arguments after the words that follow it.
 def buildPrimitive(self, name, cf, cfs, vocab, compAction, help):
-    params = []
-    data = []
+    if (inspect.iscoroutinefunction(cf)):
+        raise ValueError("Error: " + name + " is a coroutine function - have it call gsp.awaitLater instead")
+    params = EmptyField
+    data = EmptyField
     cw = CreoleWord(name, cf, cfs, vocab, compAction, help, len(self.Address) - 1, 
     len(self.Address) , len(self.Address) -1, len(self.Address), params, data)
     fqName = name + "." + vocab
     self.Dict[fqName] = cw
     self.Address.append(cw)
+    self.clearLookupCache()
 
 def buildHighLevel(self, gsp, code, help):
     gsp.InputArea = code
@@ -982,136 +3052,454 @@ def buildHighLevel(self, gsp, code, help):
     gsp.PADarea = []
     self.Modules.Interpreter.doParseInput(gsp)
     self.Modules.Interpreter.doOuter(gsp)
-    self.Address[len(self.Address) - 1].HelpField = help
-    newDef = self.Address[len(self.Address) - 1]
+    newDef = self.ownWord(len(self.Address) - 1)
+    newDef.HelpField = help
     self.Dict[newDef.fqNameField] = newDef
 
+# Version of the dictionary image format written by saveImage
+IMAGE_VERSION = 1
+
+# Saves the dictionary, vocabularies and the vocabulary stack to an image file that loadInterpreter can start a new
+# interpreter from without compiling anything. Code fields are saved as their CodeFieldStr and looked up again when
+# the image is loaded. Raises ValueError (before anything is written) if a parameter or data field holds a value that
+# can't be saved - see imageValue.
+def saveImage(self, gsp, fileName):
+    words = []
+    for cw in self.Address:
+        words.append(wordToImageEntry(cw))
+    dictEntries = []
+    for fqName in self.Dict:
+        dictEntries.append([fqName, self.Dict[fqName].IndexField])
+    image = {"ImageVersion": IMAGE_VERSION, "VocabStack": gsp.VocabStack, "CurrentVocab": gsp.CurrentVocab,
+             "Address": words, "Dict": dictEntries}
+    imageText = json.dumps(image, default=imageValue)
+    with open(fileName, "w") as f:
+        f.write(imageText)
+
+# The JSON form of a parameter or data field value that JSON can't hold itself, for images and the script cache.
+# Vectors are saved with their element type so imageObject can turn them back into vectors. Raises ValueError for
+# anything else, rather than saving something that would load as a different value.
+def imageValue(val):
+    if (numpy != None and isinstance(val, numpy.generic)):
+        return val.item()
+    if (VectorType != None and type(val) == VectorType):
+        return {"Vector": val.tolist(), "DType": str(val.dtype)}
+    raise ValueError("Error: a " + type(val).__name__ + " value (" + str(val) + ") can't be saved in an image")
+
+# Turns the vectors saved by imageValue back into vectors as an image or cached script is read. Raises ValueError if
+# there's a vector but numpy isn't installed.
+def imageObject(obj):
+    if (len(obj) == 2 and "Vector" in obj and "DType" in obj):
+        if (numpy == None):
+            raise ValueError("Error: the image holds vectors, which need numpy")
+        return numpy.array(obj["Vector"], dtype=obj["DType"])
+    return obj
+
+# Converts a dictionary entry to the form it's saved in by saveImage and the script cache. The parameter and data
+# fields are copied, as the script cache keeps entries until the whole script has run and the script can go on to add
+# to the word with , or !.
+def wordToImageEntry(cw):
+    if (cw == None):
+        return None
+    return {"NameField": cw.NameField, "CodeFieldStr": cw.CodeFieldStr, "Vocabulary": cw.Vocabulary,
+            "fqNameField": cw.fqNameField, "CompileActionField": cw.CompileActionField, "HelpField": cw.HelpField,
+            "PrevRowLocField": cw.PrevRowLocField, "RowLocField": cw.RowLocField, "LinkField": cw.LinkField,
+            "IndexField": cw.IndexField, "ParamField": list(cw.ParamField), "DataField": list(cw.DataField),
+            "ParamFieldStart": cw.ParamFieldStart, "ParamFieldStartFrom": cw.ParamFieldStartFrom,
+            "InlineField": cw.InlineField}
+
+# Rebuilds a dictionary entry saved by wordToImageEntry, looking its code field up by CodeFieldStr. Raises ValueError
+# if the code field doesn't exist. Colon definitions are left on doColon - see threadWord.
+def imageEntryToWord(cfb, entry):
+    if (entry == None):
+        return None
+    codeFieldParts = entry["CodeFieldStr"].split(".")
+    codeField = None
+    if (len(codeFieldParts) == 2):
+        codeField = getattr(getattr(cfb.Modules, codeFieldParts[0], None), codeFieldParts[1], None)
+    if (codeField == None):
+        raise ValueError("Error: unknown code field " + entry["CodeFieldStr"] + " for " + entry["fqNameField"])
+    cw = CreoleWord(entry["NameField"], codeField, entry["CodeFieldStr"], entry["Vocabulary"], entry["CompileActionField"],
+                    entry["HelpField"], entry["PrevRowLocField"], entry["RowLocField"], entry["LinkField"], entry["IndexField"],
+                    entry["ParamField"], entry["DataField"])
+    cw.fqNameField = sys.intern(entry["fqNameField"])
+    cw.ParamFieldStart = entry["ParamFieldStart"]
+    cw.InlineField = entry.get("InlineField", False)
+    return cw
+
+# Replaces the code field of a colon definition rebuilt from an image with threaded code, if threading is on
+def threadWord(gsp, cw):
+    if (gsp.DirectThreading and cw != None and cw.CodeFieldStr == "Interpreter.doColon"):
+        threadedCode = gsp.cfb.Modules.Interpreter.makeThreaded(gsp, cw)
+        if (threadedCode != None):
+            cw.CodeField = threadedCode
+
 CreoleForthBundle.buildPrimitive = buildPrimitive
 CreoleForthBundle.buildHighLevel = buildHighLevel
-
+CreoleForthBundle.saveImage = saveImage
+
+# Builds the core primitives and high-level definitions into a dictionary
+def buildCoreDefs(cfb, gsp):
+    # The onlies
+    cfb.buildPrimitive("ONLY", cfb.Modules.Interpreter.doOnly, "Interpreter.doOnly", "ONLY", "EXECUTE","( -- ) Empties the vocabulary stack, then puts ONLY on it")
+    cfb.buildPrimitive("FORTH", cfb.Modules.Interpreter.doForth, "Interpreter.doForth", "ONLY", "EXECUTE","( -- ) Puts FORTH on the vocabulary stack")
+    cfb.buildPrimitive("APPSPEC", cfb.Modules.Interpreter.doAppSpec, "Interpreter.doAppSpec", "ONLY", "EXECUTE","( -- ) Puts APPSPEC on the vocabulary stack")
+    cfb.buildPrimitive("NOP", cfb.Modules.CorePrims.doNOP, "CorePrims.doNOP", "ONLY", "COMPINPF","( -- ) Do-nothing primitive which is surprisingly useful")
+    cfb.buildPrimitive("__#EOL#__", cfb.Modules.CorePrims.doNOP, "CorePrims.doNOP", "ONLY", "NOP","( -- ) EOL marker")
+
+    # dialogs and help
+    cfb.buildPrimitive("HELLO", cfb.Modules.CorePrims.doHello, "CorePrims.doHello", "FORTH", "COMPINPF","( -- ) prints out Hello World")
+    cfb.buildPrimitive("TULIP", cfb.Modules.CorePrims.doTulip, "CorePrims.doTulip", "FORTH", "COMPINPF","( -- ) Either prints Tulip or pops up a message")
+    cfb.buildPrimitive("MSGBOX", cfb.Modules.CorePrims.doMsgBox, "CorePrims.doMsgBox", "FORTH", "COMPINPF","( msg -- ) Pops up an alert saying the message")
+
+    cfb.buildPrimitive("EVAL", cfb.Modules.CorePrims.doEval, "CorePrims.doEval", "FORTH", "COMPINPF","( code -- ) Evaluates raw JavaScript code - only allows alerts")
+    cfb.buildPrimitive("WORDS", cfb.Modules.Interpreter.doWords, "Interpreter.doWords", "FORTH", "COMPINPF","( -- ) Lists the words in each vocabulary on the search order, newest first")
+    cfb.buildPrimitive("VLIST", cfb.Modules.CorePrims.doVList, "CorePrims.doVList", "FORTH", "COMPINPF","( -- ) Lists the dictionary definitions")
+
+    # Profiling
+    cfb.buildPrimitive("PROFILE-ON", cfb.Modules.Interpreter.doProfileOn, "Interpreter.doProfileOn", "FORTH", "COMPINPF","( -- ) Starts (or resumes) recording call counts and times for every word executed")
+    cfb.buildPrimitive("PROFILE-OFF", cfb.Modules.Interpreter.doProfileOff, "Interpreter.doProfileOff", "FORTH", "COMPINPF","( -- ) Stops recording word timings")
+    cfb.buildPrimitive("PROFILE-RESET", cfb.Modules.Interpreter.doProfileReset, "Interpreter.doProfileReset", "FORTH", "COMPINPF","( -- ) Throws away the word timings recorded so far")
+    cfb.buildPrimitive(".PROFILE", cfb.Modules.Interpreter.doDotProfile, "Interpreter.doDotProfile", "FORTH", "COMPINPF","( -- ) Prints the recorded word timings, slowest self time first")
+
+    # Basic math
+    cfb.buildPrimitive("+", cfb.Modules.CorePrims.doPlus, "CorePrims.doPlus", "FORTH", "COMPINPF","( n1 n2 -- sum ) Adds two numbers on the stack")
+    cfb.buildPrimitive("-", cfb.Modules.CorePrims.doMinus, "CorePrims.doMinus", "FORTH", "COMPINPF","( n1 n2 -- difference ) Subtracts two numbers on the stack")
+    cfb.buildPrimitive("*", cfb.Modules.CorePrims.doMultiply, "CorePrims.doMultiply", "FORTH", "COMPINPF","( n1 n2 -- product ) Multiplies two numbers on the stack")
+    cfb.buildPrimitive("/", cfb.Modules.CorePrims.doDivide, "CorePrims.doDivide", "FORTH", "COMPINPF","( n1 n2 -- quotient ) Divides two numbers on the stack")
+    cfb.buildPrimitive("%", cfb.Modules.CorePrims.doMod, "CorePrims.doMod", "FORTH", "COMPINPF","( n1 n2 -- remainder ) Returns remainder of division operation")
+    cfb.buildPrimitive("MOD", cfb.Modules.CorePrims.doMod, "CorePrims.doMod", "FORTH", "COMPINPF","( n1 n2 -- remainder ) Returns remainder of floored integer division")
+    cfb.buildPrimitive("/MOD", cfb.Modules.CorePrims.doSlashMod, "CorePrims.doSlashMod", "FORTH", "COMPINPF","( n1 n2 -- remainder quotient ) Floored integer division")
+    cfb.buildPrimitive("*/", cfb.Modules.CorePrims.doStarSlash, "CorePrims.doStarSlash", "FORTH", "COMPINPF","( n1 n2 n3 -- quotient ) Multiplies n1 by n2 exactly, then does a floored division by n3")
+    cfb.buildPrimitive("*/MOD", cfb.Modules.CorePrims.doStarSlashMod, "CorePrims.doStarSlashMod", "FORTH", "COMPINPF","( n1 n2 n3 -- remainder quotient ) As */, leaving the remainder as well")
+
+    # Date/time handling
+    cfb.buildPrimitive("TODAY", cfb.Modules.CorePrims.doToday, "CorePrims.doToday", "FORTH", "COMPINPF","( -- ) Pops up today's date")
+    cfb.buildPrimitive("NOW", cfb.Modules.CorePrims.doNow, "CorePrims.doNow", "FORTH", "COMPINPF","( --  time ) Puts the time on the stack")
+    cfb.buildPrimitive(">HHMMSS", cfb.Modules.CorePrims.doToHoursMinSecs, "CorePrims.doToHoursMinSecs", "FORTH", "COMPINPF","( time -- ) Formats the time")
+
+    # Stack manipulation
+    cfb.buildPrimitive("DUP", cfb.Modules.CorePrims.doDup, "CorePrims.doDup", "FORTH", "COMPINPF","( val --  val val ) Duplicates the argument on top of the stack")
+    cfb.buildPrimitive("SWAP", cfb.Modules.CorePrims.doSwap, "CorePrims.doSwap", "FORTH", "COMPINPF","( val1 val2 -- val2 val1 ) Swaps the positions of the top two stack arguments")
+    cfb.buildPrimitive("ROT", cfb.Modules.CorePrims.doRot, "CorePrims.doRot", "FORTH", "COMPINPF","( val1 val2 val3 -- val2 val3 val1 ) Moves the third stack argument to the top")
+    cfb.buildPrimitive("-ROT", cfb.Modules.CorePrims.doMinusRot, "CorePrims.doMinusRot", "FORTH", "COMPINPF","( val1 val2 val3 -- val3 val1 val2 ) Moves the top stack argument to the third position")
+    cfb.buildPrimitive("NIP", cfb.Modules.CorePrims.doNip, "CorePrims.doNip", "FORTH", "COMPINPF","( val1 val2 -- val2 ) Removes second stack argument")
+    cfb.buildPrimitive("TUCK", cfb.Modules.CorePrims.doTuck, "CorePrims.doTuck", "FORTH", "COMPINPF","( val1 val2 -- val2 val1 val2 ) Copies top stack argument under second argument")
+    cfb.buildPrimitive("OVER", cfb.Modules.CorePrims.doOver, "CorePrims.doOver", "FORTH", "COMPINPF","( val1 val2 -- val1 val2 val1 ) Copies second stack argument to the top of the stack")
+    cfb.buildPrimitive("DROP", cfb.Modules.CorePrims.doDrop, "CorePrims.doDrop", "FORTH", "COMPINPF","( val -- ) Drops the argument at the top of the stack")
+    cfb.buildPrimitive(".", cfb.Modules.CorePrims.doDot, "CorePrims.doDot", "FORTH", "COMPINPF","( val -- ) Prints the argument at the top of the stack")
+    cfb.buildPrimitive("SLEEP", cfb.Modules.CorePrims.doSleep, "CorePrims.doSleep", "FORTH", "COMPINPF","( ms -- ) Waits for ms milliseconds. Under doOuterAsync other tasks carry on in the meantime")
+    cfb.buildPrimitive("DEPTH", cfb.Modules.CorePrims.doDepth, "CorePrims.doDepth", "FORTH", "COMPINPF","( -- n ) Returns the stack depth")
+
+    # Logical operatives
+    cfb.buildPrimitive("=", cfb.Modules.LogicOps.doEquals, "LogicOps.doEquals", "FORTH", "COMPINPF","( val1 val2 -- flag ) -1 if equal, 0 otherwise")
+    cfb.buildPrimitive("<>", cfb.Modules.LogicOps.doNotEquals, "LogicOps.doNotEquals", "FORTH", "COMPINPF","( val1 val2 -- flag ) 0 if equal, -1 otherwise")
+    cfb.buildPrimitive("<", cfb.Modules.LogicOps.doLessThan, "LogicOps.doLessThan", "FORTH", "COMPINPF","( val1 val2 -- flag ) -1 if less than, 0 otherwise")
+    cfb.buildPrimitive(">", cfb.Modules.LogicOps.doGreaterThan, "LogicOps.doGreaterThan", "FORTH", "COMPINPF","( val1 val2 -- flag ) -1 if greater than, 0 otherwise")
+    cfb.buildPrimitive("<=", cfb.Modules.LogicOps.doLessThanOrEquals, "LogicOps.doLessThanOrEquals", "FORTH", "COMPINPF","( val1 val2 -- flag ) -1 if less than or equal to, 0 otherwise")
+    cfb.buildPrimitive(">=", cfb.Modules.LogicOps.doGreaterThanOrEquals, "LogicOps.doGreaterThanOrEquals", "FORTH", "COMPINPF","( val1 val2 -- flag ) -1 if greater than or equal to, 0 otherwise")
+    cfb.buildPrimitive("NOT", cfb.Modules.LogicOps.doNot, "LogicOps.doNot", "FORTH", "COMPINPF","( val -- opval ) -1 if 0, 0 otherwise")
+    cfb.buildPrimitive("AND", cfb.Modules.LogicOps.doAnd, "LogicOps.doAnd", "FORTH", "COMPINPF","( val1 val2 -- flag ) -1 if both arguments are non-zero, 0 otherwise")
+    cfb.buildPrimitive("OR", cfb.Modules.LogicOps.doOr, "LogicOps.doOr", "FORTH", "COMPINPF","( val1 val2 -- flag ) -1 if one or both arguments are non-zero, 0 otherwise")
+    cfb.buildPrimitive("XOR", cfb.Modules.LogicOps.doXor, "LogicOps.doXor", "FORTH", "COMPINPF","( val1 val2 -- flag ) -1 if one and only one argument is non-zero, 0 otherwise")
+
+    # Numeric data stack
+    cfb.buildPrimitive("INT-STACK", cfb.Modules.NumericOps.doIntStack, "NumericOps.doIntStack", "FORTH", "COMPINPF","( -- ) Switches to an integer data stack of BFC.NumericStackSize cells")
+    cfb.buildPrimitive("FLOAT-STACK", cfb.Modules.NumericOps.doFloatStack, "NumericOps.doFloatStack", "FORTH", "COMPINPF","( -- ) Switches to a float data stack of BFC.NumericStackSize cells")
+    cfb.buildPrimitive("LIST-STACK", cfb.Modules.NumericOps.doListStack, "NumericOps.doListStack", "FORTH", "COMPINPF","( -- ) Switches back to the usual data stack")
+    cfb.buildPrimitive("+", cfb.Modules.NumericOps.doPlus, "NumericOps.doPlus", "NUMERIC", "COMPINPF","( n1 n2 -- sum ) Adds two numbers on the stack")
+    cfb.buildPrimitive("-", cfb.Modules.NumericOps.doMinus, "NumericOps.doMinus", "NUMERIC", "COMPINPF","( n1 n2 -- difference ) Subtracts two numbers on the stack")
+    cfb.buildPrimitive("*", cfb.Modules.NumericOps.doMultiply, "NumericOps.doMultiply", "NUMERIC", "COMPINPF","( n1 n2 -- product ) Multiplies two numbers on the stack")
+    cfb.buildPrimitive("/", cfb.Modules.NumericOps.doDivide, "NumericOps.doDivide", "NUMERIC", "COMPINPF","( n1 n2 -- quotient ) Divides two numbers on the stack: floored on an integer stack, exact on a float one")
+    cfb.buildPrimitive("MOD", cfb.Modules.NumericOps.doMod, "NumericOps.doMod", "NUMERIC", "COMPINPF","( n1 n2 -- remainder ) Returns remainder of floored division")
+    cfb.buildPrimitive("=", cfb.Modules.NumericOps.doEquals, "NumericOps.doEquals", "NUMERIC", "COMPINPF","( val1 val2 -- flag ) -1 if equal, 0 otherwise")
+    cfb.buildPrimitive("<>", cfb.Modules.NumericOps.doNotEquals, "NumericOps.doNotEquals", "NUMERIC", "COMPINPF","( val1 val2 -- flag ) 0 if equal, -1 otherwise")
+    cfb.buildPrimitive("<", cfb.Modules.NumericOps.doLessThan, "NumericOps.doLessThan", "NUMERIC", "COMPINPF","( val1 val2 -- flag ) -1 if less than, 0 otherwise")
+    cfb.buildPrimitive(">", cfb.Modules.NumericOps.doGreaterThan, "NumericOps.doGreaterThan", "NUMERIC", "COMPINPF","( val1 val2 -- flag ) -1 if greater than, 0 otherwise")
+    cfb.buildPrimitive("<=", cfb.Modules.NumericOps.doLessThanOrEquals, "NumericOps.doLessThanOrEquals", "NUMERIC", "COMPINPF","( val1 val2 -- flag ) -1 if less than or equal to, 0 otherwise")
+    cfb.buildPrimitive(">=", cfb.Modules.NumericOps.doGreaterThanOrEquals, "NumericOps.doGreaterThanOrEquals", "NUMERIC", "COMPINPF","( val1 val2 -- flag ) -1 if greater than or equal to, 0 otherwise")
+    cfb.buildPrimitive("DUP", cfb.Modules.NumericOps.doDup, "NumericOps.doDup", "NUMERIC", "COMPINPF","( val --  val val ) Duplicates the argument on top of the stack")
+    cfb.buildPrimitive("OVER", cfb.Modules.NumericOps.doOver, "NumericOps.doOver", "NUMERIC", "COMPINPF","( val1 val2 -- val1 val2 val1 ) Copies second stack argument to the top of the stack")
+    cfb.buildPrimitive("DROP", cfb.Modules.NumericOps.doDrop, "NumericOps.doDrop", "NUMERIC", "COMPINPF","( val -- ) Drops the argument at the top of the stack")
+    cfb.buildPrimitive("SWAP", cfb.Modules.NumericOps.doSwap, "NumericOps.doSwap", "NUMERIC", "COMPINPF","( val1 val2 -- val2 val1 ) Swaps the positions of the top two stack arguments")
+    cfb.buildPrimitive("NIP", cfb.Modules.NumericOps.doNip, "NumericOps.doNip", "NUMERIC", "COMPINPF","( val1 val2 -- val2 ) Removes second stack argument")
+    cfb.buildPrimitive("ROT", cfb.Modules.NumericOps.doRot, "NumericOps.doRot", "NUMERIC", "COMPINPF","( val1 val2 val3 -- val2 val3 val1 ) Moves the third stack argument to the top")
+
+    # Vectors (need numpy)
+    cfb.buildPrimitive(">VECTOR", cfb.Modules.VectorOps.doToVector, "VectorOps.doToVector", "FORTH", "COMPINPF","( list -- vec ) Makes a vector from a list compiled by { }")
+    cfb.buildPrimitive("RANGE", cfb.Modules.VectorOps.doRange, "VectorOps.doRange", "FORTH", "COMPINPF","( start end -- vec ) Makes a vector of the integers from start up to (but not including) end")
+    cfb.buildPrimitive("LOAD-VECTOR", cfb.Modules.VectorOps.doLoadVector, "VectorOps.doLoadVector", "FORTH", "COMPINPF","LOAD-VECTOR <file>. Reads a vector from a text file of numbers separated by whitespace or commas")
+    cfb.buildPrimitive("LENGTH", cfb.Modules.VectorOps.doLength, "VectorOps.doLength", "FORTH", "COMPINPF","( vec -- n ) Number of elements in a vector")
+    cfb.buildPrimitive("SUM", cfb.Modules.VectorOps.doSum, "VectorOps.doSum", "FORTH", "COMPINPF","( vec -- sum ) Adds up the elements of a vector")
+    cfb.buildPrimitive("MEAN", cfb.Modules.VectorOps.doMean, "VectorOps.doMean", "FORTH", "COMPINPF","( vec -- mean ) Average of the elements of a vector")
+    cfb.buildPrimitive("MIN", cfb.Modules.VectorOps.doMin, "VectorOps.doMin", "FORTH", "COMPINPF","( vec -- min ) or ( n1 n2 -- min ) Smallest element of a vector, or the smaller of two numbers")
+    cfb.buildPrimitive("MAX", cfb.Modules.VectorOps.doMax, "VectorOps.doMax", "FORTH", "COMPINPF","( vec -- max ) or ( n1 n2 -- max ) Largest element of a vector, or the larger of two numbers")
+    cfb.buildPrimitive("DOT", cfb.Modules.VectorOps.doDot, "VectorOps.doDot", "FORTH", "COMPINPF","( vec1 vec2 -- n ) Dot product of two vectors")
+    cfb.buildPrimitive("NTH", cfb.Modules.VectorOps.doNth, "VectorOps.doNth", "FORTH", "COMPINPF","( vec i -- val ) Element i of a vector. Negative indexes count from the end")
+    cfb.buildPrimitive("SLICE", cfb.Modules.VectorOps.doSlice, "VectorOps.doSlice", "FORTH", "COMPINPF","( vec start end -- vec ) Elements start up to (but not including) end of a vector")
+    cfb.buildPrimitive("SELECT", cfb.Modules.VectorOps.doSelect, "VectorOps.doSelect", "FORTH", "COMPINPF","( vec flags -- vec ) Elements of a vector where the flags from a comparison are non-zero")
+
+    # Compiler definitions
+    cfb.buildPrimitive(",", cfb.Modules.Compiler.doComma, "Compiler.doComma", "FORTH", "COMPINPF","( n --) Compiles value off the TOS into the next parameter field cell")
+    cfb.buildPrimitive("COMPINPF", cfb.Modules.Compiler.doComma, "Compiler.doComma", "IMMEDIATE", "COMPINPF","( n --) Does the same thing as , (comma) - given a different name for ease of reading")
+    cfb.buildPrimitive("EXECUTE", cfb.Modules.Compiler.doExecute, "Compiler.doExecute", "FORTH", "COMPINPF","( address --) Executes the word corresponding to the address on the stack")
+    cfb.buildPrimitive(":", cfb.Modules.Compiler.compileColon, "Compiler.compileColon", "FORTH", "COMPINPF","( -- ) Starts compilation of a colon definition")
+    cfb.buildPrimitive(";", cfb.Modules.Compiler.doSemi, "Compiler.doSemi", "IMMEDIATE", "EXECUTE","( -- ) Terminates compilation of a colon definition")
+    cfb.buildPrimitive("COMPLIT", cfb.Modules.Compiler.compileLiteral, "Compiler.compileLiteral", "IMMEDIATE", "EXECUTE","( -- ) Compiles doLit and a literal into the dictionary")
+    cfb.buildPrimitive("doLiteral", cfb.Modules.Compiler.doLiteral, "Compiler.doLiteral", "IMMEDIATE", "NOP","( -- lit ) Run-time code that pushes a literal onto the stack")
+    cfb.buildPrimitive("HERE", cfb.Modules.Compiler.doHere, "Compiler.doHere", "FORTH", "COMPINPF","( -- location ) Returns address of the next available dictionary location")
+    cfb.buildPrimitive("CREATE", cfb.Modules.Compiler.doCreate, "Compiler.doCreate", "FORTH", "COMPINPF","CREATE <name>. Adds a named entry into the dictionary")
+    cfb.buildPrimitive("doDoes", cfb.Modules.Compiler.doDoes, "Compiler.doDoes", "IMMEDIATE", "COMPINPF", "( address -- ) Run-time code for DOES>");
+    cfb.buildPrimitive("DOES>", cfb.Modules.Compiler.compileDoes, "Compiler.compileDoes", "FORTH", "COMPINPF", 
+                        "DOES> <list of runtime actions>. When defining word is created, copies code following it into the child definition")
+    cfb.buildPrimitive("@", cfb.Modules.Compiler.doFetch, "Compiler.doFetch", "FORTH", "COMPINPF","( addr -- val ) Fetches the value in the param field  at addr")
+    cfb.buildPrimitive("!", cfb.Modules.Compiler.doStore, "Compiler.doStore", "FORTH", "COMPINPF","( val addr --) Stores the value in the param field  at addr")
+    cfb.buildPrimitive("DEFINITIONS", cfb.Modules.Compiler.doSetCurrentToContext, "Compiler.doSetCurrentToContext", "FORTH",
+    "COMPINPF","(  -- ). Sets the current (compilation) vocabulary to the context vocabulary (the one on top of the vocabulary stack)")
+    cfb.buildPrimitive("SAVE-SYSTEM", cfb.Modules.Compiler.doSaveSystem, "Compiler.doSaveSystem", "FORTH", "COMPINPF","SAVE-SYSTEM <file>. Saves the dictionary to an image file that loadInterpreter can start from")
+    cfb.buildPrimitive("IMMEDIATE", cfb.Modules.Compiler.doImmediate, "Compiler.doImmediate", "FORTH", "COMPINPF","( -- ) Flags a word as immediate (so it executes instead of compiling inside a colon definition)")
+    cfb.buildPrimitive("INLINE", cfb.Modules.Optimizer.doMarkInline, "Optimizer.doMarkInline", "FORTH", "COMPINPF","( -- ) Flags a word to be inlined into the colon definitions that call it")
+    cfb.buildPrimitive("RECURSE", cfb.Modules.Compiler.compileRecurse, "Compiler.compileRecurse", "IMMEDIATE", "EXECUTE","( -- ) Compiles a call to the definition being compiled")
+    # Branching compiler definitions
+    cfb.buildPrimitive("IF", cfb.Modules.Compiler.compileIf, "Compiler.compileIf", "IMMEDIATE", "EXECUTE","( -- location ) Compile-time code for IF")
+    cfb.buildPrimitive("ELSE", cfb.Modules.Compiler.compileElse, "Compiler.compileElse", "IMMEDIATE", "EXECUTE","( -- location ) Compile-time code for ELSE")
+    cfb.buildPrimitive("THEN", cfb.Modules.Compiler.compileThen, "Compiler.compileThen", "IMMEDIATE", "EXECUTE","( -- location ) Compile-time code for THEN")
+    cfb.buildPrimitive("0BRANCH", cfb.Modules.Compiler.do0Branch, "Compiler.do0Branch", "IMMEDIATE", "NOP","( flag -- ) Run-time code for IF")
+    cfb.buildPrimitive("JUMP", cfb.Modules.Compiler.doJump, "Compiler.doJump", "IMMEDIATE", "NOP", 
+    "( -- ) Jumps unconditionally to the parameter field location next to it and is compiled by ELSE")
+    cfb.buildPrimitive("doElse", cfb.Modules.CorePrims.doNOP, "CorePrims.doNOP", "IMMEDIATE", "NOP","( -- ) Run-time code for ELSE")
+    cfb.buildPrimitive("doThen", cfb.Modules.CorePrims.doNOP, "CorePrims.doNOP", "IMMEDIATE", "NOP","( -- ) Run-time code for THEN")
+    cfb.buildPrimitive("BEGIN", cfb.Modules.Compiler.compileBegin, "Compiler.compileBegin", "IMMEDIATE", "EXECUTE","( -- beginLoc ) Compile-time code for BEGIN")
+    cfb.buildPrimitive("UNTIL", cfb.Modules.Compiler.compileUntil, "Compiler.compileUntil", "IMMEDIATE", "EXECUTE","( beginLoc -- ) Compile-time code for UNTIL")
+    cfb.buildPrimitive("doBegin", cfb.Modules.CorePrims.doNOP, "CorePrims.doNOP", "IMMEDIATE", "NOP","( -- ) Run-time code for BEGIN")
+    cfb.buildPrimitive("DO", cfb.Modules.Compiler.compileDo, "Compiler.compileDo", "IMMEDIATE", "EXECUTE","( -- beginLoc ) Compile-time code for DO")
+    cfb.buildPrimitive("LOOP", cfb.Modules.Compiler.compileLoop, "Compiler.compileLoop", "IMMEDIATE", "EXECUTE","( -- beginLoc ) Compile-time code for LOOP")
+    cfb.buildPrimitive("+LOOP", cfb.Modules.Compiler.compilePlusLoop, "Compiler.compilePlusLoop", "IMMEDIATE", "EXECUTE","( -- beginLoc ) Compile-time code for +LOOP")
+    cfb.buildPrimitive("doStartDo", cfb.Modules.Compiler.doStartDo, "Compiler.doStartDo", "IMMEDIATE", "COMPINPF","( limit start -- ) Starts off the Do by getting the start and end")
+    cfb.buildPrimitive("doDo", cfb.Modules.CorePrims.doNOP, "CorePrims.doNOP", "IMMEDIATE", "COMPINPF","( -- ) Marker for DoLoop to return to")
+    cfb.buildPrimitive("doLoop", cfb.Modules.Compiler.doLoop, "Compiler.doLoop", "IMMEDIATE", "COMPINPF","( -- ) Loops back to doDo until the start equals the end")
+    cfb.buildPrimitive("doPlusLoop", cfb.Modules.Compiler.doPlusLoop, "Compiler.doPlusLoop", "IMMEDIATE", "COMPINPF","( inc -- ) Loops back to doDo until the index crosses the limit and increments with inc")
+    cfb.buildPrimitive("?DO", cfb.Modules.Compiler.compileQDo, "Compiler.compileQDo", "IMMEDIATE", "EXECUTE","( -- beginLoc ) Compile-time code for ?DO")
+    cfb.buildPrimitive("doStartQDo", cfb.Modules.Compiler.doStartQDo, "Compiler.doStartQDo", "IMMEDIATE", "NOP","( limit start -- ) Starts a ?DO loop, or skips it if the start and limit are the same")
+    cfb.buildPrimitive("LEAVE", cfb.Modules.Compiler.compileLeave, "Compiler.compileLeave", "IMMEDIATE", "EXECUTE","( -- ) Compile-time code for LEAVE")
+    cfb.buildPrimitive("doLeave", cfb.Modules.Compiler.doLeave, "Compiler.doLeave", "IMMEDIATE", "NOP","( -- ) Run-time code for LEAVE: drops the innermost loop and jumps past its LOOP")
+    cfb.buildPrimitive("UNLOOP", cfb.Modules.Compiler.doUnloop, "Compiler.doUnloop", "FORTH", "COMPINPF","( -- ) Drops the innermost loop frame, so a definition can EXIT from inside a loop")
+    cfb.buildPrimitive("EXIT", cfb.Modules.Compiler.doExit, "Compiler.doExit", "FORTH", "COMPINPF","( -- ) Returns from the colon definition it's in")
+    cfb.buildPrimitive("I", cfb.Modules.Compiler.doIndexI, "Compiler.doIndexI", "FORTH", "COMPINPF","( -- index ) Returns the index of the innermost loop")
+    cfb.buildPrimitive("J", cfb.Modules.Compiler.doIndexJ, "Compiler.doIndexJ", "FORTH", "COMPINPF","( -- index ) Returns the index of the next loop out")
+    cfb.buildPrimitive("K", cfb.Modules.Compiler.doIndexK, "Compiler.doIndexK", "FORTH", "COMPINPF","( -- index ) Returns the index of the loop out from that")
+
+    # Superinstructions compiled by the peephole optimizer
+    cfb.buildPrimitive("doLitPlus", cfb.Modules.Optimizer.doLitPlus, "Optimizer.doLitPlus", "IMMEDIATE", "NOP","( n -- sum ) Superinstruction for a literal followed by +")
+    cfb.buildPrimitive("doDupPlus", cfb.Modules.Optimizer.doDupPlus, "Optimizer.doDupPlus", "IMMEDIATE", "NOP","( n -- sum ) Superinstruction for DUP +")
+    cfb.buildPrimitive("doOverOver", cfb.Modules.Optimizer.doOverOver, "Optimizer.doOverOver", "IMMEDIATE", "NOP","( val1 val2 -- val1 val2 val1 val2 ) Superinstruction for OVER OVER")
+    cfb.buildPrimitive("doEquals0Branch", cfb.Modules.Optimizer.doEquals0Branch, "Optimizer.doEquals0Branch", "IMMEDIATE", "NOP","( val1 val2 -- ) Superinstruction for = 0BRANCH: branches unless the top two values are equal")
+
+    # Commenting and list compiler
+    cfb.buildPrimitive("//", cfb.Modules.Compiler.doSingleLineCmts, "Compiler.doSingleLineCmts", "FORTH", gsp.BFC.ExecZeroAction,"( -- ) Single-line comment handling")
+    cfb.buildPrimitive("(", cfb.Modules.Compiler.doParenCmts, "Compiler.doParenCmts", "FORTH", gsp.BFC.ExecZeroAction,"( -- ) Multiline comment handling")
+    cfb.buildPrimitive("{", cfb.Modules.Compiler.compileList, "Compiler.compileList", "FORTH", gsp.BFC.ExecZeroAction,"( -- list ) List compiler")
+
+    # cfb.buildHighLevel(gsp,": x  NOP ;", "Executing a colon")
+    cfb.buildHighLevel(gsp,": HT IF HELLO ELSE TULIP THEN ;", "My first high-level definition")
+    cfb.buildHighLevel(gsp,": HT2 NOP NOP NOP ;", "My second high-level definition")
+    cfb.buildHighLevel(gsp,": TLIT 3 4 5 ;", "Testing literals")
+    cfb.buildHighLevel(gsp,": TESTBU BEGIN 1 + DUP 10 TULIP > UNTIL . ;", "Testing BEGIN UNTIL")
+    cfb.buildHighLevel(gsp,": TDL DO HELLO LOOP ;", "Testing DO LOOP")
+    cfb.buildHighLevel(gsp,": CONSTANT CREATE , DOES> @ ;", "The quintessential defining word")
+    cfb.buildHighLevel(gsp,": H3 HELLO HELLO HELLO ;", "3 hellos")
+
+# Modules are stateless groupings of primitives, so every interpreter shares the same ones
 coreprims = CorePrims()
 interpreter = Interpreter()
 compiler = Compiler()
 logicops = LogicOps()
+optimizer = Optimizer()
+vectorops = VectorOps()
+numericops = NumericOps()
 appspec = AppSpec()
-modules = Modules(coreprims, interpreter, compiler, logicops, appspec)
+modules = Modules(coreprims, interpreter, compiler, logicops, optimizer, vectorops, numericops, appspec)
+
+# Sets up the vocabulary stack and compilation vocabulary of a new interpreter
+def initVocabs(gsp):
+    gsp.VocabStack.append("ONLY")
+    gsp.VocabStack.append("FORTH")
+    gsp.VocabStack.append("APPSPEC")
+    gsp.CurrentVocab = "FORTH"
+
+# The default interpreter
 cfb1 = CreoleForthBundle()
 cfb1.Modules = modules
 gsp = GlobalSimpleProps(cfb1)
-gsp.VocabStack.append("ONLY")
-gsp.VocabStack.append("FORTH")
-gsp.VocabStack.append("APPSPEC")
-gsp.CurrentVocab = "FORTH"
-gsp.cfb = cfb1
-
-# The onlies
-cfb1.buildPrimitive("ONLY", cfb1.Modules.Interpreter.doOnly, "Interpreter.doOnly", "ONLY", "EXECUTE","( -- ) Empties the vocabulary stack, then puts ONLY on it")
-cfb1.buildPrimitive("FORTH", cfb1.Modules.Interpreter.doForth, "Interpreter.doForth", "ONLY", "EXECUTE","( -- ) Puts FORTH on the vocabulary stack")
-cfb1.buildPrimitive("APPSPEC", cfb1.Modules.Interpreter.doAppSpec, "Interpreter.doAppSpec", "ONLY", "EXECUTE","( -- ) Puts APPSPEC on the vocabulary stack")
-cfb1.buildPrimitive("NOP", cfb1.Modules.CorePrims.doNOP, "CorePrims.doNOP", "ONLY", "COMPINPF","( -- ) Do-nothing primitive which is surprisingly useful")
-cfb1.buildPrimitive("__#EOL#__", cfb1.Modules.CorePrims.doNOP, "CorePrims.doNOP", "ONLY", "NOP","( -- ) EOL marker")
-
-# dialogs and help
-cfb1.buildPrimitive("HELLO", cfb1.Modules.CorePrims.doHello, "CorePrims.doHello", "FORTH", "COMPINPF","( -- ) prints out Hello World")
-cfb1.buildPrimitive("TULIP", cfb1.Modules.CorePrims.doTulip, "CorePrims.doTulip", "FORTH", "COMPINPF","( -- ) Either prints Tulip or pops up a message")
-cfb1.buildPrimitive("MSGBOX", cfb1.Modules.CorePrims.doMsgBox, "CorePrims.doMsgBox", "FORTH", "COMPINPF","( msg -- ) Pops up an alert saying the message")
-
-cfb1.buildPrimitive("EVAL", cfb1.Modules.CorePrims.doEval, "CorePrims.doEval", "FORTH", "COMPINPF","( code -- ) Evaluates raw JavaScript code - only allows alerts")
-cfb1.buildPrimitive("VLIST", cfb1.Modules.CorePrims.doVList, "CorePrims.doVList", "FORTH", "COMPINPF","( -- ) Lists the dictionary definitions")
-
-# Basic math
-cfb1.buildPrimitive("+", cfb1.Modules.CorePrims.doPlus, "CorePrims.doPlus", "FORTH", "COMPINPF","( n1 n2 -- sum ) Adds two numbers on the stack")
-cfb1.buildPrimitive("-", cfb1.Modules.CorePrims.doMinus, "CorePrims.doMinus", "FORTH", "COMPINPF","( n1 n2 -- difference ) Subtracts two numbers on the stack")
-cfb1.buildPrimitive("*", cfb1.Modules.CorePrims.doMultiply, "CorePrims.doMultiply", "FORTH", "COMPINPF","( n1 n2 -- product ) Multiplies two numbers on the stack")
-cfb1.buildPrimitive("/", cfb1.Modules.CorePrims.doDivide, "CorePrims.doDivide", "FORTH", "COMPINPF","( n1 n2 -- quotient ) Divides two numbers on the stack")
-cfb1.buildPrimitive("%", cfb1.Modules.CorePrims.doMod, "CorePrims.doMod", "FORTH", "COMPINPF","( n1 n2 -- remainder ) Returns remainder of division operation")
-
-# Date/time handling
-cfb1.buildPrimitive("TODAY", cfb1.Modules.CorePrims.doToday, "CorePrims.doToday", "FORTH", "COMPINPF","( -- ) Pops up today's date")
-cfb1.buildPrimitive("NOW", cfb1.Modules.CorePrims.doNow, "CorePrims.doNow", "FORTH", "COMPINPF","( --  time ) Puts the time on the stack")
-cfb1.buildPrimitive(">HHMMSS", cfb1.Modules.CorePrims.doToHoursMinSecs, "CorePrims.doToHoursMinSecs", "FORTH", "COMPINPF","( time -- ) Formats the time")
-
-# Stack manipulation
-cfb1.buildPrimitive("DUP", cfb1.Modules.CorePrims.doDup, "CorePrims.doDup", "FORTH", "COMPINPF","( val --  val val ) Duplicates the argument on top of the stack")
-cfb1.buildPrimitive("SWAP", cfb1.Modules.CorePrims.doSwap, "CorePrims.doSwap", "FORTH", "COMPINPF","( val1 val2 -- val2 val1 ) Swaps the positions of the top two stack arguments")
-cfb1.buildPrimitive("ROT", cfb1.Modules.CorePrims.doRot, "CorePrims.doRot", "FORTH", "COMPINPF","( val1 val2 val3 -- val2 val3 val1 ) Moves the third stack argument to the top")
-cfb1.buildPrimitive("-ROT", cfb1.Modules.CorePrims.doMinusRot, "CorePrims.doMinusRot", "FORTH", "COMPINPF","( val1 val2 val3 -- val3 val1 val2 ) Moves the top stack argument to the third position")
-cfb1.buildPrimitive("NIP", cfb1.Modules.CorePrims.doNip, "CorePrims.doNip", "FORTH", "COMPINPF","( val1 val2 -- val2 ) Removes second stack argument")
-cfb1.buildPrimitive("TUCK", cfb1.Modules.CorePrims.doTuck, "CorePrims.doTuck", "FORTH", "COMPINPF","( val1 val2 -- val2 val1 val2 ) Copies top stack argument under second argument")
-cfb1.buildPrimitive("OVER", cfb1.Modules.CorePrims.doOver, "CorePrims.doOver", "FORTH", "COMPINPF","( val1 val2 -- val1 val2 val1 ) Copies second stack argument to the top of the stack")
-cfb1.buildPrimitive("DROP", cfb1.Modules.CorePrims.doDrop, "CorePrims.doDrop", "FORTH", "COMPINPF","( val -- ) Drops the argument at the top of the stack")
-cfb1.buildPrimitive(".", cfb1.Modules.CorePrims.doDot, "CorePrims.doDot", "FORTH", "COMPINPF","( val -- ) Prints the argument at the top of the stack")
-cfb1.buildPrimitive("DEPTH", cfb1.Modules.CorePrims.doDepth, "CorePrims.doDepth", "FORTH", "COMPINPF","( -- n ) Returns the stack depth")
-
-# Logical operatives
-cfb1.buildPrimitive("=", cfb1.Modules.LogicOps.doEquals, "LogicOps.doEquals", "FORTH", "COMPINPF","( val1 val2 -- flag ) -1 if equal, 0 otherwise")
-cfb1.buildPrimitive("<>", cfb1.Modules.LogicOps.doNotEquals, "LogicOps.doNotEquals", "FORTH", "COMPINPF","( val1 val2 -- flag ) 0 if equal, -1 otherwise")
-cfb1.buildPrimitive("<", cfb1.Modules.LogicOps.doLessThan, "LogicOps.doLessThan", "FORTH", "COMPINPF","( val1 val2 -- flag ) -1 if less than, 0 otherwise")
-cfb1.buildPrimitive(">", cfb1.Modules.LogicOps.doGreaterThan, "LogicOps.doGreaterThan", "FORTH", "COMPINPF","( val1 val2 -- flag ) -1 if greater than, 0 otherwise")
-cfb1.buildPrimitive("<=", cfb1.Modules.LogicOps.doLessThanOrEquals, "LogicOps.doLessThanOrEquals", "FORTH", "COMPINPF","( val1 val2 -- flag ) -1 if less than or equal to, 0 otherwise")
-cfb1.buildPrimitive(">=", cfb1.Modules.LogicOps.doGreaterThanOrEquals, "LogicOps.doGreaterThanOrEquals", "FORTH", "COMPINPF","( val1 val2 -- flag ) -1 if greater than or equal to, 0 otherwise")
-cfb1.buildPrimitive("NOT", cfb1.Modules.LogicOps.doNot, "LogicOps.doNot", "FORTH", "COMPINPF","( val -- opval ) -1 if 0, 0 otherwise")
-cfb1.buildPrimitive("AND", cfb1.Modules.LogicOps.doAnd, "LogicOps.doAnd", "FORTH", "COMPINPF","( val1 val2 -- flag ) -1 if both arguments are non-zero, 0 otherwise")
-cfb1.buildPrimitive("OR", cfb1.Modules.LogicOps.doOr, "LogicOps.doOr", "FORTH", "COMPINPF","( val1 val2 -- flag ) -1 if one or both arguments are non-zero, 0 otherwise")
-cfb1.buildPrimitive("XOR", cfb1.Modules.LogicOps.doXor, "LogicOps.doXor", "FORTH", "COMPINPF","( val1 val2 -- flag ) -1 if one and only one argument is non-zero, 0 otherwise")
-
-# Compiler definitions
-cfb1.buildPrimitive(",", cfb1.Modules.Compiler.doComma, "Compiler.doComma", "FORTH", "COMPINPF","( n --) Compiles value off the TOS into the next parameter field cell")
-cfb1.buildPrimitive("COMPINPF", cfb1.Modules.Compiler.doComma, "Compiler.doComma", "IMMEDIATE", "COMPINPF","( n --) Does the same thing as , (comma) - given a different name for ease of reading")
-cfb1.buildPrimitive("EXECUTE", cfb1.Modules.Compiler.doExecute, "Compiler.doExecute", "FORTH", "COMPINPF","( address --) Executes the word corresponding to the address on the stack")
-cfb1.buildPrimitive(":", cfb1.Modules.Compiler.compileColon, "Compiler.compileColon", "FORTH", "COMPINPF","( -- ) Starts compilation of a colon definition")
-cfb1.buildPrimitive(";", cfb1.Modules.Compiler.doSemi, "Compiler.doSemi", "IMMEDIATE", "EXECUTE","( -- ) Terminates compilation of a colon definition")
-cfb1.buildPrimitive("COMPLIT", cfb1.Modules.Compiler.compileLiteral, "Compiler.compileLiteral", "IMMEDIATE", "EXECUTE","( -- ) Compiles doLit and a literal into the dictionary")
-cfb1.buildPrimitive("doLiteral", cfb1.Modules.Compiler.doLiteral, "Compiler.doLiteral", "IMMEDIATE", "NOP","( -- lit ) Run-time code that pushes a literal onto the stack")
-cfb1.buildPrimitive("HERE", cfb1.Modules.Compiler.doHere, "Compiler.doHere", "FORTH", "COMPINPF","( -- location ) Returns address of the next available dictionary location")
-cfb1.buildPrimitive("CREATE", cfb1.Modules.Compiler.doCreate, "Compiler.doCreate", "FORTH", "COMPINPF","CREATE <name>. Adds a named entry into the dictionary")
-cfb1.buildPrimitive("doDoes", cfb1.Modules.Compiler.doDoes, "Compiler.doDoes", "IMMEDIATE", "COMPINPF", "( address -- ) Run-time code for DOES>");
-cfb1.buildPrimitive("DOES>", cfb1.Modules.Compiler.compileDoes, "Compiler.compileDoes", "FORTH", "COMPINPF", 
-                    "DOES> <list of runtime actions>. When defining word is created, copies code following it into the child definition")
-cfb1.buildPrimitive("@", cfb1.Modules.Compiler.doFetch, "Compiler.doFetch", "FORTH", "COMPINPF","( addr -- val ) Fetches the value in the param field  at addr")
-cfb1.buildPrimitive("!", cfb1.Modules.Compiler.doStore, "Compiler.doStore", "FORTH", "COMPINPF","( val addr --) Stores the value in the param field  at addr")
-cfb1.buildPrimitive("DEFINITIONS", cfb1.Modules.Compiler.doSetCurrentToContext, "Compiler.doSetCurrentToContext", "FORTH",
-"COMPINPF","(  -- ). Sets the current (compilation) vocabulary to the context vocabulary (the one on top of the vocabulary stack)")
-cfb1.buildPrimitive("IMMEDIATE", cfb1.Modules.Compiler.doImmediate, "Compiler.doImmediate", "FORTH", "COMPINPF","( -- ) Flags a word as immediate (so it executes instead of compiling inside a colon definition)")
-# Branching compiler definitions
-cfb1.buildPrimitive("IF", cfb1.Modules.Compiler.compileIf, "Compiler.compileIf", "IMMEDIATE", "EXECUTE","( -- location ) Compile-time code for IF")
-cfb1.buildPrimitive("ELSE", cfb1.Modules.Compiler.compileElse, "Compiler.compileElse", "IMMEDIATE", "EXECUTE","( -- location ) Compile-time code for ELSE")
-cfb1.buildPrimitive("THEN", cfb1.Modules.Compiler.compileThen, "Compiler.compileThen", "IMMEDIATE", "EXECUTE","( -- location ) Compile-time code for THEN")
-cfb1.buildPrimitive("0BRANCH", cfb1.Modules.Compiler.do0Branch, "Compiler.do0Branch", "IMMEDIATE", "NOP","( flag -- ) Run-time code for IF")
-cfb1.buildPrimitive("JUMP", cfb1.Modules.Compiler.doJump, "Compiler.doJump", "IMMEDIATE", "NOP", 
-"( -- ) Jumps unconditionally to the parameter field location next to it and is compiled by ELSE")
-cfb1.buildPrimitive("doElse", cfb1.Modules.CorePrims.doNOP, "CorePrims.doNOP", "IMMEDIATE", "NOP","( -- ) Run-time code for ELSE")
-cfb1.buildPrimitive("doThen", cfb1.Modules.CorePrims.doNOP, "CorePrims.doNOP", "IMMEDIATE", "NOP","( -- ) Run-time code for THEN")
-cfb1.buildPrimitive("BEGIN", cfb1.Modules.Compiler.compileBegin, "Compiler.CompileBegin", "IMMEDIATE", "EXECUTE","( -- beginLoc ) Compile-time code for BEGIN")
-cfb1.buildPrimitive("UNTIL", cfb1.Modules.Compiler.compileUntil, "Compiler.CompileUntil", "IMMEDIATE", "EXECUTE","( beginLoc -- ) Compile-time code for UNTIL")
-cfb1.buildPrimitive("doBegin", cfb1.Modules.CorePrims.doNOP, "CorePrims.doNOP", "IMMEDIATE", "NOP","( -- ) Run-time code for BEGIN")
-cfb1.buildPrimitive("DO", cfb1.Modules.Compiler.compileDo, "Compiler.compileDo", "IMMEDIATE", "EXECUTE","( -- beginLoc ) Compile-time code for DO")
-cfb1.buildPrimitive("LOOP", cfb1.Modules.Compiler.compileLoop, "Compiler.compileLoop", "IMMEDIATE", "EXECUTE","( -- beginLoc ) Compile-time code for LOOP")
-cfb1.buildPrimitive("+LOOP", cfb1.Modules.Compiler.compilePlusLoop, "Compiler.compilePlusLoop", "IMMEDIATE", "EXECUTE","( -- beginLoc ) Compile-time code for +LOOP")
-cfb1.buildPrimitive("doStartDo", cfb1.Modules.Compiler.doStartDo, "Compiler.doStartDo", "IMMEDIATE", "COMPINPF","( start end -- ) Starts off the Do by getting the start and end")
-cfb1.buildPrimitive("doDo", cfb1.Modules.CorePrims.doNOP, "CorePrims.doNOP", "IMMEDIATE", "COMPINPF","( -- ) Marker for DoLoop to return to")
-cfb1.buildPrimitive("doLoop", cfb1.Modules.Compiler.doLoop, "Compiler.doLoop", "IMMEDIATE", "COMPINPF","( -- ) Loops back to doDo until the start equals the end")
-cfb1.buildPrimitive("doPlusLoop", cfb1.Modules.Compiler.doPlusLoop, "Compiler.doPlusLoop", "IMMEDIATE", "COMPINPF","( inc -- ) Loops back to doDo until the start >= the end and increments with inc")
-cfb1.buildPrimitive("I", cfb1.Modules.Compiler.doIndexI, "Compiler.doIndexI", "FORTH", "COMPINPF","( -- index ) Returns the index of I")
-cfb1.buildPrimitive("J", cfb1.Modules.Compiler.doIndexJ, "Compiler.doIndexJ", "FORTH", "COMPINPF","( -- index ) Returns the index of J")
-cfb1.buildPrimitive("K", cfb1.Modules.Compiler.doIndexK, "Compiler.doIndexK", "FORTH", "COMPINPF","( -- index ) Returns the index of K")
-
-# Commenting and list compiler
-cfb1.buildPrimitive("//", cfb1.Modules.Compiler.doSingleLineCmts, "Compiler.doSingleLineCmts", "FORTH", gsp.BFC.ExecZeroAction,"( -- ) Single-line comment handling")
-cfb1.buildPrimitive("(", cfb1.Modules.Compiler.doParenCmts, "Compiler.doParenCmts", "FORTH", gsp.BFC.ExecZeroAction,"( -- ) Multiline comment handling")
-cfb1.buildPrimitive("{", cfb1.Modules.Compiler.compileList, "Compiler.compileList", "FORTH", gsp.BFC.ExecZeroAction,"( -- list ) List compiler")
-
-# cfb1.buildHighLevel(gsp,": x  NOP ;", "Executing a colon")
-cfb1.buildHighLevel(gsp,": HT IF HELLO ELSE TULIP THEN ;", "My first high-level definition")
-cfb1.buildHighLevel(gsp,": HT2 NOP NOP NOP ;", "My second high-level definition")
-cfb1.buildHighLevel(gsp,": TLIT 3 4 5 ;", "Testing literals")
-cfb1.buildHighLevel(gsp,": TESTBU BEGIN 1 + DUP 10 TULIP > UNTIL . ;", "Testing BEGIN UNTIL")
-cfb1.buildHighLevel(gsp,": TDL DO HELLO LOOP ;", "Testing DO LOOP")
-cfb1.buildHighLevel(gsp,": CONSTANT CREATE , DOES> @ ;", "The quintessential defining word")
-cfb1.buildHighLevel(gsp,": H3 HELLO HELLO HELLO ;", "3 hellos")
-
+initVocabs(gsp)
+buildCoreDefs(cfb1, gsp)
 gsp.DataStack = []
 
+# New interpreters start from shallow copies of the core definitions instead of building the dictionary again. The
+# entries themselves are shared, including with the default interpreter, until one of them changes an entry - then
+# ownWord gives it a copy of its own.
+coreAddress = list(cfb1.Address)
+coreDict = cfb1.Dict.copy()
+cfb1.SharedAddress = coreAddress
+
+# Creates an interpreter that's independent of the default one and any others: it has its own stacks and its own
+# dictionary, so definitions made in one can't be seen from another. vocabBuilders is an optional list of functions
+# taking (cfb, gsp) that add app-specific definitions, e.g. AppSpecBuildDefs.buildAppSpecDefs. output is the output
+# sink to print to (a StdoutSink if it's left out).
+# Returns the new CreoleForthBundle and GlobalSimpleProps.
+def createInterpreter(vocabBuilders=None, output=None):
+    cfb = CreoleForthBundle()
+    cfb.Modules = modules
+    cfb.Address = list(coreAddress)
+    cfb.Dict = coreDict.copy()
+    cfb.SharedAddress = coreAddress
+    newGsp = GlobalSimpleProps(cfb)
+    if (output != None):
+        newGsp.Output = output
+    initVocabs(newGsp)
+    newGsp.CurrentVocab = "APPSPEC"
+    if (vocabBuilders != None):
+        for vocabBuilder in vocabBuilders:
+            vocabBuilder(cfb, newGsp)
+    return cfb, newGsp
+
+# Creates an interpreter from a dictionary image written by saveImage (or SAVE-SYSTEM). Raises ValueError if the
+# image is from a different format version, refers to a code field that doesn't exist or holds vectors without numpy
+# installed. Returns the new CreoleForthBundle and GlobalSimpleProps.
+def loadInterpreter(fileName):
+    with open(fileName, "r") as f:
+        image = json.load(f, object_hook=imageObject)
+    if (image.get("ImageVersion") != IMAGE_VERSION):
+        raise ValueError("Error: " + fileName + " is not a version " + str(IMAGE_VERSION) + " dictionary image")
+
+    cfb = CreoleForthBundle()
+    cfb.Modules = modules
+    newGsp = GlobalSimpleProps(cfb)
+    for entry in image["Address"]:
+        cfb.Address.append(imageEntryToWord(cfb, entry))
+    for fqName, index in image["Dict"]:
+        cfb.Dict[fqName] = cfb.Address[index]
+    newGsp.VocabStack = VocabStackList(image["VocabStack"])
+    newGsp.CurrentVocab = image["CurrentVocab"]
+
+    # Threaded code isn't saved - it's rebuilt from the parameter fields once every word is in place
+    for cw in cfb.Address:
+        threadWord(newGsp, cw)
+    return cfb, newGsp
+
+# Version of the compiled script format kept in __cfpycache__
+SCRIPT_CACHE_VERSION = 3
+
+# Index of the token that ends the comment or { } list starting at tokens[start], or the last index if it's never
+# closed. Scanned the same way as doSingleLineCmts, doParenCmts and compileList.
+def skipBracketedTokens(tokens, start):
+    endMarks = {"//": "__#EOL#__", "(": ")", "{": "}"}
+    endMark = endMarks[tokens[start]]
+    i = start + 1
+    while (i < len(tokens) and str(tokens[i]).find(endMark) == -1):
+        i += 1
+    return min(i, len(tokens) - 1)
+
+# Splits a script's tokens into segments for the script cache: ["RUN", tokens] for code the outer interpreter runs and
+# ["DEFINE", tokens, None] for each colon definition, whose compiled entry is filled in once it has been compiled.
+# Comments outside definitions are dropped. A ; (or :) inside a comment or { } list doesn't start or end a definition.
+# A definition with a { } list in it pushes the list when it's compiled, which a cached entry can't do, so it's kept
+# in a RUN segment and compiled every time.
+def splitScriptTokens(tokens):
+    segments = []
+    runTokens = []
+    i = 0
+    while (i < len(tokens)):
+        token = tokens[i]
+        if (token == "//" or token == "("):
+            i = skipBracketedTokens(tokens, i)
+        elif (token == "{"):
+            endIndex = skipBracketedTokens(tokens, i)
+            runTokens.extend(tokens[i:endIndex + 1])
+            i = endIndex
+        elif (token == ":"):
+            # A colon without a semicolon goes to the end of the script, and the colon compiler reports it
+            endIndex = i + 1
+            hasCompileEffects = False
+            while (endIndex < len(tokens) - 1 and tokens[endIndex] != ";"):
+                if (tokens[endIndex] in ("//", "(", "{")):
+                    hasCompileEffects = hasCompileEffects or tokens[endIndex] == "{"
+                    endIndex = skipBracketedTokens(tokens, endIndex)
+                endIndex += 1
+            endIndex = min(endIndex, len(tokens) - 1)
+            if (hasCompileEffects):
+                runTokens.extend(tokens[i:endIndex + 1])
+            else:
+                if (len(runTokens) > 0):
+                    segments.append(["RUN", runTokens])
+                    runTokens = []
+                segments.append(["DEFINE", tokens[i:endIndex + 1], None])
+            i = endIndex
+        else:
+            runTokens.append(token)
+        i += 1
+    if (len(runTokens) > 0):
+        segments.append(["RUN", runTokens])
+    return segments
+
+# Runs a script file, keeping its tokenized form and compiled colon definitions in a __cfpycache__ folder next to it.
+# The cache is keyed by the script's contents, the cache format version and the dictionary the script starts with
+# (so adding or changing primitives invalidates it). On a hit, the script isn't tokenized again and its colon
+# definitions are put straight into the dictionary instead of being compiled; everything else runs as usual.
+def runCachedScript(cfb, gsp, fileName):
+    interpreter = cfb.Modules.Interpreter
+    with open(fileName, "rb") as f:
+        source = f.read()
+    keyHash = hashlib.sha256(source)
+    keyHash.update(("\n" + str(SCRIPT_CACHE_VERSION) + "\n").encode())
+    for cw in cfb.Address:
+        if (cw != None):
+            keyHash.update((cw.fqNameField + " " + cw.CodeFieldStr + " " + cw.CompileActionField + "\n").encode())
+    cacheKey = keyHash.hexdigest()
+    cacheDir = os.path.join(os.path.dirname(os.path.abspath(fileName)), "__cfpycache__")
+    cacheFile = os.path.join(cacheDir, os.path.basename(fileName) + ".json")
+
+    segments = None
+    try:
+        with open(cacheFile, "r") as f:
+            cached = json.load(f, object_hook=imageObject)
+        if (cached.get("CacheKey") == cacheKey):
+            segments = cached["Segments"]
+    except (OSError, ValueError):
+        pass
+    isCacheHit = segments != None
+    if (not isCacheHit):
+        gsp.InputArea = source.decode()
+        interpreter.doParseInput(gsp)
+        segments = splitScriptTokens(gsp.ParsedInput)
+
+    for segment in segments:
+        if (segment[0] == "DEFINE" and segment[2] != None and segment[2]["IndexField"] == len(cfb.Address)):
+            cw = imageEntryToWord(cfb, segment[2])
+            cfb.Address.append(cw)
+            cfb.Dict[cw.fqNameField] = cw
+            cfb.clearLookupCache()
+            threadWord(gsp, cw)
+            if (gsp.Limits != None):
+                gsp.Limits.growDictionary(1 + len(cw.ParamField))
+            continue
+        hereLoc = len(cfb.Address)
+        gsp.ParsedInput = segment[1]
+        interpreter.doOuter(gsp)
+        if (segment[0] == "DEFINE" and len(cfb.Address) == hereLoc + 1):
+            segment[2] = wordToImageEntry(cfb.Address[hereLoc])
+
+    if (not isCacheHit):
+        try:
+            cacheText = json.dumps({"CacheKey": cacheKey, "Segments": segments}, default=imageValue)
+            os.makedirs(cacheDir, exist_ok=True)
+            with open(cacheFile, "w") as f:
+                f.write(cacheText)
+        except (OSError, ValueError):
+            # The cache is only an optimization - a read-only folder, or a definition holding a value that can't be
+            # saved, just means no cache
+            pass
+
 #cp = CorePrims()
 #interpreter = Interpreter()
 gsp.CurrentVocab = "APPSPEC"
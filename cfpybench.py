@@ -0,0 +1,203 @@
+'''
+    Program     : cfpybench.py
+    Purpose     : Benchmarks for the hot paths of Creole Forth for Python
+
+    Usage       : python cfpybench.py [-o results.json] [--compare baseline.json] [--repeat N] [--quick]
+
+    Each benchmark runs in a fresh interpreter from createInterpreter and reports the best of --repeat runs. The
+    results are printed (or written with -o) as JSON. --compare loads a results file saved earlier and prints how
+    each benchmark has changed against it. Memory benchmarks report bytes rather than seconds.
+'''
+
+import argparse
+import datetime
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from CreoleForth import *
+
+# Runs a piece of Creole Forth code through the outer interpreter
+def runCode(cfb, gsp, code):
+    gsp.InputArea = code
+    cfb.Modules.Interpreter.doParseInput(gsp)
+    cfb.Modules.Interpreter.doOuter(gsp)
+
+# Runs code that has already been parsed and returns how long the outer interpreter took
+def timeParsed(cfb, gsp, parsedInput):
+    gsp.ParsedInput = parsedInput
+    gsp.DataStack.clear()
+    startTime = time.perf_counter()
+    cfb.Modules.Interpreter.doOuter(gsp)
+    return time.perf_counter() - startTime
+
+# Best time of repeat runs of a word, defined along with its helpers in a fresh interpreter
+def timeWord(definitions, word, repeat):
+    cfb, gsp = createInterpreter()
+    for definition in definitions:
+        runCode(cfb, gsp, definition)
+    gsp.InputArea = word
+    cfb.Modules.Interpreter.doParseInput(gsp)
+    parsedInput = gsp.ParsedInput
+    return min([timeParsed(cfb, gsp, list(parsedInput)) for i in range(repeat)])
+
+# Outer interpreter throughput: a long stream of top-level words and literals
+def benchOuterInterpreter(scale, repeat):
+    cfb, gsp = createInterpreter()
+    gsp.InputArea = " ".join(["1 2 + DUP DROP 4 SWAP DROP 3 * DROP"] * (10000 * scale))
+    cfb.Modules.Interpreter.doParseInput(gsp)
+    parsedInput = gsp.ParsedInput
+    seconds = min([timeParsed(cfb, gsp, list(parsedInput)) for i in range(repeat)])
+    return seconds, len(parsedInput), "words"
+
+# Colon-call overhead: a call tree of nested colon definitions whose leaves do nothing
+def benchColonCall(scale, repeat):
+    definitions = [": NEST0 NOP ;"]
+    for depth in range(1, 9):
+        definitions.append(": NEST" + str(depth) + " NEST" + str(depth - 1) + " NEST" + str(depth - 1) + " ;")
+    definitions.append(": NESTRUN " + str(40 * scale) + " 0 DO NEST8 LOOP ;")
+    calls = 40 * scale * (2 ** 9 - 1)
+    return timeWord(definitions, "NESTRUN", repeat), calls, "calls"
+
+# DO LOOP iteration rate
+def benchDoLoop(scale, repeat):
+    iterations = 20000 * scale
+    definitions = [": DOLOOPRUN " + str(iterations) + " 0 DO LOOP ;"]
+    return timeWord(definitions, "DOLOOPRUN", repeat), iterations, "iterations"
+
+# BEGIN UNTIL iteration rate
+def benchBeginUntil(scale, repeat):
+    iterations = 10000 * scale
+    definitions = [": BURUN 0 BEGIN 1 + DUP " + str(iterations) + " = UNTIL DROP ;"]
+    return timeWord(definitions, "BURUN", repeat), iterations, "iterations"
+
+# Literal-heavy arithmetic inside a compiled definition
+def benchLiteralArithmetic(scale, repeat):
+    iterations = 5000 * scale
+    definitions = [": ARITHRUN " + str(iterations) + " 0 DO 60 60 * 24 * 7 + 3 - 2 * DROP LOOP ;"]
+    return timeWord(definitions, "ARITHRUN", repeat), iterations * 12, "words"
+
+# Math primitives on values that can't be folded at compile time: integer +, -, *, / and a bigint product
+def benchIntegerArithmetic(scale, repeat):
+    iterations = 5000 * scale
+    definitions = [": INTARITHRUN " + str(iterations) + " 0 DO I 3 * 7 + I - 2 / DROP I 9007199254740993 * DROP LOOP ;"]
+    return timeWord(definitions, "INTARITHRUN", repeat), iterations * 7, "primitives"
+
+# The same sort of integer kernel on a numeric data stack (INT-STACK) with the NUMERIC vocabulary's primitives
+def benchNumericStack(scale, repeat):
+    iterations = 5000 * scale
+    definitions = ["INT-STACK", ": NUMRUN " + str(iterations) + " 0 DO I 3 * 7 + I - 2 / DUP 5 > DROP DROP LOOP ;"]
+    return timeWord(definitions, "NUMRUN", repeat), iterations * 8, "primitives"
+
+# Element-wise vector arithmetic and reductions (needs numpy - skipped without it)
+def benchVectorArithmetic(scale, repeat):
+    iterations = 500 * scale
+    definitions = [": VECRUN " + str(iterations) + " 0 DO 0 1000 RANGE DUP 3 * 7 + * SUM DROP LOOP ;"]
+    return timeWord(definitions, "VECRUN", repeat), iterations * 1000, "elements"
+
+# Calls from Python through the embedding API: one callMany batch running a short word on each row
+def benchCallMany(scale, repeat):
+    cfb, gsp = createInterpreter()
+    gsp.evaluate(": HYP DUP * SWAP DUP * + ;")
+    rows = [(i, i + 1) for i in range(10000 * scale)]
+    times = []
+    for i in range(repeat):
+        startTime = time.perf_counter()
+        gsp.callMany("HYP", rows)
+        times.append(time.perf_counter() - startTime)
+    return min(times), len(rows), "calls"
+
+# Compile time per colon definition as the dictionary grows. Returns one result per dictionary size.
+def benchCompileColon(scale, repeat):
+    results = []
+    batchSize = 1000 * scale
+    cfb, gsp = createInterpreter()
+    defNum = 0
+    for batch in range(5):
+        startTime = time.perf_counter()
+        for i in range(batchSize):
+            runCode(cfb, gsp, ": BENCHDEF" + str(defNum) + " 1 2 + DUP IF DROP ELSE DROP THEN ;")
+            defNum += 1
+        elapsed = time.perf_counter() - startTime
+        results.append(("compileColon@" + str(len(cfb.Address)), elapsed, batchSize, "definitions"))
+    return results
+
+# Dictionary memory: bytes held per CREATEd word, measured with tracemalloc across 100,000 of them (20,000 with
+# --quick). The words are defined in batches so the source text doesn't count.
+def benchCreatedWordMemory(scale):
+    wordCount = 20000 * scale
+    batchSize = 1000
+    cfb, gsp = createInterpreter()
+    tracemalloc.start()
+    startBytes = tracemalloc.get_traced_memory()[0]
+    for batch in range(0, wordCount, batchSize):
+        runCode(cfb, gsp, " ".join(["CREATE MEMWORD" + str(i) for i in range(batch, batch + batchSize)]))
+    gsp.InputArea = ""
+    gsp.ParsedInput = []
+    cfb.clearLookupCache()
+    usedBytes = tracemalloc.get_traced_memory()[0] - startBytes
+    tracemalloc.stop()
+    return usedBytes, wordCount, "definitions"
+
+memoryBenchmarks = [("createdWordMemory", benchCreatedWordMemory)]
+
+benchmarks = [("outerInterpreter", benchOuterInterpreter),
+              ("colonCall", benchColonCall),
+              ("doLoop", benchDoLoop),
+              ("beginUntil", benchBeginUntil),
+              ("literalArithmetic", benchLiteralArithmetic),
+              ("integerArithmetic", benchIntegerArithmetic),
+              ("numericStack", benchNumericStack),
+              ("callMany", benchCallMany),
+              ("vectorArithmetic", benchVectorArithmetic)]
+
+# Runs every benchmark and returns the results in the form they're saved in
+def runBenchmarks(scale, repeat):
+    results = {}
+    for name, benchmark in benchmarks:
+        if (benchmark == benchVectorArithmetic and numpy == None):
+            continue
+        seconds, units, unitName = benchmark(scale, repeat)
+        results[name] = {"seconds": seconds, "units": units, "unit": unitName, "perSecond": units / seconds}
+    for name, seconds, units, unitName in benchCompileColon(scale, repeat):
+        results[name] = {"seconds": seconds, "units": units, "unit": unitName, "perSecond": units / seconds}
+    for name, benchmark in memoryBenchmarks:
+        usedBytes, units, unitName = benchmark(scale)
+        results[name] = {"bytes": usedBytes, "units": units, "unit": unitName, "bytesPer": usedBytes / units}
+    return {"python": platform.python_version(), "date": datetime.datetime.now().isoformat(), "results": results}
+
+# Prints each benchmark's time (or bytes used, for memory benchmarks) against a baseline. Change is the percentage
+# difference - negative is faster or smaller.
+def compareResults(current, baseline):
+    print("Benchmark".ljust(28) + "Baseline".ljust(15) + "Current".ljust(15) + "Change")
+    print("---------".ljust(28) + "--------".ljust(15) + "-------".ljust(15) + "------")
+    for name in current["results"]:
+        if name not in baseline["results"]:
+            continue
+        measure = "bytes" if "bytes" in current["results"][name] else "seconds"
+        baseValue = baseline["results"][name][measure]
+        currValue = current["results"][name][measure]
+        change = (currValue - baseValue) / baseValue * 100
+        print(name.ljust(28) + (str(round(baseValue, 4)) + ("s" if measure == "seconds" else "B")).ljust(15) +
+              (str(round(currValue, 4)) + ("s" if measure == "seconds" else "B")).ljust(15) +
+              ("+" if change >= 0 else "") + str(round(change, 1)) + "%")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for Creole Forth for Python")
+    parser.add_argument("-o", "--output", help="file to save the JSON results to")
+    parser.add_argument("--compare", help="JSON results file to compare against")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark (the best one is reported)")
+    parser.add_argument("--quick", action="store_true", help="smaller workloads for a quick check")
+    args = parser.parse_args()
+
+    current = runBenchmarks(1 if args.quick else 5, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=1)
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compareResults(current, json.load(f))
+    elif not args.output:
+        json.dump(current, sys.stdout, indent=1)
+        print()
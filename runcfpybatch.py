@@ -0,0 +1,85 @@
+# Runs a batch of Creole Forth for Python scripts across a pool of worker processes
+#
+# Usage: python runcfpybatch.py <directory or manifest> [-j workers] [-o results.json]
+#
+# A directory runs every .f file in it. A manifest is a text file listing one script per line (relative paths are
+# relative to the manifest). Each worker builds the dictionary once when it starts, then gives every script a fresh
+# interpreter from createInterpreter, so scripts can't interfere with each other. The results are written as JSON:
+# one entry per script with its captured output, final data stack, error (if any) and wall time in seconds.
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+# Lists the scripts named by a directory or manifest
+def findScripts(source):
+    scripts = []
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.endswith(".f"):
+                scripts.append(os.path.join(source, name))
+    else:
+        baseDir = os.path.dirname(source)
+        with open(source, "r") as manifest:
+            for line in manifest:
+                line = line.strip()
+                if line != "" and not line.startswith("#"):
+                    scripts.append(os.path.join(baseDir, line))
+    return scripts
+
+# Worker start-up: importing CreoleForth builds the dictionary, which is then shared by every script the worker runs
+def initWorker():
+    global createInterpreter, CaptureSink, buildAppSpecDefs
+    from CreoleForth import createInterpreter, CaptureSink
+    from AppSpecBuildDefs import buildAppSpecDefs
+
+# Stack entries that JSON can't represent (dates, for instance) are reported as strings
+def toJsonValue(val):
+    if isinstance(val, (int, float, str, bool)) or val is None:
+        return val
+    return str(val)
+
+# Runs one script in a fresh interpreter and returns its result
+def runScript(path):
+    cfb, gsp = createInterpreter([buildAppSpecDefs], CaptureSink())
+    error = None
+    startTime = time.perf_counter()
+    try:
+        with open(path, "r") as f:
+            cfb.Modules.Interpreter.doOuterStream(gsp, f)
+    except Exception as e:
+        error = type(e).__name__ + ": " + str(e)
+    return {"script": path,
+            "output": gsp.Output.getvalue(),
+            "stack": [toJsonValue(val) for val in gsp.DataStack],
+            "error": error,
+            "time": time.perf_counter() - startTime}
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs a batch of Creole Forth scripts in parallel")
+    parser.add_argument("source", help="directory of .f scripts or a manifest listing them")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("-o", "--output", help="file to write the JSON results to (default: stdout)")
+    args = parser.parse_args()
+
+    scripts = findScripts(args.source)
+    startTime = time.perf_counter()
+    with multiprocessing.Pool(args.jobs, initializer=initWorker) as pool:
+        # Small scripts are handed out in chunks to keep the inter-process traffic down
+        chunkSize = max(1, len(scripts) // (args.jobs * 4))
+        results = list(pool.imap(runScript, scripts, chunkSize))
+    elapsed = time.perf_counter() - startTime
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+    errorCount = len([result for result in results if result["error"] != None])
+    print(str(len(scripts)) + " scripts, " + str(errorCount) + " errors, " + str(round(elapsed, 3)) + "s", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
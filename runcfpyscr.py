@@ -1,24 +1,24 @@
 # Runs a Creole Forth for Python script
+#
+# Usage: python runcfpyscr.py [--cache] <script>
+#
+# --cache keeps the tokenized script and its compiled colon definitions in a __cfpycache__ folder next to it, so
+# later runs of an unchanged script skip tokenizing and compiling.
 import sys
 from CreoleForth import *
 
-if len(sys.argv) != 2:
+args = sys.argv[1:]
+useCache = "--cache" in args
+if useCache:
+    args.remove("--cache")
+
+if len(args) != 1:
     print("Error: please enter exactly one input file name")
     sys.exit()
+elif useCache:
+    runCachedScript(cfb1, gsp, args[0])
 else: 
-    f= open(sys.argv[1],"r")
-    oneLine = f.read()
-    all_lines = f.readlines()
-    input = ""
-    for line in all_lines:
-        line += '\n'
-        input += line
+    # The script is read and run one line at a time, so it doesn't have to fit in memory
+    f = open(args[0],"r")
+    cfb1.Modules.Interpreter.doOuterStream(gsp, f)
     f.close()
-    # gsp.cleanFields()
-    
-    # gsp.PADarea = []
-    gsp.InputArea = oneLine
-    cfb1.Modules.Interpreter.doParseInput(gsp)
-    cfb1.Modules.Interpreter.doOuter(gsp)
-
-
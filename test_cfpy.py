@@ -0,0 +1,721 @@
+# Tests for Creole Forth for Python. Run with python -m pytest test_cfpy.py (or python -m unittest test_cfpy).
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from CreoleForth import *
+
+# Runs source in a new interpreter with the gsp settings in flags, and returns the data stack and what was printed
+def runWith(source, **flags):
+    cfb, gsp = createInterpreter(output=CaptureSink())
+    for flag in flags:
+        setattr(gsp, flag, flags[flag])
+    stack = list(gsp.evaluate(source))
+    return stack, gsp.Output.getvalue()
+
+# The names of the words a colon definition compiled to, without their operands
+def compiledWords(cfb, gsp, name):
+    instrs = cfb.Modules.Optimizer.decodeParamField(gsp, cfb.Dict.find(name, "APPSPEC").ParamField)
+    return [cfb.Address[instr[0]].NameField for instr in instrs]
+
+class InterpreterIsolationTests(unittest.TestCase):
+    def setUp(self):
+        self.cfbA, self.gspA = createInterpreter(output=CaptureSink())
+        self.cfbB, self.gspB = createInterpreter(output=CaptureSink())
+        self.h3Addr = coreDict.find("H3", "FORTH").IndexField
+        self.h3Params = list(coreAddress[self.h3Addr].ParamField)
+
+    # The core word H3 as interpreter cfb sees it, through both Address and Dict
+    def h3(self, cfb):
+        cw = cfb.Dict.find("H3", "FORTH")
+        self.assertIs(cw, cfb.Address[self.h3Addr])
+        return cw
+
+    def assertUnchanged(self, cfb):
+        cw = self.h3(cfb)
+        self.assertEqual(list(cw.ParamField), self.h3Params)
+        self.assertEqual(cw.ParamFieldStart, 0)
+        self.assertEqual(cw.Vocabulary, "FORTH")
+
+    def testStoreIntoCoreWord(self):
+        self.gspA.evaluate("99 " + str(self.h3Addr) + " !")
+        self.assertEqual(self.h3(self.cfbA).ParamField[-1], 99)
+        self.assertUnchanged(self.cfbB)
+        self.assertUnchanged(cfb1)
+
+    def testCommaAndImmediateOnNewestCoreWord(self):
+        # H3 is the newest word in a fresh interpreter, so , and IMMEDIATE apply to it
+        self.gspA.evaluate("7 ,")
+        self.gspA.evaluate("IMMEDIATE")
+        cw = self.h3(self.cfbA)
+        self.assertEqual(cw.ParamField[-1], 7)
+        self.assertEqual(cw.ParamFieldStart, 1)
+        self.assertEqual(cw.Vocabulary, "IMMEDIATE")
+        self.assertUnchanged(self.cfbB)
+        self.assertUnchanged(cfb1)
+
+    def testCopiedWordStillRuns(self):
+        self.gspA.evaluate("99 " + str(self.h3Addr) + " !")
+        self.gspA.evaluate("H3")
+        self.gspB.evaluate("H3")
+        self.assertEqual(self.gspA.Output.getvalue(), self.gspB.Output.getvalue())
+
+    def testDefinitionsStayInTheirInterpreter(self):
+        self.gspA.evaluate(": ONLYINA 5 ;")
+        self.assertEqual(self.gspA.evaluate("ONLYINA"), [5])
+        self.assertEqual(self.gspB.evaluate("ONLYINA"), ["ONLYINA"])
+
+class ScriptCacheTests(unittest.TestCase):
+    script = (": A ( a ; comment ) 1 2 + ;\n"
+              ": B // semi ; here\n"
+              "  5 ;\n"
+              "{ x : y ; z } DROP\n"
+              ": C { p ; q } DROP 7 ;\n"
+              "A B C\n")
+
+    def runScript(self, fileName):
+        cfb, gsp = createInterpreter(output=CaptureSink())
+        runCachedScript(cfb, gsp, fileName)
+        return gsp.stackList()
+
+    def testSemicolonsInCommentsAndLists(self):
+        gsp = createInterpreter(output=CaptureSink())[1]
+        gsp.InputArea = self.script
+        gsp.cfb.Modules.Interpreter.doParseInput(gsp)
+        defined = [segment[1][1] for segment in splitScriptTokens(gsp.ParsedInput) if segment[0] == "DEFINE"]
+        # C pushes its list as it's compiled, so it's left to be compiled every time
+        self.assertEqual(defined, ["A", "B"])
+
+    def testCacheHitMatchesFirstRun(self):
+        with tempfile.TemporaryDirectory() as scriptDir:
+            fileName = os.path.join(scriptDir, "script.f")
+            with open(fileName, "w") as f:
+                f.write(self.script)
+            firstRun = self.runScript(fileName)
+            self.assertTrue(os.path.exists(os.path.join(scriptDir, "__cfpycache__", "script.f.json")))
+            self.assertEqual(firstRun, ["p ; q", 3, 7])
+            self.assertEqual(self.runScript(fileName), firstRun)
+
+    # The dictionary entries a script added, as (name, parameter field, data field)
+    def scriptWords(self, fileName):
+        cfb, gsp = createInterpreter(output=CaptureSink())
+        wordCount = len(cfb.Address)
+        runCachedScript(cfb, gsp, fileName)
+        return [(cw.fqNameField, list(cw.ParamField), list(cw.DataField)) for cw in cfb.Address[wordCount:]]
+
+    def testWordsChangedAfterDefinition(self):
+        with tempfile.TemporaryDirectory() as scriptDir:
+            fileName = os.path.join(scriptDir, "script.f")
+            with open(fileName, "w") as f:
+                f.write(": W 1 2 ;\n9 ,\n: V 1 ;\nHERE 1 - 5 SWAP !\n")
+            firstRun = self.scriptWords(fileName)
+            self.assertEqual(firstRun[0][0], "W.APPSPEC")
+            self.assertEqual(firstRun[0][1][-1], 9)
+            self.assertEqual(self.scriptWords(fileName), firstRun)
+
+class AsyncTests(unittest.TestCase):
+    # Runs source under doOuterAsync and returns the data stack
+    def runAsync(self, source):
+        cfb, gsp = createInterpreter(output=CaptureSink())
+        gsp.InputArea = source
+        cfb.Modules.Interpreter.doParseInput(gsp)
+        asyncio.run(cfb.Modules.Interpreter.doOuterAsync(gsp))
+        self.assertEqual(gsp.onContinue, [])
+        return gsp.stackList()
+
+    def testNestedAsyncWords(self):
+        self.assertEqual(self.runAsync(": A 10 SLEEP 1 ; : B A A ; B"), [1, 1])
+
+    def testProfiledAsyncWords(self):
+        self.assertEqual(self.runAsync(": A 10 SLEEP 1 ; : B A A ; PROFILE-ON B PROFILE-OFF"), [1, 1])
+
+    def testAsyncWordInDoesChild(self):
+        self.assertEqual(self.runAsync(": SLEEPER CREATE DOES> DROP 10 SLEEP 2 ; SLEEPER S S S"), [2, 2])
+
+    def testSyncRunOutsideEventLoop(self):
+        gsp = createInterpreter(output=CaptureSink())[1]
+        self.assertEqual(gsp.evaluate("1 10 SLEEP 2"), [1, 2])
+
+    def testSyncRunInsideEventLoop(self):
+        gsp = createInterpreter(output=CaptureSink())[1]
+        async def handler():
+            return gsp.evaluate("1 10 SLEEP 2")
+        self.assertEqual(asyncio.run(handler()), [])
+        self.assertIn("doOuterAsync", gsp.Output.getvalue())
+        with self.assertRaises(AsyncWordError):
+            async def caller():
+                return gsp.call("SLEEP", 10)
+            asyncio.run(caller())
+
+    def testCoroutinePrimitiveRefused(self):
+        async def doWait(gsp):
+            pass
+        cfb = createInterpreter()[0]
+        with self.assertRaises(ValueError):
+            cfb.buildPrimitive("WAIT", doWait, "CorePrims.doWait", "APPSPEC", "COMPINPF", "( -- )")
+
+class RunLimitTests(unittest.TestCase):
+    definitions = [": STRAIGHT " + " ".join(["1 DROP"] * 500) + " ;",
+                   ": LOOPED 10 0 DO I 2 > IF 1 ELSE 2 THEN DROP LOOP ;",
+                   ": INNER 1 + ; : CALLER 10 0 DO 5 INNER DROP LOOP ;",
+                   ": EARLY 1 EXIT 2 ;"]
+
+    # A limited run of source, with direct threading on or off. The word counts include the end of line marker.
+    def wordsExecuted(self, source, isThreaded, limits):
+        cfb, gsp = createInterpreter(output=CaptureSink())
+        gsp.DirectThreading = isThreaded
+        gsp.ConstantFold = False
+        for definition in self.definitions:
+            gsp.evaluate(definition)
+        gsp.InputArea = source
+        cfb.Modules.Interpreter.doParseInput(gsp)
+        return cfb.Modules.Interpreter.doOuterLimited(gsp, limits)
+
+    def testThreadedCountsEveryWord(self):
+        self.assertEqual(self.wordsExecuted("STRAIGHT", True, RunLimits()).WordsExecuted, 1002)
+        for source in ("STRAIGHT", "LOOPED", "CALLER", "EARLY"):
+            self.assertEqual(self.wordsExecuted(source, True, RunLimits()).WordsExecuted,
+                             self.wordsExecuted(source, False, RunLimits()).WordsExecuted)
+
+    def testStraightLineCodeHitsWordLimit(self):
+        for isThreaded in (False, True):
+            result = self.wordsExecuted("STRAIGHT STRAIGHT STRAIGHT", isThreaded, RunLimits(maxWords=1500))
+            self.assertEqual(result.Status, "limit")
+            self.assertEqual(result.Limit, "words")
+
+class DictionaryTests(unittest.TestCase):
+    def testWordsListsRedefinitionsAsNewest(self):
+        cfb, gsp = createInterpreter(output=CaptureSink())
+        gsp.evaluate(": FIRST 1 ; : SECOND 2 ; : FIRST 3 ; WORDS")
+        self.assertTrue(gsp.Output.getvalue().startswith("APPSPEC: FIRST SECOND\n"))
+        self.assertEqual(cfb.Dict.wordsIn("APPSPEC"), ["SECOND", "FIRST"])
+
+    def testSearchOrderChanges(self):
+        gsp = createInterpreter(output=CaptureSink())[1]
+        gsp.evaluate(": APPWORD 5 ;")
+        self.assertEqual(gsp.evaluate("APPWORD"), [5])
+        gsp.VocabStack.pop()
+        self.assertEqual(gsp.evaluate("APPWORD"), ["APPWORD"])
+        gsp.VocabStack = ["ONLY", "FORTH", "APPSPEC"]
+        self.assertEqual(gsp.evaluate("APPWORD"), [5])
+
+class ThreadedCodeTests(unittest.TestCase):
+    programs = [": SQ DUP * ; : SUMSQ 0 SWAP 0 DO I SQ + LOOP ; 10 SUMSQ",
+                ": SGN DUP 0 < IF DROP -1 ELSE 0 > IF 1 ELSE 0 THEN THEN ; -5 SGN 0 SGN 7 SGN",
+                ": FACT DUP 1 > IF DUP 1 - RECURSE * ELSE DROP 1 THEN ; 10 FACT",
+                ": CONST CREATE , DOES> @ ; 5 CONST FIVE : TEN FIVE FIVE + ; TEN",
+                ": COUNTDOWN DUP 0 > IF DUP 1 - COUNTDOWN THEN ; 3 COUNTDOWN"]
+
+    def testThreadedMatchesDoColon(self):
+        for program in self.programs:
+            self.assertEqual(runWith(program, DirectThreading=True), runWith(program, DirectThreading=False), program)
+
+    def testDefinitionsAreThreaded(self):
+        cfb, gsp = createInterpreter(output=CaptureSink())
+        gsp.evaluate(": SQ DUP * ; : CONST CREATE , DOES> @ ;")
+        self.assertNotEqual(cfb.Dict.find("SQ", "APPSPEC").ThreadedField, None)
+        # DOES> works on the return stack itself, so CONST stays on doColon
+        self.assertEqual(cfb.Dict.find("CONST", "APPSPEC").ThreadedField, None)
+
+    def testRedefinitionAfterThreading(self):
+        for isThreaded in (False, True):
+            # Callers compiled before the redefinition keep the old word, as they do without threading
+            self.assertEqual(runWith(": A 1 ; : B A A + ; B : A 10 ; B A", DirectThreading=isThreaded, Inlining=False),
+                             ([2, 2, 10], ""))
+            self.assertEqual(runWith(": A 1 ; : A A 5 + ; A", DirectThreading=isThreaded), ([6], ""))
+
+class StreamingTests(unittest.TestCase):
+    source = "1 ( a comment\n that runs 99 over\n three lines ) 2\n: SQ ( n -- n*n )\n  DUP * ;\n3 SQ\n"
+
+    def testCommentsAndDefinitionsAcrossLines(self):
+        cfb, gsp = createInterpreter(output=CaptureSink())
+        cfb.Modules.Interpreter.doOuterStream(gsp, io.StringIO(self.source))
+        self.assertEqual(gsp.stackList(), [1, 2, 9])
+        self.assertEqual(gsp.Output.getvalue(), "")
+
+    def testStreamMatchesEvaluate(self):
+        cfb, gsp = createInterpreter(output=CaptureSink())
+        cfb.Modules.Interpreter.doOuterStream(gsp, iter(self.source.splitlines(True)))
+        self.assertEqual(gsp.stackList(), runWith(self.source)[0])
+
+class NumberParsingTests(unittest.TestCase):
+    def setUp(self):
+        self.parseNumber = createInterpreter()[0].Modules.Interpreter.parseNumber
+
+    def testHex(self):
+        for token, val in (("$FF", 255), ("$ff", 255), ("0xFF", 255), ("0X10", 16), ("-$10", -16), ("-0x10", -16),
+                           ("+$10", 16)):
+            self.assertEqual(self.parseNumber(token), val, token)
+
+    def testSignedNumbers(self):
+        for token, val in (("-5", -5), ("+5", 5), ("-0", 0), ("-2.5", -2.5), ("-.5", -0.5), ("1e3", 1000.0),
+                           ("-1E-2", -0.01)):
+            self.assertEqual(self.parseNumber(token), val, token)
+            self.assertEqual(type(self.parseNumber(token)), type(val), token)
+
+    def testWordsAreLeftAlone(self):
+        for token in ("-", "+", ".", "-X", "$G", "0x", "$", "1+", "2DUP", ".S"):
+            self.assertEqual(self.parseNumber(token), token)
+
+    def testNumbersInSource(self):
+        self.assertEqual(runWith("$FF -0x10 + -3 - 10 -2 *")[0], [242, -20])
+
+class BatchRunnerTests(unittest.TestCase):
+    scripts = {"a.f": ": SQ DUP * ;\n3 SQ HELLO\n", "b.f": "1 2 +\nNOW\n"}
+
+    def testJsonResults(self):
+        with tempfile.TemporaryDirectory() as scriptDir:
+            for name in self.scripts:
+                with open(os.path.join(scriptDir, name), "w") as f:
+                    f.write(self.scripts[name])
+            resultsFile = os.path.join(scriptDir, "results.json")
+            runner = os.path.join(os.path.dirname(os.path.abspath(__file__)), "runcfpybatch.py")
+            completed = subprocess.run([sys.executable, runner, scriptDir, "-j", "2", "-o", resultsFile],
+                                       capture_output=True, text=True, cwd=os.path.dirname(runner))
+            self.assertEqual(completed.returncode, 0, completed.stderr)
+            self.assertIn("2 scripts, 0 errors", completed.stderr)
+            with open(resultsFile, "r") as f:
+                results = json.load(f)
+        self.assertEqual([os.path.basename(result["script"]) for result in results], ["a.f", "b.f"])
+        self.assertEqual(results[0]["stack"], [9])
+        self.assertEqual(results[0]["output"], "Hello world\n")
+        # NOW leaves a datetime, which JSON can't hold
+        self.assertEqual(results[1]["stack"][0], 3)
+        self.assertEqual(type(results[1]["stack"][1]), str)
+        for result in results:
+            self.assertEqual(result["error"], None)
+            self.assertEqual(type(result["time"]), float)
+
+class ImageTests(unittest.TestCase):
+    definitions = (": SQ DUP * ; : SGN DUP 0 < IF DROP -1 ELSE 0 > THEN ; CREATE TABLE 10 , 20 , "
+                   ": CONST CREATE , DOES> @ ; 7 CONST SEVEN")
+    uses = "3 SQ -4 SGN TABLE @ SEVEN 8 CONST EIGHT EIGHT"
+
+    # Saves the dictionary of gsp to an image and returns a new interpreter loaded from it
+    def roundTrip(self, cfb, gsp):
+        with tempfile.TemporaryDirectory() as imageDir:
+            fileName = os.path.join(imageDir, "image.json")
+            cfb.saveImage(gsp, fileName)
+            newCfb, newGsp = loadInterpreter(fileName)
+        newGsp.Output = CaptureSink()
+        return newCfb, newGsp
+
+    def testColonCreateAndDoesWords(self):
+        cfb, gsp = createInterpreter(output=CaptureSink())
+        gsp.evaluate(self.definitions)
+        newCfb, newGsp = self.roundTrip(cfb, gsp)
+        self.assertEqual(newGsp.evaluate(self.uses), gsp.evaluate(self.uses))
+        self.assertEqual(newGsp.Output.getvalue(), "")
+        for name in ("SQ", "SGN", "TABLE", "CONST", "SEVEN"):
+            cw = cfb.Dict.find(name, "APPSPEC")
+            newCw = newCfb.Dict.find(name, "APPSPEC")
+            self.assertEqual((list(newCw.ParamField), list(newCw.DataField), newCw.ParamFieldStart, newCw.CodeFieldStr),
+                             (list(cw.ParamField), list(cw.DataField), cw.ParamFieldStart, cw.CodeFieldStr))
+
+    @unittest.skipIf(numpy == None, "needs numpy")
+    def testVectorsComeBackAsVectors(self):
+        cfb, gsp = createInterpreter(output=CaptureSink())
+        gsp.evaluate("CREATE V { 1.5 2 3 } >VECTOR V ! CREATE W 0 4 RANGE W !")
+        newGsp = self.roundTrip(cfb, gsp)[1]
+        vec, rangeVec = newGsp.evaluate("V @ W @")
+        self.assertEqual(type(vec), VectorType)
+        self.assertEqual(vec.dtype, numpy.float64)
+        self.assertEqual(vec.tolist(), [1.5, 2.0, 3.0])
+        self.assertEqual(rangeVec.dtype, gsp.evaluate("W @")[0].dtype)
+        self.assertEqual(rangeVec.tolist(), [0, 1, 2, 3])
+
+    def testUnsavableValue(self):
+        cfb, gsp = createInterpreter(output=CaptureSink())
+        gsp.evaluate("CREATE WHEN NOW WHEN !")
+        with tempfile.TemporaryDirectory() as imageDir:
+            fileName = os.path.join(imageDir, "image.json")
+            with self.assertRaises(ValueError):
+                cfb.saveImage(gsp, fileName)
+            self.assertFalse(os.path.exists(fileName))
+            gsp.evaluate("SAVE-SYSTEM " + fileName)
+            self.assertIn("can't be saved", gsp.Output.getvalue())
+
+class ProfilerTests(unittest.TestCase):
+    definitions = (": SQ DUP * ; : F 0 5 0 DO I SQ + 2 + LOOP DUP 40 = IF 1 ELSE 2 THEN ; "
+                   ": G F EXIT 5 ; : H 3 0 ?DO I 1 = IF LEAVE THEN LOOP ;")
+
+    # Call counts from profiling source, by word
+    def callCounts(self, source, isThreaded):
+        gsp = createInterpreter(output=CaptureSink())[1]
+        gsp.DirectThreading = isThreaded
+        gsp.evaluate(self.definitions)
+        gsp.evaluate("PROFILE-ON " + source + " PROFILE-OFF")
+        return {fqName: gsp.ProfileData.Stats[fqName][0] for fqName in gsp.ProfileData.Stats}
+
+    def testThreadedCountsMatchDoColon(self):
+        for source in ("G", "H", "G H G"):
+            self.assertEqual(self.callCounts(source, True), self.callCounts(source, False), source)
+
+    def testBuiltInInstructionsAreCounted(self):
+        counts = self.callCounts("G", True)
+        self.assertEqual(counts["doLoop.IMMEDIATE"], 5)
+        self.assertEqual(counts["doLitPlus.IMMEDIATE"], 5)
+        self.assertEqual(counts["EXIT.FORTH"], 1)
+        self.assertEqual(counts["G.APPSPEC"], 1)
+
+class PeepholeTests(unittest.TestCase):
+    # Each program defines T, which should compile to the superinstruction given
+    programs = [(": T 0 10 0 DO 1 + LOOP ; T", "doLitPlus"),
+                (": T DUP + ; 5 T -2 T", "doDupPlus"),
+                (": T OVER OVER ; 3 4 T", "doOverOver"),
+                (": T 5 = IF 1 ELSE 2 THEN ; 5 T 6 T", "doEquals0Branch"),
+                (": T BEGIN 1 + DUP 10 = UNTIL ; 0 T", "doEquals0Branch"),
+                # THEN lands on a fused pair
+                (": T 0 SWAP IF 1 + THEN 1 + DUP DUP + ; -1 T 0 T", "doLitPlus"),
+                (": T 0 5 0 DO I 3 = IF 100 + ELSE 1 + THEN LOOP ; T", "doEquals0Branch"),
+                (": T 10 0 DO I 2 = IF LEAVE THEN I DUP + LOOP ; T", "doDupPlus")]
+
+    def testSuperinstructionsAreUsed(self):
+        for program, superinstruction in self.programs:
+            cfb, gsp = createInterpreter(output=CaptureSink())
+            gsp.ConstantFold = False
+            gsp.evaluate(program)
+            self.assertIn(superinstruction, compiledWords(cfb, gsp, "T"), program)
+
+    def testSameResultsWithoutPeephole(self):
+        for program, superinstruction in self.programs:
+            for isThreaded in (False, True):
+                self.assertEqual(runWith(program, ConstantFold=False, DirectThreading=isThreaded),
+                                 runWith(program, ConstantFold=False, DirectThreading=isThreaded, PeepholeOptimize=False),
+                                 program)
+
+class ConstantFoldTests(unittest.TestCase):
+    programs = [": T 60 60 * 24 * ; T",
+                ": T 10 3 - 2 * 1 + ; T",
+                ": T 2 3 + SWAP 4 5 * ; 1 T",
+                ": T 1 2 < IF 5 ELSE 6 THEN ; T",
+                ": T 10 0 DO I 2 3 * + LOOP ; T",
+                # BEGIN and THEN land on literals that are folded
+                ": T BEGIN 1 2 + + DUP 9 > UNTIL ; 0 T",
+                ": T DUP 0 < IF 0 1 - * THEN 2 2 + + ; -3 T 3 T",
+                ": T 7 2 MOD 7 -2 /MOD -7 2 */ ; 3 T",
+                ": T 7 0 / ; T"]
+
+    def testSameResultsWithoutFolding(self):
+        for program in self.programs:
+            for isThreaded in (False, True):
+                self.assertEqual(runWith(program, DirectThreading=isThreaded),
+                                 runWith(program, DirectThreading=isThreaded, ConstantFold=False), program)
+
+    def testLiteralArithmeticFolds(self):
+        cfb, gsp = createInterpreter(output=CaptureSink())
+        gsp.evaluate(": T 60 60 * 24 * ; : U 2 3 + SWAP 4 5 * ;")
+        self.assertEqual(compiledWords(cfb, gsp, "T"), ["doLiteral"])
+        self.assertEqual(compiledWords(cfb, gsp, "U"), ["doLiteral", "SWAP", "doLiteral"])
+
+    def testFailingWordLeftForRunTime(self):
+        cfb, gsp = createInterpreter(output=CaptureSink())
+        gsp.evaluate(": T 7 0 / ;")
+        self.assertEqual(gsp.Output.getvalue(), "")
+        self.assertEqual(compiledWords(cfb, gsp, "T"), ["doLiteral", "doLiteral", "/"])
+        gsp.evaluate("T")
+        self.assertEqual(gsp.Output.getvalue(), "Error: Division by zero\n")
+
+class InliningTests(unittest.TestCase):
+    programs = [": SQ DUP * ; : T 3 SQ 4 SQ + ; T",
+                ": MAX2 OVER OVER < IF SWAP THEN DROP ; : T 0 5 0 DO I 7 * 10 MOD MAX2 LOOP ; T",
+                ": ABS DUP 0 < IF 0 SWAP - THEN ; INLINE : T ABS SWAP ABS + ; -3 4 T 5 -6 T",
+                ": SGN DUP 0 < IF DROP -1 ELSE 0 > IF 1 ELSE 0 THEN THEN ; INLINE "
+                ": T 3 0 DO SGN SWAP LOOP ; -4 0 9 T",
+                ": CNT 0 SWAP 0 DO 1 + LOOP ; : T 3 CNT 4 CNT ; T",
+                ": E 1 EXIT 2 ; : T E E ; T",
+                ": R DUP 0 > IF 1 - RECURSE THEN ; : T 3 R ; T"]
+
+    def testSameResultsWithoutInlining(self):
+        for program in self.programs:
+            for isThreaded in (False, True):
+                self.assertEqual(runWith(program, DirectThreading=isThreaded),
+                                 runWith(program, DirectThreading=isThreaded, Inlining=False), program)
+
+    def testWhatIsInlined(self):
+        cfb, gsp = createInterpreter(output=CaptureSink())
+        gsp.evaluate(": SQ DUP * ; : MAX2 OVER OVER < IF SWAP THEN DROP ; : ABS DUP 0 < IF 0 SWAP - THEN ; "
+                     ": E 1 EXIT 2 ; : R DUP 0 > IF 1 - RECURSE THEN ; : CALLER SQ MAX2 ABS E R ;")
+        # SQ and MAX2 are short enough, ABS is too long without INLINE, and EXIT and RECURSE can't be inlined
+        self.assertEqual(compiledWords(cfb, gsp, "CALLER"),
+                         ["DUP", "*", "doOverOver", "<", "0BRANCH", "SWAP", "DROP", "ABS", "E", "R"])
+        gsp.evaluate(": ABS DUP 0 < IF 0 SWAP - THEN ; INLINE : CALLER ABS ;")
+        self.assertEqual(compiledWords(cfb, gsp, "CALLER"), ["DUP", "doLiteral", "<", "0BRANCH", "doLiteral", "SWAP", "-"])
+
+class ReturnStackTests(unittest.TestCase):
+    def setUp(self):
+        self.cfb, self.gsp = createInterpreter(output=CaptureSink())
+        self.gsp.BFC.MaxFrameDepth = 4096
+        self.gsp.evaluate(": RUNAWAY 1 RECURSE DROP ; : NEST DUP 0 > IF 1 - RECURSE 1 + THEN ;")
+
+    def assertFramesShrunk(self):
+        for frames in (self.gsp.FrameWords, self.gsp.FramePtrs, self.gsp.FrameLocs):
+            self.assertEqual(len(frames), self.gsp.BFC.FrameStackSize)
+
+    def testOverflowShrinksFrames(self):
+        for isThreaded in (True, False):
+            self.gsp.DirectThreading = isThreaded
+            self.gsp.evaluate(": RUNAWAY 1 RECURSE DROP ;")
+            self.gsp.evaluate("RUNAWAY")
+            self.assertEqual(self.gsp.Output.takeOutput(), "Error: Return stack overflow\n")
+            self.assertFramesShrunk()
+            # The frames grow again as they're needed
+            self.assertEqual(self.gsp.evaluate("1000 NEST"), [1000])
+
+    def testOverflowInCallShrinksFrames(self):
+        with self.assertRaises(OverflowError):
+            self.gsp.call("RUNAWAY")
+        self.assertFramesShrunk()
+        self.assertEqual(self.gsp.call("NEST", 1000), [1000])
+
+class LoopTests(unittest.TestCase):
+    # Runs source threaded and through doColon, checks both leave the same stack and no loops running, and returns it
+    def runLoops(self, source):
+        results = []
+        for isThreaded in (True, False):
+            gsp = createInterpreter(output=CaptureSink())[1]
+            gsp.DirectThreading = isThreaded
+            results.append(list(gsp.evaluate(source)))
+            self.assertEqual(gsp.Output.getvalue(), "", source)
+            self.assertEqual((gsp.LoopIndexes, gsp.LoopLimits), ([], []), source)
+        self.assertEqual(results[0], results[1], source)
+        return results[0]
+
+    def testQDoWithEqualBounds(self):
+        self.assertEqual(self.runLoops(": T 5 5 ?DO 99 LOOP ; T"), [])
+        self.assertEqual(self.runLoops(": T 0 0 ?DO I LOOP 1 ; T"), [1])
+        self.assertEqual(self.runLoops(": T 3 0 ?DO I LOOP ; T"), [0, 1, 2])
+        # DO always runs its body at least once
+        self.assertEqual(self.runLoops(": T 7 7 DO I LOOP ; T"), [7])
+
+    def testLeaveInNestedLoops(self):
+        # LEAVE in the inner loop only leaves that loop
+        self.assertEqual(self.runLoops(": T 3 0 DO 3 0 DO J I * DUP 2 > IF DROP LEAVE THEN LOOP LOOP ; T"),
+                         [0, 0, 0, 0, 1, 2, 0, 2])
+        self.assertEqual(self.runLoops(": T 3 0 DO I 1 = IF LEAVE THEN 10 0 DO I 2 = IF LEAVE THEN I LOOP 100 LOOP ; T"),
+                         [0, 1, 100])
+        self.assertEqual(self.runLoops(": T 20 0 DO I 7 > IF LEAVE THEN I 3 +LOOP ; T"), [0, 3, 6])
+
+    def testUnloopThenExit(self):
+        self.assertEqual(self.runLoops(": FIND 10 0 DO I 4 = IF I UNLOOP EXIT THEN LOOP -1 ; : T FIND 5 ; T"), [4, 5])
+        self.assertEqual(self.runLoops(": FIND 10 0 DO I 40 = IF I UNLOOP EXIT THEN LOOP -1 ; : T FIND 5 ; T"), [-1, 5])
+        self.assertEqual(self.runLoops(": FIND2 3 0 DO 3 0 DO J 1 = I 2 = AND IF I J UNLOOP UNLOOP EXIT THEN LOOP LOOP "
+                                       "-1 ; : T 9 0 DO FIND2 LOOP ; T"), [2, 1] * 9)
+
+class DivisionTests(unittest.TestCase):
+    # Floored division: the quotient rounds towards minus infinity and the remainder takes the divisor's sign
+    cases = [("7 2 MOD -7 2 MOD 7 -2 MOD -7 -2 MOD", [1, 1, -1, -1]),
+             ("7 2 /MOD -7 2 /MOD 7 -2 /MOD -7 -2 /MOD", [1, 3, 1, -4, -1, -4, -1, 3]),
+             ("7 3 2 */ -7 3 2 */ 7 3 -2 */ -7 -3 2 */", [10, -11, -11, 10]),
+             ("7 3 2 */MOD -7 3 2 */MOD 7 3 -2 */MOD -7 3 -2 */MOD", [1, 10, 1, -11, -1, -11, -1, 10]),
+             ("-7 2 % 7 -2 %", [1, -1]),
+             ("-7 2 / 6 -3 /", [-3.5, -2]),
+             # The product in */ is exact, however big
+             ("100000000000 100000000000 3 */", [3333333333333333333333])]
+
+    def testSignsAndRounding(self):
+        for source, expected in self.cases:
+            self.assertEqual(runWith(source), (expected, ""), source)
+            # The same in a colon definition, with and without the literals folded
+            for isFolded in (True, False):
+                self.assertEqual(runWith(": T " + source + " ; T", ConstantFold=isFolded), (expected, ""), source)
+
+    def testDivisionByZero(self):
+        for source in ("1 0 MOD", "1 0 /MOD", "1 2 0 */", "1 2 0 */MOD", "1 0 /", "1 0 %", "1 0.0 /"):
+            self.assertEqual(runWith("99 " + source), ([], "Error: Division by zero\n"), source)
+            self.assertEqual(runWith(": T " + source + " ; 99 T"), ([], "Error: Division by zero\n"), source)
+
+@unittest.skipIf(numpy == None, "needs numpy")
+class VectorTests(unittest.TestCase):
+    # The data stack left by source, with vectors as lists
+    def vectorStack(self, source):
+        stack, output = runWith(source)
+        self.assertEqual(output, "", source)
+        return [val.tolist() if type(val) == VectorType else val for val in stack]
+
+    def testElementwiseArithmetic(self):
+        self.assertEqual(self.vectorStack("{ 1 2 3 } >VECTOR 10 +"), [[11, 12, 13]])
+        self.assertEqual(self.vectorStack("0 5 RANGE 0 5 RANGE *"), [[0, 1, 4, 9, 16]])
+        self.assertEqual(self.vectorStack("2 0 4 RANGE -"), [[2, 1, 0, -1]])
+        self.assertEqual(self.vectorStack("0 6 RANGE 2 %"), [[0, 1, 0, 1, 0, 1]])
+        self.assertEqual(self.vectorStack("{ 1.5 2.5 } >VECTOR 2 /"), [[0.75, 1.25]])
+
+    def testComparisonsAndLogicGiveFlags(self):
+        self.assertEqual(self.vectorStack("{ 1 5 3 } >VECTOR 3 >"), [[0, -1, 0]])
+        self.assertEqual(self.vectorStack("{ 1 5 3 } >VECTOR 3 = NOT"), [[-1, -1, 0]])
+        self.assertEqual(self.vectorStack("{ 1 0 3 } >VECTOR { 1 1 0 } >VECTOR AND"), [[-1, 0, 0]])
+        self.assertEqual(self.vectorStack("{ 1 0 3 } >VECTOR 0 OR"), [[-1, 0, -1]])
+
+    def testReductions(self):
+        stack = self.vectorStack("0 5 RANGE SUM 0 5 RANGE MEAN 0 5 RANGE MIN 0 5 RANGE MAX "
+                                 "{ 1 2 3 } >VECTOR { 4 5 6 } >VECTOR DOT 0 10 RANGE LENGTH")
+        self.assertEqual(stack, [10, 2.0, 0, 4, 32, 10])
+        # Results are plain Python numbers, not numpy scalars
+        self.assertEqual([type(val) for val in stack], [int, float, int, int, int, int])
+        # MIN and MAX still work on two numbers
+        self.assertEqual(self.vectorStack("3 7 MIN 3 7 MAX"), [3, 7])
+
+    def testIndexingAndSlicing(self):
+        self.assertEqual(self.vectorStack("0 10 RANGE 3 NTH 0 10 RANGE -1 NTH"), [3, 9])
+        self.assertEqual(self.vectorStack("0 10 RANGE 2 5 SLICE"), [[2, 3, 4]])
+        self.assertEqual(self.vectorStack("0 10 RANGE DUP 5 > SELECT"), [[6, 7, 8, 9]])
+
+    def testInColonDefinition(self):
+        self.assertEqual(self.vectorStack(": SUMSQ DUP * SUM ; 0 100 RANGE SUMSQ"), [328350])
+
+    def testLoadVector(self):
+        with tempfile.TemporaryDirectory() as vectorDir:
+            fileName = os.path.join(vectorDir, "vec.txt")
+            with open(fileName, "w") as f:
+                f.write("1, 2.5\n-3 $10\n")
+            self.assertEqual(self.vectorStack("LOAD-VECTOR " + fileName), [[1.0, 2.5, -3.0, 16.0]])
+
+class NumericStackTests(unittest.TestCase):
+    maxCell = 2 ** 63 - 1
+
+    def testIntegerOverflow(self):
+        for source, result in (("%d 1 +" % self.maxCell, 2 ** 63),
+                               ("-%d 10 -" % self.maxCell, -self.maxCell - 10),
+                               ("4294967296 4294967296 *", 2 ** 64),
+                               ("-%d 1 - -1 /" % self.maxCell, 2 ** 63),
+                               (": T 1 + ; %d T" % self.maxCell, 2 ** 63)):
+            stack, output = runWith("INT-STACK 5 " + source)
+            self.assertEqual(output, "Error: " + str(result) + " is too big for an integer data stack\n", source)
+            self.assertEqual(stack, [])
+
+    def testOverflowRaisedToCaller(self):
+        gsp = createInterpreter(output=CaptureSink())[1]
+        gsp.useNumericStack("q")
+        with self.assertRaises(StackOverflowError):
+            gsp.call("*", self.maxCell, 2)
+        self.assertEqual(gsp.call("*", 2 ** 31, 2 ** 31), [2 ** 62])
+
+    def testResultsThatFit(self):
+        self.assertEqual(runWith("INT-STACK %d 1 - 3 4 + 2 * -7 2 / -7 2 MOD" % self.maxCell),
+                         ([self.maxCell - 1, 14, -4, 1], ""))
+        self.assertEqual(runWith("FLOAT-STACK 1e308 10 * 7 2 /"), ([float("inf"), 3.5], ""))
+
+class OutputSinkTests(unittest.TestCase):
+    def testCaptureSink(self):
+        gsp = createInterpreter(output=CaptureSink())[1]
+        gsp.evaluate("1 . HELLO")
+        self.assertEqual(gsp.Output.getvalue(), "1\nHello world\n")
+        gsp.evaluate("2 .")
+        self.assertEqual(gsp.Output.takeOutput(), "1\nHello world\n2\n")
+        self.assertEqual(gsp.Output.takeOutput(), "")
+        gsp.evaluate("1 0 /")
+        self.assertEqual(gsp.Output.takeOutput(), "Error: Division by zero\n")
+
+    def testCallbackSinkPassesOutputOnAtTheEndOfARun(self):
+        chunks = []
+        gsp = createInterpreter(output=CallbackSink(chunks.append))[1]
+        gsp.evaluate(": T 3 0 DO I . LOOP ; T")
+        self.assertEqual(chunks, ["0\n1\n2\n"])
+        gsp.call("HELLO")
+        self.assertEqual(chunks, ["0\n1\n2\n", "Hello world\n"])
+        # Nothing is passed on for a run that prints nothing
+        gsp.evaluate("1 2 +")
+        self.assertEqual(len(chunks), 2)
+
+    def testCallbackSinkFlushesWhenFull(self):
+        chunks = []
+        gsp = createInterpreter(output=CallbackSink(chunks.append, bufferSize=10))[1]
+        gsp.evaluate(": T 10 0 DO 12345 . LOOP ; T")
+        self.assertEqual("".join(chunks), "12345\n" * 10)
+        self.assertEqual(chunks[0], "12345\n12345\n")
+        self.assertEqual(len(chunks), 5)
+
+    def testStdoutSinkWritesToStdout(self):
+        gsp = createInterpreter()[1]
+        savedStdout = sys.stdout
+        sys.stdout = io.StringIO()
+        try:
+            gsp.evaluate("HELLO 42 .")
+            printed = sys.stdout.getvalue()
+        finally:
+            sys.stdout = savedStdout
+        self.assertEqual(printed, "Hello world\n42\n")
+
+class EmbeddingTests(unittest.TestCase):
+    def setUp(self):
+        self.gsp = createInterpreter(output=CaptureSink())[1]
+        self.gsp.evaluate(": HALVE 2 / ;")
+
+    def testEvaluatePrintsErrors(self):
+        self.assertEqual(self.gsp.evaluate("1 +"), [])
+        self.assertEqual(self.gsp.Output.takeOutput(), "Error: Stack underflow\n")
+        self.assertEqual(self.gsp.evaluate("1 0 /", [7]), [])
+        self.assertEqual(self.gsp.Output.takeOutput(), "Error: Division by zero\n")
+        # The rest of the input is dropped after an error, and the next call starts afresh
+        self.assertEqual(self.gsp.evaluate("1 + 5"), [])
+        self.assertEqual(self.gsp.Output.takeOutput(), "Error: Stack underflow\n")
+        self.assertEqual(self.gsp.evaluate("DROP", [5, 6]), [5])
+        self.assertEqual(self.gsp.evaluate("DROP", [5, 6]), [5])
+
+    def testCallRaisesErrors(self):
+        with self.assertRaises(ValueError):
+            self.gsp.call("NOSUCHWORD")
+        with self.assertRaises(IndexError):
+            self.gsp.call("+", 1)
+        with self.assertRaises(ZeroDivisionError):
+            self.gsp.call("/", 1, 0)
+        self.assertEqual(self.gsp.Output.getvalue(), "")
+        self.assertEqual(self.gsp.call("HALVE", 8), [4])
+
+    def testCallManyRaisesErrors(self):
+        with self.assertRaises(ValueError):
+            self.gsp.callMany("NOSUCHWORD", [(1,)])
+        with self.assertRaises(ZeroDivisionError):
+            self.gsp.callMany("/", [(4, 2), (1, 0), (9, 3)])
+        self.assertEqual(self.gsp.callMany("HALVE", [(4,), (10,)]), [[2], [5]])
+        self.assertEqual(self.gsp.call("+", 1, 2), [3])
+
+class SlottedWordTests(unittest.TestCase):
+    def setUp(self):
+        self.cfbA, self.gspA = createInterpreter(output=CaptureSink())
+        self.cfbB, self.gspB = createInterpreter(output=CaptureSink())
+
+    def testNoInstanceDict(self):
+        cw = coreDict.find("H3", "FORTH")
+        self.assertFalse(hasattr(cw, "__dict__"))
+        with self.assertRaises(AttributeError):
+            cw.NotAField = 1
+
+    def testCopyHasEverySlotAndItsOwnFields(self):
+        cw = coreDict.find("H3", "FORTH")
+        cwCopy = cw.copy()
+        for slot in CreoleWord.__slots__:
+            self.assertEqual(getattr(cwCopy, slot), getattr(cw, slot), slot)
+        self.assertIsNot(cwCopy.ParamField, cw.ParamField)
+        self.assertIs(cwCopy.fqNameField, cw.fqNameField)
+
+    def testEmptyFieldsAreSharedUntilWritten(self):
+        self.gspA.evaluate("CREATE X CREATE Y")
+        x = self.cfbA.Dict.find("X", "APPSPEC")
+        y = self.cfbA.Dict.find("Y", "APPSPEC")
+        self.assertIs(x.ParamField, EmptyField)
+        self.assertIs(y.DataField, EmptyField)
+        self.gspA.evaluate("5 X ! 7 , { a } Y !")
+        self.assertEqual((list(x.ParamField), list(y.ParamField), list(y.DataField)), ([5], [7], ["a"]))
+        self.assertEqual((EmptyField, x.DataField), ((), ()))
+        self.assertIs(coreDict.find("NOP", "ONLY").ParamField, EmptyField)
+
+    def testInlineFlagOnCoreWord(self):
+        # H3 is the newest word in a fresh interpreter, so INLINE flags it
+        self.gspA.evaluate("INLINE")
+        self.assertTrue(self.cfbA.Dict.find("H3", "FORTH").InlineField)
+        self.assertFalse(self.cfbB.Dict.find("H3", "FORTH").InlineField)
+        self.assertFalse(coreDict.find("H3", "FORTH").InlineField)
+
+    def testNamesAreInterned(self):
+        self.gspA.evaluate(": NEWWORD 1 ;")
+        cw = self.cfbA.Dict.find("NEWWORD", "APPSPEC")
+        for field in ("NameField", "Vocabulary", "fqNameField", "CodeFieldStr", "CompileActionField"):
+            self.assertIs(getattr(cw, field), sys.intern(getattr(cw, field)), field)
+
+if __name__ == "__main__":
+    unittest.main()